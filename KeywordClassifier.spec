@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('frontend', 'frontend'), ('backend', 'backend')],
-    hiddenimports=['flask', 'flask_cors', 'pandas', 'requests', 'dotenv'],
+    hiddenimports=['flask', 'flask_cors', 'pandas', 'pyarrow', 'requests', 'dotenv'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -3,115 +3,411 @@ Flask Backend for Keyword Classifier
 Provides REST API for the frontend
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, abort, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
 import os
+import time
 import uuid
 import threading
-from pathlib import Path
-from datetime import datetime
 
 from ollama_client import OllamaClient
-from classifier import KeywordClassifier
-from csv_processor import CSVProcessor
+from health_monitor import OllamaHealthMonitor
+from retention import RetentionManager
+from job_store import JobStore
+from result_writer import open_snapshot, is_in_progress, format_of, MIMETYPES
+from metrics import REGISTRY, read_snapshots
+from log_setup import setup_logging
 from config import (
     DEFAULT_CONFIDENCE_THRESHOLD,
     DEFAULT_CATEGORIES,
     DEFAULT_CLASSIFICATION_PROMPT,
     DEFAULT_RELEVANCE_PROMPT,
     DEFAULT_CATEGORY_PROMPT,
+    DEFAULT_CONCURRENCY,
+    MAX_CONCURRENCY,
     ALLOWED_EXTENSIONS,
-    MAX_FILE_SIZE_MB
+    MAX_FILE_SIZE_MB,
+    UPLOAD_FOLDER,
+    OUTPUT_FOLDER,
+    FRONTEND_FOLDER,
+    FRONTEND_EXTENSIONS,
+    EXECUTION_MODE,
+    EXPORT_FORMATS,
+    DEFAULT_EXPORT_FORMAT,
+    DISTRIBUTED_DEFAULT,
+    SHARD_TOKEN,
+    OLLAMA_BASE_URL,
+    OLLAMA_MODEL,
+    TUNING_SAMPLE_SIZE,
+    TUNING_MIN_AGREEMENT,
+    TUNING_MAX_SAMPLE_SIZE,
+    TUNING_PUBLISH_INTERVAL,
+    PREVIEW_SAMPLE_SIZE,
+    PREVIEW_MAX_SAMPLE_SIZE
 )
 
+setup_logging()
+
 app = Flask(__name__)
 CORS(app)
+# Bodies above the upload limit are refused before they are read (+1 MB for multipart overhead)
+app.config['MAX_CONTENT_LENGTH'] = (MAX_FILE_SIZE_MB + 1) * 1024 * 1024
 
 # Configuration
-UPLOAD_FOLDER = Path('../uploads')
-OUTPUT_FOLDER = Path('../outputs')
 UPLOAD_FOLDER.mkdir(exist_ok=True)
 OUTPUT_FOLDER.mkdir(exist_ok=True)
 
 # Global state
 ollama_client = OllamaClient()
-jobs = {}  # Store job status and results
-
-
-class ProcessingJob:
-    def __init__(self, job_id, topic, keywords):
-        self.job_id = job_id
-        self.topic = topic
-        self.keywords = keywords
-        self.status = 'pending'  # pending, processing, completed, failed
-        self.progress = 0
-        self.total = len(keywords)
-        self.current_keyword = ''
-        self.current_result = None  # Latest keyword result for live console
-        self.results = []
-        self.start_time = None
-        self.processing_times = []  # Track time per keyword for estimation
-        self.error = None
-        self.accepted_file = None
-        self.rejected_file = None
-        self.statistics = {}
+ollama_health = OllamaHealthMonitor(ollama_client)  # Started on first use (see get_health_monitor)
+_ollama_clients = {}  # model -> OllamaClient for jobs that use another model (see get_ollama_client)
+_ollama_clients_lock = threading.Lock()
+jobs = {}  # Store job status and results (thread mode)
+job_store = JobStore() if EXECUTION_MODE == 'queue' else None  # Shared job state (queue mode)
+
+# The job machinery (pandas, pyarrow) is imported on first use, so the server
+# answers - and the page loads - right after startup
+_upload_store = None  # Parsed uploads, referenced by upload_id
+_upload_store_lock = threading.Lock()
+
+
+def get_upload_store():
+    """The upload store (created on first use)"""
+    global _upload_store
+    if _upload_store is not None:
+        return _upload_store
+    with _upload_store_lock:
+        if _upload_store is None:
+            from upload_store import UploadStore
+            _upload_store = UploadStore()
+    return _upload_store
+
+
+def live_job_references():
+    """Queued/running jobs with their upload and output files (kept by the retention cleanup)"""
+    if job_store is not None:
+        return [
+            {
+                'job_id': stored['job_id'],
+                'upload_id': (stored['source'] or {}).get('upload_id'),
+                'files': [(stored['progress'] or {}).get('accepted_file'), (stored['progress'] or {}).get('rejected_file')]
+            }
+            for stored in job_store.live_jobs()
+        ]
+    
+    return [
+        {
+            'job_id': job.job_id,
+            'upload_id': job.upload_id,
+            'files': [job.accepted_file, job.rejected_file, *job.topic_files.values()]
+        }
+        for job in list(jobs.values())
+        if job.status in ('pending', 'queued', 'processing')
+    ]
+
+
+def forget_jobs(job_ids):
+    """Drop finished jobs whose output files the retention cleanup deleted"""
+    for job_id in job_ids:
+        job = jobs.get(job_id)
+        if job is not None and job.status in ('completed', 'failed'):
+            jobs.pop(job_id, None)
+
+
+retention = RetentionManager(live_references=live_job_references, on_deleted=forget_jobs)  # Started on first use
+
+
+def get_retention() -> RetentionManager:
+    """The retention manager (its background cleanup starts on first use)"""
+    return retention.start()
+
+
+def get_ollama_client(model: str) -> OllamaClient:
+    """The client for a model (jobs can use a tuned model instead of OLLAMA_MODEL)"""
+    if model == ollama_client.model:
+        return ollama_client
+    with _ollama_clients_lock:
+        if model not in _ollama_clients:
+            _ollama_clients[model] = OllamaClient(OLLAMA_BASE_URL, model)
+        return _ollama_clients[model]
+
+
+def job_model(topics, requested=None) -> str:
+    """Model of a new job: the requested one, else the model tuned for its topics, else OLLAMA_MODEL"""
+    if requested:
+        return str(requested)
+    from model_tuner import ModelChoices
+    
+    try:
+        return ModelChoices().model_for(topics) or OLLAMA_MODEL
+    except Exception:
+        return OLLAMA_MODEL
+
+
+def get_health_monitor() -> OllamaHealthMonitor:
+    """The Ollama health monitor of this process (its background checks start on first use)"""
+    return ollama_health.start()
+
+
+def warm_up():
+    """Import the job machinery ahead of the first upload (call in a background thread)"""
+    get_health_monitor()
+    get_retention()
+    import processing  # noqa: F401
+    get_upload_store()
+
+
+def collect_job_metrics():
+    """Job throughput, concurrency and queue depth, computed only when /api/metrics is scraped"""
+    throughput, remaining, limits, latencies = [], 0, [], []
+    
+    if job_store is not None:
+        queued = job_store.queue_depth()
+        for stored in job_store.active_jobs():
+            progress = stored['progress'] or {}
+            avg = progress.get('avg_time_per_keyword')
+            throughput.append(({'job_id': stored['job_id']}, round(1 / avg, 4) if avg else 0))
+            remaining += progress.get('total', 0) - progress.get('progress', 0)
+            concurrency = progress.get('concurrency') or {}
+            if 'limit' in concurrency:
+                limits.append(({'job_id': stored['job_id'], 'mode': concurrency['mode']}, concurrency['limit']))
+            if concurrency.get('latency_ms') is not None:
+                latencies.append(({'job_id': stored['job_id']}, concurrency['latency_ms'] / 1000))
+    else:
+        queued = sum(1 for job in list(jobs.values()) if job.status == 'pending')
+        for job in list(jobs.values()):
+            if job.status == 'processing':
+                throughput.append(({'job_id': job.job_id}, round(job.keywords_per_second(), 4)))
+                remaining += job.total - job.progress
+                concurrency = job.concurrency_state()
+                limits.append(({'job_id': job.job_id, 'mode': concurrency['mode']}, concurrency['limit']))
+                if concurrency.get('latency_ms') is not None:
+                    latencies.append(({'job_id': job.job_id}, concurrency['latency_ms'] / 1000))
+    
+    return [
+        ('kc_job_keywords_per_second', 'gauge', 'Keyword throughput of running jobs', throughput),
+        ('kc_job_concurrency_limit', 'gauge', 'Ollama calls a running job may have in flight', limits),
+        ('kc_job_concurrency_latency_seconds', 'gauge', 'Median Ollama latency seen by the adaptive concurrency controller', latencies),
+        ('kc_job_queue_depth', 'gauge', 'Jobs waiting to be processed', [({}, queued)]),
+        ('kc_keywords_remaining', 'gauge', 'Keywords not yet classified in running jobs', [({}, remaining)])
+    ]
+
+
+REGISTRY.add_collector(collect_job_metrics)
+
+
+def collect_health_metrics():
+    """Ollama state from the health monitor's last check"""
+    health = get_health_monitor().snapshot()
+    vram = [({'model': model['name']}, model['size_vram'] or 0) for model in health['loaded_models']]
+    ram = [({'model': model['name']}, model['ram_bytes']) for model in health['loaded_models']]
+    return [
+        ('kc_ollama_up', 'gauge', '1 if the last health check reached Ollama', [({}, 1 if health['ollama_available'] else 0)]),
+        ('kc_ollama_health_check_age_seconds', 'gauge', 'Seconds since the last Ollama health check',
+         [({}, health.get('age_seconds', 0))]),
+        ('kc_ollama_model_vram_bytes', 'gauge', 'VRAM used by each loaded model', vram),
+        ('kc_ollama_model_ram_bytes', 'gauge', 'CPU RAM used by each loaded model (offloaded layers)', ram)
+    ]
+
+
+REGISTRY.add_collector(collect_health_metrics)
 
 
 def allowed_file(filename):
+    # .csv.gz counts as .csv (gzip-compressed uploads are accepted)
+    if filename.lower().endswith('.gz'):
+        filename = filename[:-3]
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+@app.route('/')
+def index():
+    """The web interface (same origin as the API, no separate frontend server)"""
+    return send_from_directory(FRONTEND_FOLDER.resolve(), 'index.html')
+
+
+@app.route('/<path:filename>')
+def frontend_file(filename):
+    """Static files of the web interface (app.js, styles.css...; see FRONTEND_EXTENSIONS)"""
+    if filename == 'index.html':
+        return index()
+    if os.path.splitext(filename)[1].lower() not in FRONTEND_EXTENSIONS:
+        abort(404)
+    return send_from_directory(FRONTEND_FOLDER.resolve(), filename)
+
+
+@app.route('/api/ready', methods=['GET'])
+def ready_check():
+    """Readiness probe: the server is up (does not contact Ollama)"""
+    return jsonify({'status': 'ready'})
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Check if Ollama is available"""
-    ollama_available = ollama_client.is_available()
-    models = ollama_client.list_models() if ollama_available else []
+    """
+    Ollama status from the last background check (never waits for Ollama)
+    
+    Includes the installed models, which models are loaded and how much of
+    them is in VRAM/RAM, and the age of the check.
+    """
+    return jsonify({'status': 'ok', **get_health_monitor().snapshot()})
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics (Ollama latency, tokens/sec, errors, cache, jobs, RSS)"""
+    return Response(REGISTRY.render(read_snapshots()), mimetype='text/plain; version=0.0.4')
+
+
+def upload_response(meta):
+    """Response of /api/upload and /api/uploads/<id>/complete (with a duration estimate)"""
+    from throughput_history import ThroughputHistory, format_duration
+    
+    get_retention()
+    message = f"Loaded {meta['rows']} keywords"
+    try:
+        estimate = ThroughputHistory().estimate(
+            ollama_client.model, ollama_client.host, meta['rows'], DEFAULT_CONCURRENCY, meta.get('title_chars_mean')
+        )
+    except Exception as e:
+        estimate = {'available': False, 'message': f"Estimate not available: {e}"}
+    if estimate['available']:
+        message += f" (about {format_duration(estimate['duration_seconds'])} with {estimate['model']})"
     
     return jsonify({
-        'status': 'ok',
-        'ollama_available': ollama_available,
-        'models': models
+        'success': True,
+        'upload_id': meta['upload_id'],
+        'filename': meta['filename'],
+        'keyword_count': meta['rows'],
+        'schema': meta['schema'],
+        'estimate': estimate,
+        'message': message
     })
 
 
+def upload_error(e):
+    """Map upload errors to HTTP status codes"""
+    from upload_store import UploadTooLarge, OffsetMismatch
+    
+    if isinstance(e, UploadTooLarge):
+        return jsonify({'error': str(e)}), 413
+    if isinstance(e, OffsetMismatch):
+        return jsonify({'error': str(e), 'offset': e.offset}), 409
+    return jsonify({'error': str(e)}), 400
+
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': f'File too large (maximum {MAX_FILE_SIZE_MB} MB)'}), 413
+
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    """Upload and validate CSV file"""
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
+    """
+    Upload and validate a CSV file (.csv or .csv.gz)
     
-    file = request.files['file']
+    Either as multipart form field "file", or as the raw request body with
+    ?filename=keywords.csv. The body is streamed to disk: the size limit and
+    the header line are checked while it arrives.
+    """
+    if 'file' in request.files:
+        file = request.files['file']
+        filename, stream, length = file.filename, file.stream, None
+    elif request.args.get('filename'):
+        filename, stream, length = request.args['filename'], request.stream, request.content_length
+    else:
+        return jsonify({'error': 'No file provided'}), 400
     
-    if file.filename == '':
+    if filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
-    if not allowed_file(file.filename):
-        return jsonify({'error': 'Invalid file type. Please upload a CSV file.'}), 400
+    if not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type. Please upload a CSV file (.csv or .csv.gz).'}), 400
     
     try:
-        # Save file
-        filename = f"{uuid.uuid4()}_{file.filename}"
-        filepath = UPLOAD_FOLDER / filename
-        file.save(filepath)
-        
-        # Validate CSV
-        processor = CSVProcessor()
-        success, message, df = processor.load_csv(str(filepath))
-        
-        if not success:
-            os.remove(filepath)
-            return jsonify({'error': message}), 400
-        
-        return jsonify({
-            'success': True,
-            'filename': filename,
-            'filepath': str(filepath),
-            'keyword_count': len(df),
-            'message': message
-        })
-        
+        # Parse ONCE into the columnar upload store; /api/process reuses it by id
+        meta = get_upload_store().save_stream(stream, filename, length)
+    except ValueError as e:
+        return upload_error(e)
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+    
+    return upload_response(meta)
+
+
+@app.route('/api/uploads', methods=['POST'])
+def start_chunked_upload():
+    """
+    Start a chunked, resumable upload
+    
+    Protocol:
+        POST   /api/uploads                      {"filename": "...", "size": bytes}
+        PUT    /api/uploads/<id>?offset=N        raw chunk (max chunk_size bytes)
+        GET    /api/uploads/<id>                 current offset (resume after an error)
+        POST   /api/uploads/<id>/complete        parse and store -> upload_id
+        DELETE /api/uploads/<id>                 cancel
+    """
+    data = request.json or {}
+    filename = data.get('filename', '')
+    size = data.get('size')
+    
+    if not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type. Please upload a CSV file (.csv or .csv.gz).'}), 400
+    if size is not None and (not isinstance(size, int) or size < 0):
+        return jsonify({'error': 'size must be a number of bytes'}), 400
+    
+    try:
+        return jsonify(get_upload_store().start_session(filename, size)), 201
+    except ValueError as e:
+        return upload_error(e)
+
+
+@app.route('/api/uploads/<session_id>', methods=['GET'])
+def get_chunked_upload(session_id):
+    """Offset of a chunked upload (the next chunk starts there)"""
+    info = get_upload_store().session_info(session_id)
+    if info is None:
+        return jsonify({'error': 'Upload session not found'}), 404
+    return jsonify(info)
+
+
+@app.route('/api/uploads/<session_id>', methods=['PUT'])
+def upload_chunk(session_id):
+    """Append one chunk (?offset=N or a "Content-Range: bytes N-M/total" header)"""
+    offset = request.args.get('offset')
+    content_range = request.headers.get('Content-Range', '')
+    if offset is None and content_range.startswith('bytes '):
+        offset = content_range[6:].split('-', 1)[0]
+    try:
+        offset = int(offset)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'offset is required'}), 400
+    
+    try:
+        new_offset = get_upload_store().append_chunk(session_id, offset, request.stream, request.content_length)
+    except ValueError as e:
+        return upload_error(e)
+    return jsonify({'session_id': session_id, 'offset': new_offset})
+
+
+@app.route('/api/uploads/<session_id>/complete', methods=['POST'])
+def complete_chunked_upload(session_id):
+    """Parse the uploaded chunks and store them like /api/upload"""
+    try:
+        meta = get_upload_store().complete_session(session_id)
+    except ValueError as e:
+        return upload_error(e)
+    return upload_response(meta)
+
+
+@app.route('/api/uploads/<session_id>', methods=['DELETE'])
+def abort_chunked_upload(session_id):
+    """Cancel a chunked upload"""
+    try:
+        get_upload_store().abort_session(session_id)
+    except ValueError as e:
+        return upload_error(e)
+    return jsonify({'success': True})
 
 
 @app.route('/api/settings', methods=['GET'])
@@ -122,7 +418,8 @@ def get_settings():
         'categories': DEFAULT_CATEGORIES,
         'classification_prompt': DEFAULT_CLASSIFICATION_PROMPT,  # NEW: Combined prompt (2x faster!)
         'relevance_prompt': DEFAULT_RELEVANCE_PROMPT,  # Legacy: for backward compatibility
-        'category_prompt': DEFAULT_CATEGORY_PROMPT  # Legacy: for backward compatibility
+        'category_prompt': DEFAULT_CATEGORY_PROMPT,  # Legacy: for backward compatibility
+        'export_formats': EXPORT_FORMATS
     })
 
 
@@ -136,153 +433,164 @@ def update_settings():
 
 @app.route('/api/process', methods=['POST'])
 def start_processing():
-    """Start keyword classification job"""
+    """Start keyword classification job ("preview": true classifies a stratified sample and projects the full run)"""
     data = request.json
     
     # Extract parameters
     topic = data.get('topic', '')
+    # Several topics can be checked in ONE pass (one AI call per keyword)
+    topics = [t.strip() for t in data.get('topics', []) if isinstance(t, str) and t.strip()]
+    if topics and not topic:
+        topic = ', '.join(topics)
     confidence_threshold = data.get('confidence_threshold', DEFAULT_CONFIDENCE_THRESHOLD)
     categories = data.get('categories', DEFAULT_CATEGORIES)
     relevance_prompt = data.get('relevance_prompt', DEFAULT_RELEVANCE_PROMPT)
     category_prompt = data.get('category_prompt', DEFAULT_CATEGORY_PROMPT)
     
+    # Scheduling: which keywords go first, and when to stop
+    order_by = data.get('order_by', 'file')  # file, views, views_per_year, expression
+    order_expression = data.get('order_expression')
+    deadline_minutes = data.get('deadline_minutes')
+    max_calls = data.get('max_calls')
+    
+    # Performance options
+    concurrency = data.get('concurrency')  # Keywords classified in parallel, or "auto" (adaptive)
+    export_timings = bool(data.get('export_timings', False))  # Per-keyword timing columns
+    profile = bool(data.get('profile', False))  # Sampling profile saved next to the outputs
+    export_format = data.get('export_format', DEFAULT_EXPORT_FORMAT)  # csv, csv.gz, jsonl, parquet
+    distributed = bool(data.get('distributed', DISTRIBUTED_DEFAULT))  # Classified by shard workers (shard_worker.py)
+    
+    # Preview: classify a stratified sample and project the full run (see preview.py)
+    preview = bool(data.get('preview', False))
+    preview_size = data.get('preview_size', PREVIEW_SAMPLE_SIZE)
+    
     if not topic:
         return jsonify({'error': 'Topic is required'}), 400
     
-    # Load keywords
-    processor = CSVProcessor()
+    if preview and (not isinstance(preview_size, int) or not 1 <= preview_size <= PREVIEW_MAX_SAMPLE_SIZE):
+        return jsonify({'error': f"preview_size must be a number between 1 and {PREVIEW_MAX_SAMPLE_SIZE}"}), 400
     
-    if 'filepath' in data:
-        # Load from uploaded file
-        success, message, df = processor.load_csv(data['filepath'])
-        if not success:
-            return jsonify({'error': message}), 400
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"export_format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    
+    settings = {
+        'topics': topics or [topic],
+        'confidence_threshold': confidence_threshold,
+        'categories': categories,
+        'relevance_prompt': relevance_prompt,
+        'category_prompt': category_prompt,
+        'order_by': order_by,
+        'order_expression': order_expression,
+        'deadline_minutes': deadline_minutes,
+        'max_calls': max_calls,
+        'concurrency': concurrency,
+        'export_timings': export_timings,
+        'profile': profile,
+        'export_format': export_format,
+        'distributed': distributed,
+        'model': job_model(topics or [topic], data.get('model')),  # Explicit, tuned for the topic, or OLLAMA_MODEL
+        'preview': preview,
+        'preview_size': preview_size if preview else None
+    }
+    
+    if 'upload_id' in data:
+        # Uploaded file (already parsed by /api/upload)
+        source = {'upload_id': data['upload_id']}
+    elif 'filepath' in data:
+        # Server file paths are not accepted from clients anymore
+        return jsonify({'error': 'filepath is not supported, upload the file and send its upload_id'}), 400
     elif 'manual_input' in data:
         # Parse manual input
-        processor.parse_manual_input(data['manual_input'])
+        source = {'manual_input': data['manual_input']}
     else:
         return jsonify({'error': 'No keywords provided'}), 400
     
-    keywords = processor.get_keywords()
+    from processing import ProcessingJob, process_keywords, load_keywords
+    from preview import PreviewStore, settings_fingerprint, source_key
+    
+    # Full runs reuse the answers of a preview with the same settings: the one
+    # given as preview_id, or else the latest preview of the same input
+    settings['preview_source'] = source_key(source)
+    reused_preview = None
+    if not preview and data.get('reuse_preview', True):
+        previews = PreviewStore()
+        fingerprint = settings_fingerprint(settings)
+        if data.get('preview_id'):
+            try:
+                stored = previews.load(data['preview_id'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if stored is None:
+                return jsonify({'error': 'Preview not found (it may have been cleaned up)'}), 404
+            if stored['fingerprint'] != fingerprint:
+                return jsonify({'error': 'The preview used other settings (model, topics, threshold, categories or prompts)'}), 400
+            reused_preview = stored['preview_id']
+        else:
+            reused_preview = previews.find(settings['preview_source'], fingerprint)
+        settings['reuse_preview'] = reused_preview
     
-    if not keywords:
-        return jsonify({'error': 'No keywords to process'}), 400
+    get_retention()
     
-    # Create job
-    job_id = str(uuid.uuid4())
-    job = ProcessingJob(job_id, topic, keywords)
-    jobs[job_id] = job
+    # Validate and open the keywords (CSV files in file order are streamed, not loaded)
+    try:
+        keywords, input_totals = load_keywords(source, settings)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Start processing in background thread
-    thread = threading.Thread(
-        target=process_keywords,
-        args=(job_id, topic, keywords, confidence_threshold, categories, relevance_prompt, category_prompt)
-    )
-    thread.daemon = True
-    thread.start()
+    if job_store is not None:
+        # Queue mode: a worker process picks the job up from the shared store
+        job_id = job_store.enqueue(topic, input_totals['rows'], settings, source)
+    else:
+        # Create job
+        job_id = str(uuid.uuid4())
+        job = ProcessingJob(job_id, topic, keywords, settings, input_totals)
+        job.upload_id = source.get('upload_id')
+        jobs[job_id] = job
+        
+        # Start processing in background thread
+        thread = threading.Thread(
+            target=process_keywords,
+            args=(job, get_ollama_client(settings['model']), OUTPUT_FOLDER),
+            kwargs={'health': get_health_monitor()}
+        )
+        thread.daemon = True
+        thread.start()
     
     return jsonify({
         'success': True,
         'job_id': job_id,
-        'total_keywords': len(keywords)
+        'total_keywords': input_totals['rows'],
+        'preview': preview,
+        'reused_preview': reused_preview
     })
 
 
-def process_keywords(job_id, topic, keywords, confidence_threshold, categories, relevance_prompt, category_prompt):
-    """Background processing of keywords"""
-    import time
-    
-    job = jobs[job_id]
-    job.status = 'processing'
-    job.start_time = time.time()
-    
-    try:
-        # Initialize classifier
-        classifier = KeywordClassifier(ollama_client)
-        classifier.set_confidence_threshold(confidence_threshold)
-        classifier.categories = categories
-        classifier.set_relevance_prompt(relevance_prompt)
-        classifier.set_category_prompt(category_prompt)
-        
-        # Initialize processor
-        processor = CSVProcessor()
-        
-        # Process each keyword
-        for idx, keyword_data in enumerate(keywords):
-            keyword_start = time.time()
-            keyword = keyword_data['title']
-            job.current_keyword = keyword
-            
-            # Classify keyword
-            result = classifier.classify_keyword(keyword, topic)
-            
-            # Add to processor results
-            processor.add_result(keyword_data, result)
-            
-            # Track timing
-            keyword_time = time.time() - keyword_start
-            job.processing_times.append(keyword_time)
-            
-            # Store latest result for live console
-            job.current_result = {
-                'keyword': keyword,
-                'accepted': result['relevance_accepted'],
-                'score': result['relevance_score'],
-                'category': result['category'],
-                'timestamp': time.time()
-            }
-            
-            # Update progress
-            job.progress = idx + 1
-        
-        # Export results
-        accepted_file, rejected_file = processor.export_results(str(OUTPUT_FOLDER))
-        job.accepted_file = accepted_file
-        job.rejected_file = rejected_file
-        
-        # Get statistics
-        job.statistics = processor.get_statistics()
-        
-        # Mark as completed
-        job.status = 'completed'
-        
-    except Exception as e:
-        job.status = 'failed'
-        job.error = str(e)
-        print(f"Error processing job {job_id}: {e}")
-
-
 @app.route('/api/progress/<job_id>', methods=['GET'])
 def get_progress(job_id):
     """Get job progress with detailed live updates"""
+    if job_store is not None:
+        stored = job_store.get(job_id)
+        if stored is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(stored['progress'])
+    
     if job_id not in jobs:
         return jsonify({'error': 'Job not found'}), 404
     
-    job = jobs[job_id]
-    
-    # Calculate time estimate
-    time_remaining = None
-    avg_time_per_keyword = None
-    if job.processing_times and job.progress > 0:
-        avg_time_per_keyword = sum(job.processing_times) / len(job.processing_times)
-        keywords_remaining = job.total - job.progress
-        time_remaining = avg_time_per_keyword * keywords_remaining
-    
-    return jsonify({
-        'status': job.status,
-        'progress': job.progress,
-        'total': job.total,
-        'current_keyword': job.current_keyword,
-        'current_result': job.current_result,  # Latest result for console
-        'percentage': round((job.progress / job.total * 100), 2) if job.total > 0 else 0,
-        'time_remaining': round(time_remaining) if time_remaining else None,
-        'avg_time_per_keyword': round(avg_time_per_keyword, 2) if avg_time_per_keyword else None
-    })
+    return jsonify(jobs[job_id].get_progress())
 
 
 @app.route('/api/results/<job_id>', methods=['GET'])
 def get_results(job_id):
     """Get job results"""
+    if job_store is not None:
+        stored = job_store.get(job_id)
+        if stored is None:
+            return jsonify({'error': 'Job not found'}), 404
+        if stored['status'] != 'completed':
+            return jsonify({'error': 'Job not completed yet'}), 400
+        return jsonify(stored['results'])
+    
     if job_id not in jobs:
         return jsonify({'error': 'Job not found'}), 404
     
@@ -291,23 +599,388 @@ def get_results(job_id):
     if job.status != 'completed':
         return jsonify({'error': 'Job not completed yet'}), 400
     
+    return jsonify(job.get_results())
+
+
+@app.route('/api/results/<job_id>/rows', methods=['GET'])
+def get_result_rows(job_id):
+    """
+    Page through the classified keywords of a job (also while it is running)
+    
+    Query parameters: offset (default 0), limit (default 100, max 1000),
+    accepted (true/false, optional filter)
+    
+    In queue mode the rows come from the file the worker writes with every
+    progress update (see result_store.ResultRowsFile).
+    """
+    from result_store import ResultRowsFile, rows_file_path
+    
+    if job_store is not None:
+        # Queue mode: the worker process copies the rows to disk as it publishes progress
+        if job_store.get(job_id) is None:
+            return jsonify({'error': 'Job not found'}), 404
+        store = ResultRowsFile(rows_file_path(job_id, OUTPUT_FOLDER))
+        if not store.exists():
+            return jsonify({'error': 'Job has not started yet'}), 400
+    else:
+        if job_id not in jobs:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        store = jobs[job_id].result_store
+        if store is None:
+            return jsonify({'error': 'Job has not started yet'}), 400
+    
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+    except ValueError:
+        return jsonify({'error': 'offset and limit must be numbers'}), 400
+    
+    accepted = request.args.get('accepted')
+    if accepted is not None:
+        accepted = accepted.lower() in ('1', 'true', 'yes')
+    
+    rows, total = store.page(offset, limit, accepted)
+    return jsonify({'rows': rows, 'offset': offset, 'limit': limit, 'total': total})
+
+
+@app.route('/api/profile/<job_id>', methods=['GET'])
+def download_profile(job_id):
+    """Download the profile of a profiled job (collapsed stacks, for flame graph tools)"""
+    if job_store is not None:
+        stored = job_store.get(job_id)
+        if stored is None:
+            return jsonify({'error': 'Job not found'}), 404
+        profile_file = (stored['results'] or {}).get('profile_file')
+    else:
+        if job_id not in jobs:
+            return jsonify({'error': 'Job not found'}), 404
+        profile_file = jobs[job_id].profile_file
+    
+    if not profile_file or not os.path.exists(profile_file):
+        return jsonify({'error': 'No profile available (start the job with "profile": true)'}), 404
+    
+    return send_file(os.path.abspath(profile_file), as_attachment=True, mimetype='text/plain')
+
+
+# Shard workers (distributed jobs): lease a shard, send heartbeats, return the results
+
+_shard_store = None
+_shard_store_lock = threading.Lock()
+
+
+def get_shard_store():
+    """The shard store (created on first use)"""
+    global _shard_store
+    if _shard_store is not None:
+        return _shard_store
+    with _shard_store_lock:
+        if _shard_store is None:
+            from shard_store import ShardStore
+            _shard_store = ShardStore()
+    return _shard_store
+
+
+def shard_auth_error():
+    """401 response if KC_SHARD_TOKEN is set and the worker sent a different token"""
+    if SHARD_TOKEN and request.headers.get('X-KC-Shard-Token') != SHARD_TOKEN:
+        return jsonify({'error': 'Invalid shard token'}), 401
+    return None
+
+
+@app.route('/api/shards', methods=['GET'])
+def shard_overview():
+    """Distributed jobs (shards per status) and the shard workers seen so far"""
+    error = shard_auth_error()
+    if error:
+        return error
+    return jsonify(get_shard_store().overview())
+
+
+@app.route('/api/shards/lease', methods=['POST'])
+def shard_lease():
+    """Lease the next shard: 200 with keywords and settings, 204 if there is nothing to do"""
+    error = shard_auth_error()
+    if error:
+        return error
+    worker_id = (request.get_json(silent=True) or {}).get('worker_id')
+    if not worker_id:
+        return jsonify({'error': 'worker_id is required'}), 400
+    
+    lease = get_shard_store().lease(str(worker_id)[:200])
+    if lease is None:
+        return '', 204
+    return jsonify(lease)
+
+
+@app.route('/api/shards/<shard_id>/heartbeat', methods=['POST'])
+def shard_heartbeat(shard_id):
+    """Extend a lease (409: the lease is gone - stop working on the shard)"""
+    from shard_store import LeaseLost
+    
+    error = shard_auth_error()
+    if error:
+        return error
+    try:
+        expires = get_shard_store().heartbeat(shard_id, (request.get_json(silent=True) or {}).get('lease_id'))
+    except LeaseLost as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'lease_expires': expires})
+
+
+@app.route('/api/shards/<shard_id>/complete', methods=['POST'])
+def shard_complete(shard_id):
+    """Results of a shard: {"lease_id": ..., "results": [{"result": {...}, "timings": {...}}, ...]}"""
+    from shard_store import LeaseLost
+    
+    error = shard_auth_error()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('results'), list):
+        return jsonify({'error': 'results must be a list'}), 400
+    store = get_shard_store()
+    try:
+        store.complete(shard_id, data.get('lease_id'), data['results'])
+    except LeaseLost as e:
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        # Unusable results: hand the shard to the next worker instead of waiting for the lease to expire
+        store.release(shard_id, data.get('lease_id'), f"Rejected results: {e}")
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'status': 'done'})
+
+
+@app.route('/api/shards/<shard_id>/release', methods=['POST'])
+def shard_release(shard_id):
+    """Give a shard back without results (worker stopping, Ollama failing)"""
+    error = shard_auth_error()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    get_shard_store().release(shard_id, data.get('lease_id'), data.get('error'))
+    return jsonify({'status': 'released'})
+
+
+# Model tuning: compare the installed models on a sample of keywords
+
+tuning_runs = None  # TuningRuns: state of the runs, shared by all API processes (see get_tuning_runs)
+_tuning_runs_lock = threading.Lock()
+
+
+def get_tuning_runs():
+    """The tuning run store, created on first use"""
+    global tuning_runs
+    if tuning_runs is None:
+        with _tuning_runs_lock:
+            if tuning_runs is None:
+                from model_tuner import TuningRuns
+                tuning_runs = TuningRuns()
+    return tuning_runs
+
+
+@app.route('/api/models', methods=['GET'])
+def list_models():
+    """Installed models, the default model and the models tuned per topic"""
+    from model_tuner import ModelChoices
+    
+    health = get_health_monitor().snapshot()
     return jsonify({
-        'status': 'completed',
-        'statistics': job.statistics,
-        'accepted_file': job.accepted_file,
-        'rejected_file': job.rejected_file
+        'default': OLLAMA_MODEL,
+        'installed': health['models'],
+        'choices': ModelChoices().all()
     })
 
 
+@app.route('/api/tune', methods=['POST'])
+def start_tuning():
+    """
+    Classify a sample with every model and recommend the fastest good-enough one
+    
+    Body: topic/topics, keywords from upload_id, manual_input or samples
+    ([{"title": ..., "relevant": true, "category": ...}] - labels are the
+    reference), and optionally models, reference_model, min_agreement (0-1),
+    sample_size, concurrency, apply (store the recommendation for the topic)
+    and the classification settings of /api/process.
+    
+    Runs in the background (202); poll GET /api/tune/<tune_id>.
+    """
+    from model_tuner import ModelTuner, ModelChoices, sample_keywords
+    from processing import load_keywords
+    
+    data = request.get_json(silent=True) or {}
+    topics = [t.strip() for t in data.get('topics', []) if isinstance(t, str) and t.strip()]
+    if not topics and str(data.get('topic', '')).strip():
+        topics = [str(data['topic']).strip()]
+    if not topics:
+        return jsonify({'error': 'Topic is required'}), 400
+    
+    try:
+        min_agreement = float(data.get('min_agreement', TUNING_MIN_AGREEMENT))
+        sample_size = int(data.get('sample_size', TUNING_SAMPLE_SIZE))
+        concurrency = int(data.get('concurrency', 1))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'min_agreement, sample_size and concurrency must be numbers'}), 400
+    if not 0 <= min_agreement <= 1:
+        return jsonify({'error': 'min_agreement must be between 0 and 1'}), 400
+    if not 1 <= sample_size <= TUNING_MAX_SAMPLE_SIZE:
+        return jsonify({'error': f"sample_size must be between 1 and {TUNING_MAX_SAMPLE_SIZE}"}), 400
+    
+    health = get_health_monitor().snapshot()
+    if health['checked'] and health['ollama_available']:
+        from ollama_client import model_installed
+        
+        missing = [m for m in (data.get('models') or []) if not model_installed(str(m), health['models'])]
+        if missing:
+            return jsonify({'error': f"Not installed in Ollama: {', '.join(map(str, missing))}"}), 400
+    
+    if isinstance(data.get('samples'), list):
+        sample = [item for item in data['samples'] if isinstance(item, dict) and item.get('title')]
+    elif 'upload_id' in data or 'manual_input' in data:
+        source = {'upload_id': data['upload_id']} if 'upload_id' in data else {'manual_input': data['manual_input']}
+        try:
+            keywords, _ = load_keywords(source, {})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        sample = sample_keywords(keywords, sample_size, int(data.get('seed', 0)))
+    else:
+        return jsonify({'error': 'No keywords provided'}), 400
+    sample = sample[:sample_size]
+    if not sample:
+        return jsonify({'error': 'No keywords to tune with'}), 400
+    
+    settings = {
+        'confidence_threshold': data.get('confidence_threshold', DEFAULT_CONFIDENCE_THRESHOLD),
+        'categories': data.get('categories', DEFAULT_CATEGORIES),
+        'relevance_prompt': data.get('relevance_prompt', DEFAULT_RELEVANCE_PROMPT),
+        'category_prompt': data.get('category_prompt', DEFAULT_CATEGORY_PROMPT)
+    }
+    tuner = ModelTuner(topics, settings, OLLAMA_BASE_URL, data.get('reference_model') or OLLAMA_MODEL,
+                       min_agreement, max(1, min(concurrency, MAX_CONCURRENCY)))
+    tune_id = str(uuid.uuid4())
+    runs = get_tuning_runs()
+    # Measurements of two tunings at once would slow each other down (checked across all API processes)
+    if not runs.start(tune_id, tuner.state()):
+        return jsonify({'error': 'A tuning run is already in progress'}), 409
+    apply = bool(data.get('apply', False))
+    
+    def run():
+        try:
+            report = tuner.run(sample, data.get('models') or None)
+        except Exception:
+            return  # The error is in tuner.state()
+        if apply and ModelChoices().apply(report):
+            tuner.mark_applied()
+    
+    def publish():
+        # Other API processes answer GET/DELETE /api/tune/<tune_id> from the stored state
+        runner = threading.Thread(target=run, name=f"tune-{tune_id[:8]}", daemon=True)
+        runner.start()
+        while runner.is_alive():
+            runner.join(TUNING_PUBLISH_INTERVAL)
+            if runs.save(tune_id, tuner.state()):
+                tuner.cancel()
+    
+    threading.Thread(target=publish, name=f"tune-state-{tune_id[:8]}", daemon=True).start()
+    return jsonify({'success': True, 'tune_id': tune_id, 'sample_size': len(sample)}), 202
+
+
+@app.route('/api/tune/<tune_id>', methods=['GET'])
+def get_tuning(tune_id):
+    """Progress of a tuning run, with the report (results per model, recommendation) when done"""
+    state = get_tuning_runs().get(tune_id)
+    if state is None:
+        return jsonify({'error': 'Tuning run not found'}), 404
+    return jsonify(state)
+
+
+@app.route('/api/tune/<tune_id>', methods=['DELETE'])
+def cancel_tuning(tune_id):
+    """Stop a tuning run (the report covers the models measured so far)"""
+    if not get_tuning_runs().request_cancel(tune_id):
+        return jsonify({'error': 'Tuning run not found'}), 404
+    return jsonify({'status': 'cancelling'})
+
+
+@app.route('/api/tune/apply', methods=['POST'])
+def apply_tuning():
+    """
+    Choose the model of a topic by hand: {"topic" or "topics", "model"}
+    (model null: forget the choice, jobs use OLLAMA_MODEL again)
+    """
+    from model_tuner import ModelChoices, topic_key
+    
+    data = request.get_json(silent=True) or {}
+    topics = [t.strip() for t in data.get('topics', []) if isinstance(t, str) and t.strip()]
+    if not topics and str(data.get('topic', '')).strip():
+        topics = [str(data['topic']).strip()]
+    if not topics:
+        return jsonify({'error': 'Topic is required'}), 400
+    
+    choices = ModelChoices()
+    if not data.get('model'):
+        return jsonify({'removed': choices.remove(topics)})
+    choices.apply({
+        'topics': topics, 'topic_key': topic_key(topics), 'reference': 'manual', 'tuned_at': time.time(),
+        'recommended': str(data['model']),
+        'results': [{'model': str(data['model']), 'agreement': None, 'keywords_per_second': None}]
+    })
+    return jsonify({'topic_key': topic_key(topics), 'model': str(data['model'])})
+
+
+@app.route('/api/storage', methods=['GET'])
+def storage_usage():
+    """
+    Disk usage of uploads and outputs, per job and per upload
+    
+    Also shows the retention limits and the report of the last cleanup run.
+    """
+    return jsonify(get_retention().usage())
+
+
+@app.route('/api/storage/cleanup', methods=['POST'])
+def storage_cleanup():
+    """Run the retention cleanup now (in the background; see last_cleanup in /api/storage)"""
+    get_retention().refresh()
+    return jsonify({'status': 'scheduled', 'last_cleanup': retention.last_run}), 202
+
+
 @app.route('/api/download/<filename>', methods=['GET'])
 def download_file(filename):
-    """Download result CSV file"""
+    """
+    Download a result file (csv, csv.gz, jsonl or parquet)
+    
+    Files are streamed with Range (resume) and ETag/If-None-Match support.
+    While a job is still writing a file, a consistent snapshot of the rows
+    flushed so far is sent instead.
+    """
     filepath = OUTPUT_FOLDER / filename
+    export_format = format_of(filename)
     
-    if not filepath.exists():
+    if export_format is None:
         return jsonify({'error': 'File not found'}), 404
+    mimetype = MIMETYPES[export_format]
+    
+    if not filepath.exists():
+        # Job still running: send the rows flushed so far (always whole rows)
+        snapshot = open_snapshot(filepath)
+        if snapshot is None:
+            if filepath.exists():  # Finalized in the meantime
+                return send_file(filepath, mimetype=mimetype, as_attachment=True, conditional=True)
+            if is_in_progress(filepath):
+                return jsonify({'error': 'File is still being written, download it when the job is finished'}), 409
+            return jsonify({'error': 'File not found'}), 404
+        
+        chunks, size = snapshot
+        response = Response(chunks, mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename={filename}',
+            'Cache-Control': 'no-cache'
+        })
+        # The file only grows, so the bytes up to `size` never change
+        response.set_etag(f"{filename}-{size}")
+        return response.make_conditional(request, accept_ranges=True, complete_length=size)
     
-    return send_file(filepath, as_attachment=True)
+    return send_file(filepath, mimetype=mimetype, as_attachment=True, conditional=True)
 
 
 if __name__ == '__main__':
@@ -316,9 +989,9 @@ if __name__ == '__main__':
     print("=" * 60)
     
     # Check Ollama status
-    if ollama_client.is_available():
+    ollama_available, models = ollama_client.status()
+    if ollama_available:
         print("✅ Ollama is running")
-        models = ollama_client.list_models()
         print(f"📦 Available models: {', '.join(models)}")
     else:
         print("⚠️  WARNING: Ollama is not running!")
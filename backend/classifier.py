@@ -4,16 +4,22 @@ Handles relevance filtering and category classification using Llama 3.1
 OPTIMIZED: Now uses SINGLE AI call instead of TWO (2x faster!)
 """
 
+import time
 from typing import Dict, List, Optional, Tuple
 from ollama_client import OllamaClient
+from log_setup import get_logger
+from metrics import PARSE_FAILURES
 from config import (
     DEFAULT_CLASSIFICATION_PROMPT,
+    DEFAULT_MULTI_TOPIC_PROMPT,
     DEFAULT_RELEVANCE_PROMPT,
     DEFAULT_CATEGORY_PROMPT,
     DEFAULT_CONFIDENCE_THRESHOLD,
     DEFAULT_CATEGORIES
 )
 
+logger = get_logger('classifier')
+
 
 class KeywordClassifier:
     """
@@ -43,6 +49,9 @@ class KeywordClassifier:
         # The COMBINED prompt template (does both relevance + category in ONE call!)
         self.classification_prompt_template = DEFAULT_CLASSIFICATION_PROMPT
         
+        # Multi-topic prompt (scores ONE keyword against SEVERAL topics in one call)
+        self.multi_topic_prompt_template = DEFAULT_MULTI_TOPIC_PROMPT
+        
         # Legacy prompts (kept for backward compatibility if user customized them)
         self.relevance_prompt_template = DEFAULT_RELEVANCE_PROMPT
         self.category_prompt_template = DEFAULT_CATEGORY_PROMPT
@@ -53,6 +62,37 @@ class KeywordClassifier:
         
         # List of categories available (how-to, comparison, etc.)
         self.categories = DEFAULT_CATEGORIES.copy()
+        
+        # Preview mode: every usable answer is kept in sample_results, so the
+        # full run can reuse it (known_results) instead of asking Ollama again
+        self.preview_mode = False
+        self.sample_results = {}  # (keyword, topics) -> result, filled in preview mode
+        self.known_results = {}  # (keyword, topics) -> result of an earlier preview
+    
+    def set_preview_mode(self, enabled: bool = True):
+        """Keep every usable answer in sample_results (see preview.py)"""
+        self.preview_mode = enabled
+    
+    def reuse_results(self, results: Dict):
+        """Answer these keywords from an earlier preview ({(keyword, topics): result}) without calling Ollama"""
+        self.known_results = dict(results)
+    
+    def _known(self, keyword: str, topics: Tuple[str, ...], timings: Optional[Dict]) -> Optional[Dict]:
+        """An answer of an earlier preview (a copy, marked as reused in timings)"""
+        if not self.known_results:
+            return None
+        result = self.known_results.get((str(keyword), topics))
+        if result is None:
+            return None
+        if timings is not None:
+            timings['reused'] = True
+        return dict(result, keyword=keyword)
+    
+    def _keep(self, keyword: str, topics: Tuple[str, ...], result: Dict) -> Dict:
+        """Remember an answer in preview mode (failed answers are not kept - the full run retries them)"""
+        if self.preview_mode and not result.get('failed'):
+            self.sample_results[(str(keyword), topics)] = result
+        return result
     
     def set_relevance_prompt(self, template: str):
         """Update the relevance filtering prompt template (legacy support)"""
@@ -80,7 +120,7 @@ class KeywordClassifier:
         """Get list of current categories"""
         return self.categories.copy()
     
-    def classify_keyword_combined(self, keyword: str, topic: str) -> Dict:
+    def classify_keyword_combined(self, keyword: str, topic: str, timings: Optional[Dict] = None) -> Dict:
         """
         OPTIMIZED: Perform BOTH relevance and category classification in ONE AI call!
         
@@ -89,6 +129,8 @@ class KeywordClassifier:
         Args:
             keyword: The search term to analyze
             topic: What the keyword should be about
+            timings: Optional dictionary that receives per-stage timings
+                (prompt_render, http, parse + Ollama's own duration fields)
             
         Returns:
             Dictionary with all classification results:
@@ -97,6 +139,12 @@ class KeywordClassifier:
             - category: category name
             - category_confidence: 0-100
         """
+        known = self._known(keyword, (topic,), timings)
+        if known is not None:
+            return known
+        
+        render_start = time.time()
+        
         # Format categories for prompt
         categories_str = "\n".join([f"- {cat}" for cat in self.categories])
         
@@ -107,8 +155,11 @@ class KeywordClassifier:
             categories=categories_str
         )
         
+        if timings is not None:
+            timings['prompt_render'] = time.time() - render_start
+        
         # Get response from Llama (ONE call does everything!)
-        result = self.ollama.generate_json(prompt)
+        result = self.ollama.generate_json(prompt, stats=timings)
         
         if result:
             try:
@@ -125,23 +176,134 @@ class KeywordClassifier:
                 # Check against threshold
                 is_accepted = relevant and relevance_confidence >= self.confidence_threshold
                 
-                return {
+                return self._keep(keyword, (topic,), {
                     'keyword': keyword,
                     'relevance_accepted': is_accepted,
                     'relevance_score': relevance_confidence,
                     'category': category if is_accepted else 'none',
                     'category_confidence': category_confidence if is_accepted else 0
-                }
+                })
             except (ValueError, TypeError) as e:
-                print(f"Error parsing combined classification result: {e}")
+                self.ollama.discard_cached(prompt)  # Unusable answer: ask again next time
+                PARSE_FAILURES.inc(stage='result')
+                logger.warning(f"Error parsing combined classification result: {e}", extra={'keyword': keyword})
+        
+        # Default to rejected if parsing fails ("failed" marks keywords without a usable answer)
+        return {
+            'keyword': keyword,
+            'relevance_accepted': False,
+            'relevance_score': 0,
+            'category': 'none',
+            'category_confidence': 0,
+            'failed': True
+        }
+    
+    def classify_keyword_multi(self, keyword: str, topics: List[str], timings: Optional[Dict] = None) -> Dict:
+        """
+        Score ONE keyword against SEVERAL topics in ONE AI call.
+        
+        Checking the same keyword list against T related topics (e.g. every
+        game of a series) used to take T full passes - now it takes one.
+        
+        Args:
+            keyword: The search term to analyze
+            topics: All topics the keyword should be checked against
+            timings: Optional dictionary that receives per-stage timings
+            
+        Returns:
+            Same fields as classify_keyword_combined (relevance fields describe
+            the BEST matching topic), plus:
+            - topic_results: {topic: {'relevance_accepted': bool, 'relevance_score': int}}
+        """
+        known = self._known(keyword, tuple(topics), timings)
+        if known is not None:
+            return known
         
-        # Default to rejected if parsing fails
+        render_start = time.time()
+        categories_str = "\n".join([f"- {cat}" for cat in self.categories])
+        topics_str = "\n".join([f"{i}. {topic}" for i, topic in enumerate(topics, start=1)])
+        
+        prompt = self.multi_topic_prompt_template.format(
+            topics=topics_str,
+            keyword=keyword,
+            categories=categories_str
+        )
+        
+        if timings is not None:
+            timings['prompt_render'] = time.time() - render_start
+        
+        result = self.ollama.generate_json(prompt, stats=timings)
+        
+        topic_results = {
+            topic: {'relevance_accepted': False, 'relevance_score': 0}
+            for topic in topics
+        }
+        
+        if result:
+            try:
+                entries = result.get('topics')
+                if not isinstance(entries, list) or not entries:
+                    raise ValueError("answer has no 'topics' list")
+                answered = set()
+                for entry in entries:
+                    # Entries normally reference topics by number, but accept names too
+                    ref = entry.get('topic')
+                    if isinstance(ref, int) and 1 <= ref <= len(topics):
+                        topic = topics[ref - 1]
+                    elif isinstance(ref, str) and ref.isdigit() and 1 <= int(ref) <= len(topics):
+                        topic = topics[int(ref) - 1]
+                    elif ref in topic_results:
+                        topic = ref
+                    else:
+                        continue
+                    
+                    relevance_confidence = int(entry.get('relevance_confidence', 0))
+                    topic_results[topic] = {
+                        'relevance_accepted': bool(entry.get('relevant', False)) and relevance_confidence >= self.confidence_threshold,
+                        'relevance_score': relevance_confidence
+                    }
+                    answered.add(topic)
+                
+                # A topic without an entry is not a "no" - the keyword has no usable answer
+                missing = [topic for topic in topics if topic not in answered]
+                if missing:
+                    raise ValueError(f"no entry for topic(s): {', '.join(missing)}")
+                
+                category = result.get('category', 'unknown')
+                category_confidence = int(result.get('category_confidence', 0))
+                
+                # Validate category
+                if category not in self.categories and category != 'none':
+                    category = 'unknown'
+                
+                is_accepted = any(r['relevance_accepted'] for r in topic_results.values())
+                
+                return self._keep(keyword, tuple(topics), {
+                    'keyword': keyword,
+                    'relevance_accepted': is_accepted,
+                    'relevance_score': max(r['relevance_score'] for r in topic_results.values()),
+                    'category': category if is_accepted else 'none',
+                    'category_confidence': category_confidence if is_accepted else 0,
+                    'topic_results': topic_results
+                })
+            except (ValueError, TypeError, AttributeError) as e:
+                self.ollama.discard_cached(prompt)
+                PARSE_FAILURES.inc(stage='result')
+                logger.warning(f"Error parsing multi-topic classification result: {e}", extra={'keyword': keyword})
+        
+        # Default to rejected for every topic if parsing fails
+        topic_results = {
+            topic: {'relevance_accepted': False, 'relevance_score': 0}
+            for topic in topics
+        }
         return {
             'keyword': keyword,
             'relevance_accepted': False,
             'relevance_score': 0,
             'category': 'none',
-            'category_confidence': 0
+            'category_confidence': 0,
+            'topic_results': topic_results,
+            'failed': True
         }
     
     def check_relevance(self, keyword: str, topic: str) -> Tuple[bool, int]:
@@ -163,7 +325,9 @@ class KeywordClassifier:
                 is_accepted = relevant and confidence >= self.confidence_threshold
                 return (is_accepted, confidence)
             except (ValueError, TypeError) as e:
-                print(f"Error parsing relevance result: {e}")
+                self.ollama.discard_cached(prompt)
+                PARSE_FAILURES.inc(stage='result')
+                logger.warning(f"Error parsing relevance result: {e}", extra={'keyword': keyword})
         
         return (False, 0)
     
@@ -191,17 +355,19 @@ class KeywordClassifier:
                 
                 return (category, confidence)
             except (ValueError, TypeError) as e:
-                print(f"Error parsing category result: {e}")
+                self.ollama.discard_cached(prompt)
+                PARSE_FAILURES.inc(stage='result')
+                logger.warning(f"Error parsing category result: {e}", extra={'keyword': keyword})
         
         return ('unknown', 0)
     
-    def classify_keyword(self, keyword: str, topic: str) -> Dict:
+    def classify_keyword(self, keyword: str, topic: str, timings: Optional[Dict] = None) -> Dict:
         """
         Main classification method - uses OPTIMIZED single-call approach!
         
         This is the method called by the backend during processing.
         """
-        return self.classify_keyword_combined(keyword, topic)
+        return self.classify_keyword_combined(keyword, topic, timings)
 
 
 # Test function
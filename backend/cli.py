@@ -0,0 +1,289 @@
+"""
+Command Line Interface
+Classifies a keyword CSV without the web server (for pipelines and cron jobs)
+
+Built on KeywordClassifier, OllamaClient, CSVProcessor and the keyword pool of
+processing.py (same pipeline as the web app) - Flask is never imported.
+Classified rows are written to stdout as soon as they are done (in input
+order), and a JSON summary is written to stderr at the end.
+
+Usage:
+    python cli.py keywords.csv --topic "Ys games"
+    cat keywords.csv | python cli.py - --topic "Ys games" --format jsonl > results.jsonl
+    python cli.py keywords.csv --topic "Ys Origin" --topic "Ys VIII" --concurrency 4 \\
+        --output-dir ../outputs --no-rows --summary summary.json
+    python cli.py keywords.csv --topic "Ys games" --output-dir ../outputs --no-rows --summary - | jq .statistics
+
+Exit codes:
+    0  every keyword was classified
+    1  unexpected error
+    2  invalid arguments or input file
+    3  Ollama is not reachable or the model is not installed
+    4  finished, but some keywords got no usable answer (counted as rejected)
+    130  interrupted (Ctrl+C) - rows classified so far are kept
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from config import (
+    OLLAMA_BASE_URL,
+    OLLAMA_MODEL,
+    DEFAULT_CONFIDENCE_THRESHOLD,
+    DEFAULT_CATEGORIES,
+    DEFAULT_CONCURRENCY,
+    MAX_CONCURRENCY,
+    EXPORT_FORMATS,
+    DEFAULT_EXPORT_FORMAT
+)
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_OLLAMA_UNAVAILABLE = 3
+EXIT_PARTIAL = 4
+EXIT_INTERRUPTED = 130
+
+
+class RowPrinter:
+    """Writes result rows to a text stream as CSV or JSON lines (flushed per row)"""
+
+    def __init__(self, stream, columns: List[str], row_format: str = 'csv'):
+        self.stream = stream
+        self.columns = columns
+        self.row_format = row_format
+        if row_format == 'csv':
+            self.writer = csv.writer(stream, lineterminator='\n')
+            self.writer.writerow(columns)
+
+    def write(self, row: Dict):
+        values = {column: _cell(row.get(column)) for column in self.columns}
+        if self.row_format == 'csv':
+            self.writer.writerow(['' if values[column] is None else values[column] for column in self.columns])
+        else:
+            self.stream.write(json.dumps(values, ensure_ascii=False) + '\n')
+        # Downstream steps of a pipeline see every row right away
+        self.stream.flush()
+
+
+def _cell(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Classify a keyword CSV (title, views, views_per_year) with Ollama, without the web server",
+        epilog="Exit codes: 0 ok, 1 error, 2 bad input, 3 Ollama/model unavailable, 4 some keywords failed, 130 interrupted"
+    )
+    parser.add_argument('input', help="CSV file, or - to read the CSV from stdin")
+    parser.add_argument('--topic', action='append', required=True,
+                        help="Topic the keywords should be about (repeat for several topics in one pass)")
+    parser.add_argument('--threshold', type=int, default=DEFAULT_CONFIDENCE_THRESHOLD,
+                        help=f"Minimum relevance confidence 0-100 (default {DEFAULT_CONFIDENCE_THRESHOLD})")
+    parser.add_argument('--categories', default=','.join(DEFAULT_CATEGORIES),
+                        help="Comma-separated categories (default: %(default)s)")
+    parser.add_argument('--concurrency', default=str(DEFAULT_CONCURRENCY),
+                        help=f"Keywords classified in parallel, 1-{MAX_CONCURRENCY}, or auto to tune it "
+                             f"from Ollama's latency while running (default {DEFAULT_CONCURRENCY})")
+    parser.add_argument('--model', default=OLLAMA_MODEL, help="Ollama model (default %(default)s)")
+    parser.add_argument('--ollama-url', default=OLLAMA_BASE_URL, help="Ollama base URL (default %(default)s)")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv', help="Format of the rows on stdout")
+    parser.add_argument('--accepted-only', action='store_true', help="Only write accepted rows to stdout")
+    parser.add_argument('--no-rows', action='store_true', help="Do not write rows to stdout (use with --output-dir)")
+    parser.add_argument('--output-dir', help="Also write accepted/rejected files and a summary here (like the web app)")
+    parser.add_argument('--export-format', choices=EXPORT_FORMATS, default=DEFAULT_EXPORT_FORMAT,
+                        help="Format of the files in --output-dir (default %(default)s)")
+    parser.add_argument('--timings', action='store_true', help="Add per-keyword timing columns")
+    parser.add_argument('--summary', default=None,
+                        help="Write the JSON summary to this file instead of stderr (- for stdout, needs --no-rows)")
+    parser.add_argument('--log-level', default='WARNING', help="Log level of the JSON logs on stderr (default WARNING)")
+
+    args = parser.parse_args(argv)
+    if not 0 <= args.threshold <= 100:
+        parser.error("--threshold must be between 0 and 100")
+    if args.concurrency.lower() == 'auto':
+        args.concurrency = 'auto'
+    elif not args.concurrency.isdigit() or not 1 <= int(args.concurrency) <= MAX_CONCURRENCY:
+        parser.error(f"--concurrency must be auto or a number between 1 and {MAX_CONCURRENCY}")
+    else:
+        args.concurrency = int(args.concurrency)
+    args.topic = [topic.strip() for topic in args.topic if topic.strip()]
+    if not args.topic:
+        parser.error("--topic must not be empty")
+    args.categories = [category.strip() for category in args.categories.split(',') if category.strip()]
+    if not args.categories:
+        parser.error("--categories must not be empty")
+    if args.summary == '-' and not args.no_rows:
+        # The summary would end up in the middle of the rows
+        parser.error("--summary - writes to stdout, so it needs --no-rows")
+    return args
+
+
+def spool_stdin() -> str:
+    """Copy the CSV from stdin to a temporary file (the reader may need a second pass)"""
+    handle = tempfile.NamedTemporaryFile(prefix='kc_stdin_', suffix='.csv', delete=False)
+    with handle:
+        shutil.copyfileobj(sys.stdin.buffer, handle)
+    return handle.name
+
+
+def write_summary(summary: Dict, target: Optional[str]):
+    text = json.dumps(summary, indent=2, default=str)
+    if target == '-':
+        sys.stdout.write(text + '\n')
+        sys.stdout.flush()
+    elif target:
+        with open(target, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        sys.stderr.write(text + '\n')
+
+
+def run(args: argparse.Namespace) -> int:
+    """Classify the input and write rows/summary; returns the exit code"""
+    from log_setup import setup_logging
+    from ollama_client import OllamaClient, model_installed
+    from classifier import KeywordClassifier
+    from csv_processor import CSVProcessor
+    from concurrency import AdaptiveConcurrencyController
+    from processing import classify_with_slot, classify_in_order
+
+    setup_logging(level=args.log_level)
+    start_time = time.time()
+    summary = {
+        'status': 'failed',
+        'input': args.input,
+        'topics': args.topic,
+        'model': args.model,
+        'threshold': args.threshold,
+        'concurrency': args.concurrency
+    }
+
+    def finish(exit_code: int, **fields) -> int:
+        summary.update(fields)
+        summary['exit_code'] = exit_code
+        summary['elapsed_seconds'] = round(time.time() - start_time, 2)
+        write_summary(summary, args.summary)
+        return exit_code
+
+    spooled = spool_stdin() if args.input == '-' else None
+    filepath = spooled or args.input
+    processor = CSVProcessor(args.topic, include_timings=args.timings)
+
+    try:
+        # A bad input file is reported as such (exit 2), even if Ollama is down too
+        if not os.path.isfile(filepath):
+            return finish(EXIT_USAGE, error=f"Input file not found: {filepath}")
+        is_valid, message = processor.validate_header(filepath)
+        if not is_valid:
+            return finish(EXIT_USAGE, error=message)
+
+        client = OllamaClient(args.ollama_url, args.model)
+        available, models = client.status()
+        if not available:
+            return finish(EXIT_OLLAMA_UNAVAILABLE, error=f"Ollama is not reachable at {args.ollama_url}")
+        if not model_installed(args.model, models):
+            return finish(EXIT_OLLAMA_UNAVAILABLE,
+                          error=f"Model {args.model} is not installed (ollama pull {args.model})", models=models)
+
+        classifier = KeywordClassifier(client)
+        classifier.set_confidence_threshold(args.threshold)
+        classifier.categories = args.categories
+
+        if args.output_dir:
+            summary['accepted_file'], summary['rejected_file'], summary['topic_files'] = processor.start_export(
+                args.output_dir, args.export_format
+            )
+
+        printer = None
+        if not args.no_rows:
+            printer = RowPrinter(sys.stdout, processor.output_columns(), args.format)
+
+        input_totals = {'rows': 0, 'views_total': 0.0, 'views_per_year_total': 0.0}
+        failed = 0
+        interrupted = False
+
+        # --concurrency auto: the controller decides how many calls run at once
+        controller = AdaptiveConcurrencyController() if args.concurrency == 'auto' else None
+        pool_size = controller.max_limit if controller else args.concurrency
+
+        def concurrency() -> int:
+            return controller.limit if controller else args.concurrency
+
+        def classify(index, keyword_data, dispatched_at):
+            return classify_with_slot(classifier, keyword_data['title'], args.topic, dispatched_at, controller)
+
+        def read_keywords():
+            for keyword_data in processor.iter_keywords(filepath):
+                input_totals['rows'] += 1
+                input_totals['views_total'] += float(keyword_data['views'] or 0)
+                input_totals['views_per_year_total'] += float(keyword_data['views_per_year'] or 0)
+                yield keyword_data
+
+        # Same pipeline as the web app: a small thread pool, results taken
+        # in input order so the output keeps the order of the file
+        try:
+            for keyword_data, result, timings in classify_in_order(
+                read_keywords(), classify, pool_size, lambda: concurrency() * 2
+            ):
+                if result.get('failed'):
+                    failed += 1
+
+                row = processor.add_result(keyword_data, result, timings)
+                if printer and (row['relevance_accepted'] or not args.accepted_only):
+                    printer.write(row)
+        except KeyboardInterrupt:
+            interrupted = True
+        finally:
+            processor.finish_export()
+
+        statistics = processor.get_statistics()
+        statistics['coverage'] = processor.get_view_coverage(input_totals)
+        elapsed = time.time() - start_time
+        summary.update({
+            'status': 'interrupted' if interrupted else 'completed',
+            'keywords_read': input_totals['rows'],
+            'keywords_classified': statistics['total'],
+            'keywords_failed': failed,
+            'keywords_per_second': round(statistics['total'] / elapsed, 3) if elapsed > 0 else None,
+            'concurrency_control': controller.state() if controller else {'mode': 'fixed', 'limit': args.concurrency},
+            'statistics': statistics
+        })
+        if args.output_dir:
+            summary['summary_file'] = processor.export_summary(args.output_dir, dict(summary))
+
+        if interrupted:
+            return finish(EXIT_INTERRUPTED)
+        return finish(EXIT_PARTIAL if failed else EXIT_OK)
+
+    except (ValueError, OSError) as e:
+        processor.finish_export()
+        return finish(EXIT_USAGE if isinstance(e, (ValueError, FileNotFoundError)) else EXIT_ERROR, error=str(e))
+    finally:
+        if spooled:
+            os.unlink(spooled)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    try:
+        return run(args)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        write_summary({'status': 'failed', 'exit_code': EXIT_ERROR, 'error': str(e)}, args.summary)
+        return EXIT_ERROR
+
+
+if __name__ == '__main__':
+    sys.exit(main())
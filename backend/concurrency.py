@@ -0,0 +1,177 @@
+"""
+Adaptive Concurrency
+Finds how many Ollama calls a job should run in parallel while it runs
+
+A fixed number is either too low (Ollama sits idle) or too high (requests
+queue inside Ollama, hit the 60 s timeout and get retried), and the right
+value changes with the model, the prompt length and the load on the host.
+
+The controller measures every window of calls and adjusts the limit:
+- timeouts/errors in the window   -> multiplicative decrease (limit * ADAPTIVE_BACKOFF)
+- latency grew past the tolerance -> decrease by the latency gradient
+  (best latency seen / current latency), like a TCP congestion window
+- throughput dropped after a raise -> step back by one
+- otherwise (latency flat, throughput holding or improving) -> additive increase (+1)
+"""
+
+import math
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import (
+    ADAPTIVE_CONCURRENCY_START,
+    ADAPTIVE_LATENCY_TOLERANCE,
+    ADAPTIVE_BACKOFF,
+    ADAPTIVE_WINDOW,
+    MAX_CONCURRENCY
+)
+from log_setup import get_logger
+
+logger = get_logger('concurrency')
+
+
+class AdaptiveConcurrencyController:
+    """
+    Limits the Ollama calls in flight and tunes the limit from observed latency.
+
+    Usage:
+        controller = AdaptiveConcurrencyController()
+        controller.acquire()                 # blocks while `limit` calls are in flight
+        ... call Ollama ...
+        controller.release(latency, 'ok')    # or 'error' / 'cached'
+        controller.state()                   # for progress and metrics
+    """
+
+    def __init__(self, initial: int = ADAPTIVE_CONCURRENCY_START, min_limit: int = 1,
+                 max_limit: int = MAX_CONCURRENCY, tolerance: float = ADAPTIVE_LATENCY_TOLERANCE,
+                 backoff: float = ADAPTIVE_BACKOFF, window: int = ADAPTIVE_WINDOW):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = max(min_limit, min(max_limit, initial))
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.window = window
+        self.in_flight = 0
+
+        self.baseline_latency = None  # Best window latency seen (Ollama not queueing)
+        self.latency = None  # Median latency of the last window
+        self.throughput = None  # Calls per second of the last window
+        self.increases = 0
+        self.decreases = 0
+        self.last_reason = None
+
+        self._samples = []
+        self._errors = 0
+        self._window_start = time.time()
+        self._last_change = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free slot (call before every Ollama call)"""
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency: Optional[float], outcome: str = 'ok'):
+        """
+        Free the slot and record how the call went
+
+        Args:
+            latency: Seconds spent on the HTTP call(s)
+            outcome: 'ok', 'error' (timeout, retry or no usable answer) or
+                'cached' (answered from the cache - not a measurement)
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if outcome != 'cached' and latency is not None:
+                self._samples.append(latency)
+                if outcome != 'ok':
+                    self._errors += 1
+                if len(self._samples) >= max(self.window, self.limit):
+                    self._adjust()
+            self._condition.notify_all()
+
+    def _adjust(self):
+        now = time.time()
+        elapsed = max(now - self._window_start, 1e-6)
+        latency = _median(self._samples)
+        throughput = len(self._samples) / elapsed
+        previous_throughput = self.throughput
+        limit = self.limit
+
+        if self._errors:
+            limit = int(limit * self.backoff)
+            reason = f"{self._errors} timeout(s)/error(s)"
+        else:
+            # The baseline may creep up slowly, so a slower model or longer
+            # prompts become the new normal instead of a permanent back-off
+            if self.baseline_latency is None or latency < self.baseline_latency:
+                self.baseline_latency = latency
+            else:
+                self.baseline_latency *= 1.02
+
+            gradient = self.baseline_latency / latency if latency > 0 else 1.0
+            if gradient < 1 / self.tolerance:
+                limit = math.ceil(limit * max(gradient, 0.5))
+                reason = f"latency {latency:.2f}s vs best {self.baseline_latency:.2f}s"
+            elif previous_throughput and throughput < previous_throughput * 0.9 and self._last_change > 0:
+                limit -= 1
+                reason = "throughput dropped after raising"
+            elif previous_throughput is None or throughput >= previous_throughput * 0.97:
+                limit += 1
+                reason = "throughput improving"
+            else:
+                reason = "holding"
+
+        limit = max(self.min_limit, min(self.max_limit, limit))
+        self._last_change = limit - self.limit
+        if limit > self.limit:
+            self.increases += 1
+        elif limit < self.limit:
+            self.decreases += 1
+        if limit != self.limit:
+            logger.info(f"Concurrency {self.limit} -> {limit} ({reason})")
+
+        self.limit = limit
+        self.latency = latency
+        self.throughput = throughput
+        self.last_reason = reason
+        self._samples = []
+        self._errors = 0
+        self._window_start = now
+
+    def state(self) -> Dict:
+        """Current controller state (shown in job progress and /api/metrics)"""
+        with self._condition:
+            return {
+                'mode': 'auto',
+                'limit': self.limit,
+                'in_flight': self.in_flight,
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+                'baseline_latency_ms': round(self.baseline_latency * 1000, 1) if self.baseline_latency is not None else None,
+                'calls_per_second': round(self.throughput, 3) if self.throughput is not None else None,
+                'increases': self.increases,
+                'decreases': self.decreases,
+                'last_reason': self.last_reason
+            }
+
+
+def call_outcome(result: Dict, timings: Dict) -> str:
+    """Outcome of one classification for the controller (from its result and timings)"""
+    if timings.get('cache_hit') or timings.get('reused'):
+        return 'cached'
+    if result.get('failed') or timings.get('attempts', 1) > 1:
+        return 'error'
+    return 'ok'
+
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
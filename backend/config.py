@@ -3,9 +3,23 @@ Configuration file for the Keyword Classifier
 Contains default prompts, categories, and settings
 """
 
+import os
+from pathlib import Path
+
 # Ollama Configuration
-OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_BASE_URL = os.environ.get('KC_OLLAMA_URL', "http://localhost:11434")
 OLLAMA_MODEL = "llama3.1:8b"
+# Identical prompts answered from memory instead of Ollama (0 = off, the default:
+# every keyword gets a fresh answer). Only answers that parsed are cached.
+RESPONSE_CACHE_SIZE = int(os.environ.get('KC_RESPONSE_CACHE_SIZE', '0'))
+
+# Ollama health monitor (see health_monitor.py): polled in the background,
+# /api/health answers from the last result instead of calling Ollama
+HEALTH_POLL_INTERVAL = float(os.environ.get('KC_HEALTH_INTERVAL', '10'))  # Seconds between checks while Ollama is up
+HEALTH_RETRY_INTERVAL = 2  # Seconds between checks while Ollama is down (notice it coming back quickly)
+HEALTH_TIMEOUT = 3  # Seconds one check may take (a hung Ollama counts as down)
+HEALTH_JOB_WAIT = 300  # Seconds a running job waits for Ollama to come back before it fails
+HEALTH_WAIT_HEARTBEAT = 30  # Seconds between progress writes while a job waits (it must not look stale)
 
 # Default Classification Settings
 DEFAULT_CONFIDENCE_THRESHOLD = 75  # Percentage (0-100)
@@ -37,6 +51,35 @@ Respond ONLY with a JSON object in this EXACT format (no other text):
 
 If not relevant, set category to "none" and category_confidence to 0."""
 
+# Multi-Topic Classification Prompt Template (ONE call scores a keyword against ALL topics)
+# Variables: {topics}, {keyword}, {categories}
+DEFAULT_MULTI_TOPIC_PROMPT = """You are a keyword analyzer. Analyze the keyword and determine its relevance to EACH of the numbered topics AND its category.
+
+Topics:
+{topics}
+
+Keyword: "{keyword}"
+
+Available Categories:
+{categories}
+
+Category Definitions:
+- how-to: Step-by-step instructions to showcase or demonstrate the app/topic
+- comparison: Reviews, tests, comparisons between options (e.g., "vs", "review", "best")
+- walkthrough: Going over the basics or whole app without solving a specific problem (comprehensive overviews, often longer deeper videos)
+- informational: General information seeking (e.g., "what is", "definition", "explained")
+- transactional: Intent to take action (e.g., "download", "buy", "install")
+
+Task:
+1. For EVERY topic, determine if the keyword is relevant to it (consider direct matches, synonyms, context)
+2. Classify the keyword into the most appropriate category
+3. Provide confidence scores (0-100) for all decisions
+
+Respond ONLY with a JSON object in this EXACT format (no other text), with one entry per topic number:
+{{"topics": [{{"topic": 1, "relevant": true/false, "relevance_confidence": 0-100}}], "category": "category-name", "category_confidence": 0-100}}
+
+If the keyword is not relevant to any topic, set category to "none" and category_confidence to 0."""
+
 # Legacy prompts kept for backward compatibility (not used in new system)
 DEFAULT_RELEVANCE_PROMPT = """You are a keyword relevance analyzer. Your task is to determine if a search keyword is relevant to a specific topic.
 
@@ -82,12 +125,134 @@ DEFAULT_CATEGORIES = [
 ]
 
 # Upload Settings
-MAX_FILE_SIZE_MB = 50
+MAX_FILE_SIZE_MB = int(os.environ.get('KC_MAX_FILE_SIZE_MB', '50'))  # Per upload (bytes sent, .csv or .csv.gz)
+MAX_DECOMPRESSED_MB = int(os.environ.get('KC_MAX_DECOMPRESSED_MB', '1000'))  # A .csv.gz upload unpacked
 ALLOWED_EXTENSIONS = {'csv'}
 
+# Folders (relative to the backend directory, same as before)
+UPLOAD_FOLDER = Path(os.environ.get('KC_UPLOAD_FOLDER', '../uploads'))
+OUTPUT_FOLDER = Path(os.environ.get('KC_OUTPUT_FOLDER', '../outputs'))
+DATA_FOLDER = Path(os.environ.get('KC_DATA_FOLDER', '../data'))
+FRONTEND_FOLDER = Path(os.environ.get('KC_FRONTEND_FOLDER', '../frontend'))  # Served by the backend on "/"
+# Only these files of FRONTEND_FOLDER are served (not the helper scripts and backups lying next to them)
+FRONTEND_EXTENSIONS = {'.js', '.css', '.png', '.jpg', '.svg', '.ico', '.woff', '.woff2'}
+
+# Execution Mode
+# "thread": jobs run in background threads inside the Flask process (default, used by the .exe)
+# "queue": jobs are put into a shared SQLite queue and run by separate worker processes
+#          (see worker.py / serve.py), so any API worker can answer /api/progress
+EXECUTION_MODE = os.environ.get('KC_EXECUTION_MODE', 'thread')
+JOB_DB_PATH = DATA_FOLDER / 'jobs.sqlite3'
+HISTORY_DB_PATH = DATA_FOLDER / 'history.sqlite3'  # Throughput of finished jobs (duration estimates)
+WORKER_POLL_INTERVAL = 1.0  # Seconds an idle worker waits before checking the queue again
+# Seconds without a progress write before a claimed job is requeued. Must stay above the
+# longest gap between writes: one keyword with all retries (3 x 60 s) or HEALTH_WAIT_HEARTBEAT
+WORKER_STALE_TIMEOUT = 300
+PROGRESS_PUBLISH_INTERVAL = 0.5  # Seconds between progress writes to the shared job store
+
+# Distributed mode ("distributed": true on /api/process, or every job with KC_DISTRIBUTED=1):
+# the job is split into shards of keywords that shard workers on other machines
+# lease over HTTP (see shard_store.py / shard_worker.py)
+DISTRIBUTED_DEFAULT = os.environ.get('KC_DISTRIBUTED', '0') == '1'
+SHARD_DB_PATH = DATA_FOLDER / 'shards.sqlite3'
+SHARD_SIZE = 50  # Keywords per shard
+SHARD_WINDOW = 16  # Shards of a job handed out ahead of the oldest unfinished one
+SHARD_LEASE_SECONDS = 60  # A shard goes back to the queue if its worker is silent this long
+SHARD_MAX_ATTEMPTS = 5  # Leases per shard before the job fails
+SHARD_POLL_INTERVAL = 0.2  # Seconds between checks for finished shards (coordinator)
+# Seconds without any worker leasing, extending or finishing a shard of a job before
+# the coordinator classifies the waiting shards itself (the job never hangs without workers)
+SHARD_IDLE_TIMEOUT = float(os.environ.get('KC_SHARD_IDLE_TIMEOUT', '120'))
+SHARD_TOKEN = os.environ.get('KC_SHARD_TOKEN', '')  # Shared secret shard workers send (empty = no check)
+
+# Model tuning (see model_tuner.py): a sample is classified by every installed
+# model; the fastest model that agrees with the reference often enough is
+# recommended for the topic (and used by its jobs once applied)
+TUNING_DB_PATH = DATA_FOLDER / 'tuning.sqlite3'
+TUNING_SAMPLE_SIZE = 100  # Keywords per model
+TUNING_MIN_AGREEMENT = float(os.environ.get('KC_TUNING_MIN_AGREEMENT', '0.9'))  # Share of keywords with the same decision
+TUNING_MAX_SAMPLE_SIZE = 2000
+TUNING_PUBLISH_INTERVAL = 1.0  # Seconds between state writes of a running tuning (any API process can read them)
+TUNING_STALE_TIMEOUT = 30  # A running tuning without a state write for this long died with its process
+
+# Preview ("preview": true on /api/process): classify a stratified sample first,
+# project the full run from it, and reuse its answers in the full run (see preview.py)
+PREVIEW_FOLDER = DATA_FOLDER / 'previews'
+PREVIEW_SAMPLE_SIZE = 200  # Keywords classified by a preview
+PREVIEW_MAX_SAMPLE_SIZE = 5000
+PREVIEW_DEADLINE_MINUTES = 5  # A preview stops after this long unless deadline_minutes is set
+
+# Keywords classified in parallel per job (1 = one after another, like before)
+DEFAULT_CONCURRENCY = 1
+MAX_CONCURRENCY = 32
+
+# Adaptive concurrency ("concurrency": "auto"): start low, raise the limit while
+# throughput improves, back off when Ollama's latency grows or calls time out
+ADAPTIVE_CONCURRENCY_START = 2
+ADAPTIVE_LATENCY_TOLERANCE = 1.5  # Latency up to 1.5x the best seen counts as "Ollama is not queueing"
+ADAPTIVE_BACKOFF = 0.5  # Limit multiplier after timeouts/errors
+ADAPTIVE_WINDOW = 4  # Calls measured per adjustment (at least the current limit)
+
+# Duration estimates (see throughput_history.py)
+HISTORY_RUNS = 20  # Most recent finished jobs per model/host used for an estimate
+ETA_WINDOW = 50  # Most recent keywords used for the live throughput of a running job
+ETA_PRIOR_WEIGHT = 20  # How many keywords the historical estimate counts as while a job runs
+
+# Profiling (per job with "profile": true on /api/process, or every job with KC_PROFILE_JOBS=1)
+PROFILE_ALL_JOBS = os.environ.get('KC_PROFILE_JOBS', '0') == '1'
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('KC_PROFILE_INTERVAL', '0.005'))  # Seconds between stack samples
+
+# Chunked (resumable) uploads: /api/uploads
+UPLOAD_CHUNK_SIZE_MB = 8  # Largest chunk accepted per request
+UPLOAD_SESSION_TIMEOUT = 24 * 3600  # Seconds before an unfinished upload is deleted
+UPLOAD_HEADER_PROBE_BYTES = 64 * 1024  # The header line must be within the first 64 KB
+
+# Retention of uploads and outputs (see retention.py), checked in the background
+# 0 disables a limit; files of queued/running jobs are never deleted
+RETENTION_MAX_AGE_HOURS = float(os.environ.get('KC_RETENTION_MAX_AGE_HOURS', str(7 * 24)))
+RETENTION_MAX_TOTAL_MB = float(os.environ.get('KC_RETENTION_MAX_TOTAL_MB', '5000'))  # uploads + outputs together
+RETENTION_GRACE_MINUTES = 30  # Newer files are never deleted to make room (e.g. an upload waiting for "Start")
+RETENTION_INTERVAL = 600  # Seconds between cleanup runs
+
+# Rows read per chunk when streaming large CSV files
+INGEST_CHUNK_SIZE = 50000
+
+# Seconds between flushes of the output files while a job is running
+EXPORT_FLUSH_INTERVAL = 1.0
+
+# Output file formats ("export_format" on /api/process)
+EXPORT_FORMATS = ['csv', 'csv.gz', 'jsonl', 'parquet']
+DEFAULT_EXPORT_FORMAT = 'csv'
+
 # CSV Column Names (expected in input)
 REQUIRED_COLUMNS = ['title', 'views', 'views_per_year']
 
+# Timing fields returned by Ollama's /api/generate (durations in nanoseconds)
+OLLAMA_TIMING_FIELDS = [
+    'total_duration',
+    'load_duration',
+    'prompt_eval_count',
+    'prompt_eval_duration',
+    'eval_count',
+    'eval_duration'
+]
+
+# Optional per-keyword timing columns (added to the exports with export_timings=true)
+# Local stages are measured by us, the ollama_* columns come from Ollama itself
+TIMING_COLUMNS = [
+    'queue_wait_ms',
+    'prompt_render_ms',
+    'http_ms',
+    'parse_ms',
+    'keyword_total_ms',
+    'ollama_total_duration_ms',
+    'ollama_load_duration_ms',
+    'ollama_prompt_eval_count',
+    'ollama_prompt_eval_duration_ms',
+    'ollama_eval_count',
+    'ollama_eval_duration_ms'
+]
+
 # Output CSV Column Names (removed 'reason' per user request)
 OUTPUT_COLUMNS = [
     'title',
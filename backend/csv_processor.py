@@ -3,30 +3,331 @@ CSV Processor
 Handles CSV file parsing, validation, and output generation
 """
 
+import ast
+import operator
+import re
+import threading
 import pandas as pd
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Iterator, Tuple, Optional
 from pathlib import Path
-from config import REQUIRED_COLUMNS, OUTPUT_COLUMNS
+from config import REQUIRED_COLUMNS, TIMING_COLUMNS, INGEST_CHUNK_SIZE, DEFAULT_EXPORT_FORMAT
+from result_writer import StreamingResultWriter, file_extension
+from result_store import ResultStore
+
+# Explicit dtypes for the input columns (numbers stay numbers, not Python objects)
+INPUT_DTYPES = {
+    'title': str,
+    'views': 'float64',
+    'views_per_year': 'float64'
+}
+
+
+# What an order expression may contain: the numeric columns, numbers and arithmetic
+ORDER_EXPRESSION_COLUMNS = ('views', 'views_per_year')
+ORDER_EXPRESSION_MAX_LENGTH = 200
+ORDER_EXPRESSION_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg
+}
+
+
+def evaluate_order_expression(expression: str, columns: Dict[str, pd.Series]) -> pd.Series:
+    """
+    Evaluate an order expression like "views_per_year * 2 + views / 10"
+
+    The expression is parsed with ast and evaluated node by node: only the
+    names views and views_per_year, numbers and + - * / // % ** are allowed.
+    Attribute access, calls, subscripts and everything else are rejected
+    before anything runs (no pandas/Python eval).
+
+    Raises:
+        ValueError: if the expression is too long, not valid or not allowed
+    """
+    if len(expression) > ORDER_EXPRESSION_MAX_LENGTH:
+        raise ValueError(f"Order expression is too long (maximum {ORDER_EXPRESSION_MAX_LENGTH} characters)")
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"Invalid order expression: {e.msg}")
+
+    def evaluate(node):
+        if isinstance(node, ast.Expression):
+            return evaluate(node.body)
+        if isinstance(node, ast.Name) and node.id in ORDER_EXPRESSION_COLUMNS:
+            return columns[node.id]
+        if (isinstance(node, ast.Constant) and isinstance(node.value, (int, float))
+                and not isinstance(node.value, bool)):
+            # As float: "9 ** 9 ** 9" overflows right away instead of computing a huge int
+            return float(node.value)
+        if isinstance(node, ast.BinOp) and type(node.op) in ORDER_EXPRESSION_OPERATORS:
+            return ORDER_EXPRESSION_OPERATORS[type(node.op)](evaluate(node.left), evaluate(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in ORDER_EXPRESSION_OPERATORS:
+            return ORDER_EXPRESSION_OPERATORS[type(node.op)](evaluate(node.operand))
+        raise ValueError(
+            f"Invalid order expression: {type(node).__name__} is not allowed "
+            f"(only {', '.join(ORDER_EXPRESSION_COLUMNS)}, numbers and + - * / // % **)"
+        )
+
+    try:
+        return evaluate(tree)
+    except (ArithmeticError, RecursionError) as e:
+        raise ValueError(f"Invalid order expression: {e}")
+
+
+def export_stamp() -> str:
+    """
+    Timestamp plus a short random part for output filenames
+
+    Jobs started in the same second (several users, or a queue with several
+    workers) would otherwise write to the same files.
+
+    Example: "20260111_215930_3f9a1c"
+    """
+    from datetime import datetime
+    import uuid
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+
+def topic_slugs(topics: List[str]) -> Dict[str, str]:
+    """
+    Turn topics into short, unique column/file name parts
+
+    Example: ["Ys Origin", "Ys VIII: Lacrimosa"] -> {"Ys Origin": "ys_origin", "Ys VIII: Lacrimosa": "ys_viii_lacrimosa"}
+    """
+    slugs = {}
+    used = set()
+    for topic in topics:
+        slug = re.sub(r'[^a-z0-9]+', '_', topic.lower()).strip('_')[:40] or 'topic'
+        base, n = slug, 2
+        while slug in used:
+            slug = f"{base}_{n}"
+            n += 1
+        used.add(slug)
+        slugs[topic] = slug
+    return slugs
+
+
+def whole_number(value):
+    """A numpy/float number as a plain Python value: ints for whole numbers (49, not 49.0)"""
+    value = value.item() if hasattr(value, 'item') else value
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+def iter_dataframe_keywords(df: pd.DataFrame) -> Iterator[Dict]:
+    """
+    Yield the keyword rows of a DataFrame as dictionaries, one at a time
+
+    Numbers are stored as float64; whole numbers come back as ints (1200, not 1200.0).
+    """
+    for title, views, views_per_year in zip(df['title'], df['views'], df['views_per_year']):
+        yield {
+            'title': title,
+            'views': whole_number(views),
+            'views_per_year': whole_number(views_per_year)
+        }
+
+
+def timing_columns(timings: Dict) -> Dict:
+    """
+    Convert the per-keyword timings into the optional export columns
+
+    Local stages are stored in seconds, Ollama's durations in nanoseconds;
+    both end up as milliseconds in the CSV.
+    """
+    def ms(seconds):
+        return round(seconds * 1000, 2) if seconds is not None else None
+
+    def ns_to_ms(nanoseconds):
+        return round(nanoseconds / 1e6, 2) if nanoseconds is not None else None
+
+    values = {
+        'queue_wait_ms': ms(timings.get('queue_wait')),
+        'prompt_render_ms': ms(timings.get('prompt_render')),
+        'http_ms': ms(timings.get('http')),
+        'parse_ms': ms(timings.get('parse')),
+        'keyword_total_ms': ms(timings.get('keyword_total')),
+        'ollama_total_duration_ms': ns_to_ms(timings.get('total_duration')),
+        'ollama_load_duration_ms': ns_to_ms(timings.get('load_duration')),
+        'ollama_prompt_eval_count': timings.get('prompt_eval_count'),
+        'ollama_prompt_eval_duration_ms': ns_to_ms(timings.get('prompt_eval_duration')),
+        'ollama_eval_count': timings.get('eval_count'),
+        'ollama_eval_duration_ms': ns_to_ms(timings.get('eval_duration'))
+    }
+    return {column: values[column] for column in TIMING_COLUMNS}
+
+
+def write_dataframe(df: pd.DataFrame, filepath: Path, export_format: str = DEFAULT_EXPORT_FORMAT):
+    """Write a result DataFrame in one of the export formats (see EXPORT_FORMATS)"""
+    if export_format == 'csv':
+        df.to_csv(filepath, index=False)
+    elif export_format == 'csv.gz':
+        df.to_csv(filepath, index=False, compression='gzip')
+    elif export_format == 'jsonl':
+        df.to_json(filepath, orient='records', lines=True, force_ascii=False)
+    elif export_format == 'parquet':
+        df.to_parquet(filepath, index=False, compression='zstd')
+    else:
+        file_extension(export_format)  # Raises a helpful ValueError
+
+
+# Plain numbers ("12", "-3.5", ".5", "1.5e3") and "1,234,567" thousands separators
+NUMBER_PATTERN = r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$'
+THOUSANDS_PATTERN = r'^[+-]?\d{1,3}(,\d{3})+(\.\d*)?([eE][+-]?\d+)?$'
+# Comma-separated manual input line whose numbers look like they have thousands
+# separators ("keyword,1,234,567,12"): the fields cannot be told apart
+AMBIGUOUS_LINE_PATTERN = r',\s*\d{1,3}(,\d{3})+(\s*,[^,]*)?$'
+
+
+def parse_numbers(values):
+    """
+    Parse an Arrow array of number strings in bulk ("1,234", "1 234", "1.5e3", "12.5" ...)
+
+    Values that are not numbers (or missing) become 0.
+
+    Returns:
+        Arrow float64 array
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    values = pc.utf8_trim_whitespace(values.fill_null(''))
+    values = pc.if_else(pc.equal(values, ''), '0', values)
+
+    # Fast path: clean numbers cast directly (one pass, no regex). Numbers
+    # with "1,234,567" thousands separators (spreadsheet pastes) lose their
+    # commas first - only the values with a comma go through the regex
+    has_comma = pc.match_substring(values, ',')
+    with_comma = values.filter(has_comma)
+    if pc.all(pc.match_substring_regex(with_comma, THOUSANDS_PATTERN)).as_py() is not False:
+        try:
+            return pc.cast(pc.replace_substring(values, ',', '') if len(with_comma) else values, pa.float64())
+        except pa.ArrowInvalid:
+            pass
+
+    # Clean only the values that are not plain numbers
+    invalid = pc.invert(pc.match_substring_regex(values, NUMBER_PATTERN))
+    cleaned = values.filter(invalid)
+    for separator in (' ', '_', "'"):
+        cleaned = pc.replace_substring(cleaned, separator, '')
+    # "1,234,567" style thousands separators (not decimal commas like "1,5")
+    cleaned = pc.if_else(pc.match_substring_regex(cleaned, THOUSANDS_PATTERN),
+                         pc.replace_substring(cleaned, ',', ''), cleaned)
+    cleaned = pc.if_else(pc.match_substring_regex(cleaned, NUMBER_PATTERN), cleaned, '0')
+    return pc.cast(pc.replace_with_mask(values, invalid, cleaned), pa.float64())
+
+
+def _number(value) -> float:
+    # Views can be missing (NaN/None) or, in odd files, not numeric at all
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if value != value else value
+
+
+class RunningStatistics:
+    """
+    Result statistics updated with every added result (O(1) per result)
+
+    Nothing is rebuilt at the end of the job, and the same numbers can be
+    shown live in /api/progress while the job is still running.
+    """
+
+    SCORE_BUCKETS = 10  # Score histogram: 0-9, 10-19, ..., 90-100
+
+    def __init__(self, topics: Optional[List[str]] = None):
+        self.total = 0
+        self.accepted = 0
+        self.category_counts = {}
+        self.topic_counts = {topic: 0 for topic in (topics or [])}
+        self.score_histogram = [0] * self.SCORE_BUCKETS
+        self.views = {'views': 0.0, 'views_per_year': 0.0}
+        self.views_accepted = {'views': 0.0, 'views_per_year': 0.0}
+        self._lock = threading.Lock()  # /api/progress reads while the job adds
+
+    def add(self, result: Dict, topic_accepted: Optional[Dict[str, bool]] = None):
+        """Count one result row (see CSVProcessor.add_result)"""
+        accepted = bool(result['relevance_accepted'])
+        score = _number(result['relevance_score'])
+        bucket = min(max(int(score // 10), 0), self.SCORE_BUCKETS - 1)
+        views = _number(result['views'])
+        views_per_year = _number(result['views_per_year'])
+
+        with self._lock:
+            self.total += 1
+            self.category_counts[result['category']] = self.category_counts.get(result['category'], 0) + 1
+            self.score_histogram[bucket] += 1
+            self.views['views'] += views
+            self.views['views_per_year'] += views_per_year
+            if accepted:
+                self.accepted += 1
+                self.views_accepted['views'] += views
+                self.views_accepted['views_per_year'] += views_per_year
+            for topic, topic_is_accepted in (topic_accepted or {}).items():
+                if topic_is_accepted:
+                    self.topic_counts[topic] += 1
+
+    def as_dict(self) -> Dict:
+        """Snapshot in the same shape as get_statistics always returned (plus histograms)"""
+        with self._lock:
+            total, accepted = self.total, self.accepted
+            statistics = {
+                'total': total,
+                'accepted': accepted,
+                'rejected': total - accepted,
+                'acceptance_rate': round((accepted / total * 100), 2) if total > 0 else 0.0,
+                'category_breakdown': dict(sorted(self.category_counts.items(), key=lambda item: -item[1])),
+                'score_histogram': {
+                    f"{i * 10}-{i * 10 + 9 if i < self.SCORE_BUCKETS - 1 else 100}": count
+                    for i, count in enumerate(self.score_histogram)
+                }
+            }
+            # Share of the view volume that was accepted (big keywords count more)
+            for column in ('views', 'views_per_year'):
+                column_total = self.views[column]
+                statistics[f'{column}_accepted'] = self.views_accepted[column]
+                statistics[f'{column}_acceptance_rate'] = (
+                    round(self.views_accepted[column] / column_total * 100, 2) if column_total > 0 else 0.0
+                )
+            if self.topic_counts:
+                statistics['topic_breakdown'] = dict(self.topic_counts)
+
+        return statistics
+
+    def views_classified(self, column: str) -> float:
+        """Sum of a view column over all counted results"""
+        with self._lock:
+            return self.views[column]
 
 
 class CSVProcessor:
-    def __init__(self):
+    def __init__(self, topics: Optional[List[str]] = None, include_timings: bool = False):
         self.input_data = None
-        self.results = []
+        # Multi-topic jobs get per-topic relevance columns and accepted files
+        self.topic_slugs = topic_slugs(topics) if topics and len(topics) > 1 else {}
+        # Add the per-keyword TIMING_COLUMNS to the exports
+        self.include_timings = include_timings
+        self.results = self._new_result_store()  # Compact typed columns, not a dict per row
+        self.export_timestamp = None  # Timestamp used in the last export's filenames
+        self.writer = None  # Streaming writer (see start_export)
+        self.stats = RunningStatistics(list(self.topic_slugs))  # Updated with every result
     
-    def validate_csv(self, filepath: str) -> Tuple[bool, str]:
+    def validate_header(self, filepath: str) -> Tuple[bool, str]:
         """
-        Validate CSV file has required columns
+        Validate CSV file has required columns (reads only the header and first row)
         
         Returns:
             Tuple of (is_valid, error_message)
         """
         try:
-            df = pd.read_csv(filepath)
-            
-            # Check if file is empty
-            if df.empty:
-                return (False, "CSV file is empty")
+            df = pd.read_csv(filepath, nrows=1)
             
             # Check for required columns
             missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
@@ -34,6 +335,10 @@ class CSVProcessor:
             if missing_columns:
                 return (False, f"Missing required columns: {', '.join(missing_columns)}")
             
+            # Check if file is empty
+            if df.empty:
+                return (False, "CSV file is empty")
+            
             return (True, "Valid CSV")
             
         except pd.errors.EmptyDataError:
@@ -43,69 +348,206 @@ class CSVProcessor:
         except Exception as e:
             return (False, f"Error reading CSV: {str(e)}")
     
+    def validate_csv(self, filepath: str) -> Tuple[bool, str]:
+        """Validate CSV file has required columns (kept for backward compatibility)"""
+        return self.validate_header(filepath)
+    
     def load_csv(self, filepath: str) -> Tuple[bool, str, Optional[pd.DataFrame]]:
         """
-        Load and validate CSV file
+        Load and validate CSV file (whole file in memory - needed for value ordering)
         
         Returns:
             Tuple of (success, message, dataframe)
         """
-        is_valid, message = self.validate_csv(filepath)
+        is_valid, message = self.validate_header(filepath)
         
         if not is_valid:
             return (False, message, None)
         
         try:
-            df = pd.read_csv(filepath)
+            df = pd.concat(self.read_chunks(filepath), ignore_index=True)
             self.input_data = df
             return (True, f"Loaded {len(df)} keywords", df)
         except Exception as e:
             return (False, f"Error loading CSV: {str(e)}", None)
     
+    def read_chunks(self, filepath: str, chunksize: int = INGEST_CHUNK_SIZE):
+        """
+        Read the required columns in chunks with explicit dtypes
+        
+        Only title/views/views_per_year are parsed, and numbers are read as
+        numbers (not Python objects), so each chunk stays small. If a file has
+        non-numeric view counts, reading restarts in a lenient mode that turns
+        them into 0. The records already returned are skipped by count (not by
+        line: a quoted title may span several lines).
+        
+        Every chunk has the same dtypes: title str, views and views_per_year float64.
+        """
+        rows_done = 0
+        try:
+            reader = pd.read_csv(filepath, usecols=REQUIRED_COLUMNS, dtype=INPUT_DTYPES,
+                                 chunksize=chunksize, keep_default_na=False, na_values=[''])
+            for chunk in reader:
+                chunk = self._clean_chunk(chunk)
+                rows_done += len(chunk)
+                yield chunk
+        except ValueError:
+            reader = pd.read_csv(filepath, usecols=REQUIRED_COLUMNS, dtype=str,
+                                 chunksize=chunksize, keep_default_na=False)
+            skip = rows_done
+            for chunk in reader:
+                if skip >= len(chunk):
+                    skip -= len(chunk)
+                    continue
+                yield self._clean_chunk(chunk.iloc[skip:])
+                skip = 0
+    
+    @staticmethod
+    def _clean_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+        """Fill missing values and give every column its final dtype"""
+        chunk = chunk[REQUIRED_COLUMNS]
+        return pd.DataFrame({
+            'title': chunk['title'].fillna('').astype(str),
+            'views': pd.to_numeric(chunk['views'], errors='coerce').fillna(0.0).astype('float64'),
+            'views_per_year': pd.to_numeric(chunk['views_per_year'], errors='coerce').fillna(0.0).astype('float64')
+        })
+    
+    def scan_csv(self, filepath: str) -> Dict:
+        """
+        Count keywords and total views in one chunked pass (flat memory)
+        
+        Returns:
+            {'rows': int, 'views_total': float, 'views_per_year_total': float}
+        """
+        totals = {'rows': 0, 'views_total': 0.0, 'views_per_year_total': 0.0}
+        for chunk in self.read_chunks(filepath):
+            totals['rows'] += len(chunk)
+            totals['views_total'] += float(chunk['views'].sum())
+            totals['views_per_year_total'] += float(chunk['views_per_year'].sum())
+        return totals
+    
+    def iter_keywords(self, filepath: str, chunksize: int = INGEST_CHUNK_SIZE) -> Iterator[Dict]:
+        """
+        Stream keywords from a CSV file, one dictionary at a time
+        
+        Only one chunk is in memory at any time, so peak memory does not
+        depend on the file size.
+        """
+        for chunk in self.read_chunks(filepath, chunksize):
+            yield from iter_dataframe_keywords(chunk)
+    
     def parse_manual_input(self, text: str) -> pd.DataFrame:
         """
         Parse manually entered keywords
-        Expected format: one keyword per line, or CSV-like with title,views,views_per_year
-        """
-        lines = [line.strip() for line in text.strip().split('\n') if line.strip()]
-        
-        data = []
-        for line in lines:
-            # Check if line contains commas (CSV format)
-            if ',' in line:
-                parts = [p.strip() for p in line.split(',')]
-                if len(parts) >= 3:
-                    try:
-                        data.append({
-                            'title': parts[0],
-                            'views': int(parts[1]) if parts[1].isdigit() else 0,
-                            'views_per_year': float(parts[2]) if parts[2].replace('.', '').isdigit() else 0.0
-                        })
-                    except:
-                        # If parsing fails, treat as simple keyword
-                        data.append({
-                            'title': parts[0],
-                            'views': 0,
-                            'views_per_year': 0.0
-                        })
-                else:
-                    # Not enough parts, use first part as keyword
-                    data.append({
-                        'title': parts[0],
-                        'views': 0,
-                        'views_per_year': 0.0
-                    })
-            else:
-                # Simple keyword without metadata
-                data.append({
-                    'title': line,
-                    'views': 0,
-                    'views_per_year': 0.0
-                })
-        
-        self.input_data = pd.DataFrame(data)
+        
+        Every line is either a plain keyword or "title,views,views_per_year".
+        Tab-separated lines (pasted from a spreadsheet) work too, and a
+        "title,views,views_per_year" header line is skipped. Numbers may use
+        exponents (1.5e3) and space separators (1 234 567); anything that is
+        not a number becomes 0.
+        
+        In comma-separated lines the last two commas separate the numbers, so
+        a title may contain commas ("ys, the oath,1200,300"). Comma thousands
+        separators (1,234,567) only work in tab-separated lines: a comma line
+        like "keyword,1,234,567,12" could be split in several ways and is
+        rejected.
+        
+        All lines are parsed together with Arrow string kernels instead of a
+        Python loop, so large pastes (100k+ lines) take a fraction of a second.
+        
+        Returns:
+            DataFrame with the same columns and dtypes as an uploaded CSV
+        
+        Raises:
+            ValueError: for comma-separated lines with ambiguous numbers
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        
+        lines = pc.utf8_trim_whitespace(pa.array(text.splitlines(), pa.string()))
+        lines = lines.filter(pc.not_equal(lines, ''))
+        
+        # Header line copied together with the data
+        if len(lines) and [part.strip().lower() for part in re.split(r'[\t,]', lines[0].as_py())][:3] == REQUIRED_COLUMNS:
+            lines = lines[1:]
+        
+        # Tab-separated lines split on tabs (their numbers may contain commas),
+        # all other lines on commas: turn both into tab-separated fields
+        is_tab = pc.match_substring(lines, '\t')
+        pasted = lines
+        lines = pc.if_else(is_tab, lines, pc.replace_substring(lines, ',', '\t'))
+        
+        # Comma lines with more than two commas: only the last two separate fields
+        extra_commas = pc.and_(pc.invert(is_tab), pc.greater(pc.count_substring(pasted, ','), 2))
+        if pc.any(extra_commas).as_py():
+            comma_lines = pasted.filter(extra_commas)
+            ambiguous = comma_lines.filter(pc.match_substring_regex(comma_lines, AMBIGUOUS_LINE_PATTERN))
+            if len(ambiguous):
+                raise ValueError(
+                    f'Ambiguous line "{ambiguous[0].as_py()}" ({len(ambiguous)} such line(s)): numbers in '
+                    f'comma-separated lines cannot contain commas - write 1234567 or paste tab-separated lines'
+                )
+            lines = pc.replace_with_mask(lines, extra_commas, pc.replace_substring_regex(
+                comma_lines, r'^(.*),([^,]*),([^,]*)$', '\\1\t\\2\t\\3'
+            ))
+        
+        # Lines with fewer than 3 fields are plain keywords (no numbers);
+        # the padding makes sure every line has fields 0-2
+        has_numbers = pc.greater_equal(pc.count_substring(lines, '\t'), 2)
+        fields = pc.split_pattern(pc.binary_join_element_wise(lines, '\t\t\t', ''), '\t', max_splits=3)
+        
+        def field(index):
+            return pc.if_else(has_numbers, pc.list_element(fields, index), '')
+        
+        title = pc.utf8_trim(pc.utf8_trim_whitespace(pc.list_element(fields, 0)), '"')
+        # Same dtypes as _clean_chunk gives uploaded files
+        self.input_data = pd.DataFrame({
+            'title': title.to_numpy(zero_copy_only=False),
+            'views': parse_numbers(field(1)).to_numpy(),
+            'views_per_year': parse_numbers(field(2)).to_numpy()
+        })
         return self.input_data
     
+    def order_keywords(self, order_by: str = 'file', expression: Optional[str] = None):
+        """
+        Reorder the loaded keywords so the most valuable ones are classified first
+
+        If a job is stopped early (deadline/budget), the classified part is then
+        the most valuable part of the file instead of a random slice.
+
+        Args:
+            order_by: 'file' (keep file order), 'views', 'views_per_year'
+                or 'expression' (use `expression`)
+            expression: arithmetic over views and views_per_year, e.g.
+                "views_per_year * 2 + views / 10" (only used with order_by='expression',
+                see evaluate_order_expression)
+
+        Raises:
+            ValueError: if order_by is unknown or the expression is invalid
+        """
+        if self.input_data is None or order_by in (None, '', 'file'):
+            return
+
+        df = self.input_data
+
+        if order_by in ('views', 'views_per_year'):
+            priority = pd.to_numeric(df[order_by], errors='coerce')
+        elif order_by == 'expression':
+            if not expression:
+                raise ValueError("order_expression is required when order_by is 'expression'")
+            priority = evaluate_order_expression(str(expression), {
+                col: pd.to_numeric(df[col], errors='coerce').fillna(0) for col in ORDER_EXPRESSION_COLUMNS
+            })
+            if not isinstance(priority, pd.Series) or len(priority) != len(df):
+                raise ValueError("Order expression must produce one value per keyword")
+            priority = pd.to_numeric(priority, errors='coerce')
+        else:
+            raise ValueError(f"Unknown order_by value: {order_by}")
+
+        # Highest value first; stable sort keeps file order for ties
+        order = priority.fillna(float('-inf')).sort_values(ascending=False, kind='stable').index
+        self.input_data = df.loc[order].reset_index(drop=True)
+    
     def get_keywords(self) -> List[Dict]:
         """
         Get keywords as list of dictionaries
@@ -115,9 +557,32 @@ class CSVProcessor:
         
         return self.input_data.to_dict('records')
     
-    def add_result(self, keyword_data: Dict, classification_result: Dict):
+    def iter_loaded_keywords(self) -> Iterator[Dict]:
+        """Like get_keywords, but yields the dictionaries one by one instead of building a list"""
+        if self.input_data is None:
+            return iter(())
+        return iter_dataframe_keywords(self.input_data)
+    
+    def get_input_totals(self) -> Dict:
+        """Keyword count and total views of the loaded data (see scan_csv)"""
+        if self.input_data is None:
+            return {'rows': 0, 'views_total': 0.0, 'views_per_year_total': 0.0}
+        df = self.input_data
+        return {
+            'rows': len(df),
+            'views_total': float(pd.to_numeric(df['views'], errors='coerce').fillna(0).sum()),
+            'views_per_year_total': float(pd.to_numeric(df['views_per_year'], errors='coerce').fillna(0).sum())
+        }
+    
+    def add_result(self, keyword_data: Dict, classification_result: Dict, timings: Optional[Dict] = None):
         """
         Add a classification result (optimized - no reason field needed!)
+        
+        If the processor was created with include_timings=True, the
+        per-keyword timings are added as extra columns.
+        
+        Returns:
+            The result row (same columns as the exported files)
         """
         result = {
             'title': keyword_data['title'],
@@ -128,19 +593,94 @@ class CSVProcessor:
             'category': classification_result['category'],
             'category_confidence': classification_result['category_confidence']
         }
+        
+        # Multi-topic jobs: one score + accepted column per topic
+        for topic, slug in self.topic_slugs.items():
+            topic_result = classification_result.get('topic_results', {}).get(topic, {})
+            result[f'relevance_score_{slug}'] = topic_result.get('relevance_score', 0)
+            result[f'relevance_accepted_{slug}'] = topic_result.get('relevance_accepted', False)
+        
+        if self.include_timings:
+            result.update(timing_columns(timings or {}))
+        
+        self.stats.add(result, {
+            topic: result[f'relevance_accepted_{slug}'] for topic, slug in self.topic_slugs.items()
+        })
+        
         self.results.append(result)
+        
+        # Streaming export: append the row to its output files right away
+        if self.writer is not None:
+            self.writer.write('accepted' if result['relevance_accepted'] else 'rejected', result)
+            for topic, slug in self.topic_slugs.items():
+                if result[f'relevance_accepted_{slug}']:
+                    self.writer.write(f'topic:{topic}', result)
+        
+        return result
+    
+    def _new_result_store(self) -> ResultStore:
+        return ResultStore(list(self.topic_slugs.values()), TIMING_COLUMNS if self.include_timings else [])
+    
+    def output_columns(self) -> List[str]:
+        """Columns of the exported CSV files (same order as add_result)"""
+        return list(self.results.columns)
     
-    def export_results(self, output_dir: str) -> Tuple[str, str]:
+    def start_export(self, output_dir: str, export_format: str = DEFAULT_EXPORT_FORMAT) -> Tuple[str, str, Dict[str, str]]:
         """
-        Export results to two CSV files: accepted and rejected
+        Start streaming results to the output files while the job runs
+        
+        From now on add_result appends every row to the accepted/rejected
+        file (and the per-topic files) instead of waiting for the end of
+        the job. Call finish_export when the job is done.
+        
+        Args:
+            output_dir: Folder of the output files
+            export_format: csv, csv.gz, jsonl or parquet
+        
+        Returns:
+            Tuple of (accepted_filepath, rejected_filepath, {topic: accepted_filepath})
+        """
+        output_path = Path(output_dir)
+        timestamp = export_stamp()
+        self.export_timestamp = timestamp
+        extension = file_extension(export_format)
+        
+        files = {
+            'accepted': output_path / f"accepted_keywords_{timestamp}{extension}",
+            'rejected': output_path / f"rejected_keywords_{timestamp}{extension}"
+        }
+        for topic, slug in self.topic_slugs.items():
+            files[f'topic:{topic}'] = output_path / f"accepted_keywords_{slug}_{timestamp}{extension}"
+        
+        self.writer = StreamingResultWriter(files, self.output_columns(), export_format)
+        self.writer.open()
+        
+        topic_files = {topic: str(files[f'topic:{topic}']) for topic in self.topic_slugs}
+        return (str(files['accepted']), str(files['rejected']), topic_files)
+    
+    def finish_export(self):
+        """Flush and finalize the streamed output files (safe to call twice)"""
+        if self.writer is not None:
+            self.writer.finalize()
+            self.writer = None
+    
+    def export_results(self, output_dir: str, export_format: str = DEFAULT_EXPORT_FORMAT) -> Tuple[str, str]:
+        """
+        Export results to two files: accepted and rejected
+        
+        Args:
+            output_dir: Folder of the output files
+            export_format: csv, csv.gz (gzip), jsonl (one JSON object per line)
+                or parquet (zstd-compressed, columnar)
         
         Returns:
             Tuple of (accepted_filepath, rejected_filepath)
+        
         """
         if not self.results:
             raise ValueError("No results to export")
         
-        df = pd.DataFrame(self.results)
+        df = self.results.to_pandas()
         
         # Split into accepted and rejected
         accepted_df = df[df['relevance_accepted'] == True]
@@ -151,47 +691,101 @@ class CSVProcessor:
         output_path.mkdir(parents=True, exist_ok=True)
         
         # Generate unique filenames with timestamp
-        from datetime import datetime
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = export_stamp()
+        self.export_timestamp = timestamp
         
-        accepted_file = output_path / f"accepted_keywords_{timestamp}.csv"
-        rejected_file = output_path / f"rejected_keywords_{timestamp}.csv"
+        extension = file_extension(export_format)
+        accepted_file = output_path / f"accepted_keywords_{timestamp}{extension}"
+        rejected_file = output_path / f"rejected_keywords_{timestamp}{extension}"
         
-        # Export to CSV
-        accepted_df.to_csv(accepted_file, index=False)
-        rejected_df.to_csv(rejected_file, index=False)
+        # Export in the requested format
+        write_dataframe(accepted_df, accepted_file, export_format)
+        write_dataframe(rejected_df, rejected_file, export_format)
         
         return (str(accepted_file), str(rejected_file))
     
-    def get_statistics(self) -> Dict:
+    def export_topic_results(self, output_dir: str, export_format: str = DEFAULT_EXPORT_FORMAT) -> Dict[str, str]:
         """
-        Get statistics about the classification results
+        Export one accepted-keywords file per topic (multi-topic jobs only)
+        
+        Call after export_results so all files share the same timestamp.
+        
+        Returns:
+            Dictionary of topic -> accepted_filepath
         """
-        if not self.results:
-            return {
-                'total': 0,
-                'accepted': 0,
-                'rejected': 0,
-                'acceptance_rate': 0.0
-            }
+        if not self.topic_slugs:
+            return {}
+        
+        df = self.results.to_pandas()
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+        timestamp = self.export_timestamp or export_stamp()
         
-        df = pd.DataFrame(self.results)
-        total = len(df)
-        accepted = len(df[df['relevance_accepted'] == True])
-        rejected = total - accepted
+        topic_files = {}
+        for topic, slug in self.topic_slugs.items():
+            topic_df = df[df[f'relevance_accepted_{slug}'] == True]
+            topic_file = output_path / f"accepted_keywords_{slug}_{timestamp}{file_extension(export_format)}"
+            write_dataframe(topic_df, topic_file, export_format)
+            topic_files[topic] = str(topic_file)
         
-        return {
-            'total': total,
-            'accepted': accepted,
-            'rejected': rejected,
-            'acceptance_rate': round((accepted / total * 100), 2) if total > 0 else 0.0,
-            'category_breakdown': df['category'].value_counts().to_dict()
+        return topic_files
+    
+    def get_statistics(self) -> Dict:
+        """
+        Get statistics about the classification results
+        
+        Kept up to date by add_result, so this is cheap at any time.
+        """
+        return self.stats.as_dict()
+    
+    def get_view_coverage(self, input_totals: Dict) -> Dict:
+        """
+        How much of the total view volume was classified
+
+        Useful when a job stops early (deadline/budget mode): with value-ordered
+        processing a small share of the keywords can cover most of the views.
+
+        Args:
+            input_totals: Totals of every keyword of the job, classified or not
+                (see scan_csv / get_input_totals)
+        """
+        coverage = {
+            'keywords_total': input_totals.get('rows', 0),
+            'keywords_classified': self.stats.total
         }
+        for column in ('views', 'views_per_year'):
+            column_total = float(input_totals.get(f'{column}_total', 0.0))
+            column_classified = self.stats.views_classified(column)
+            coverage[f'{column}_total'] = column_total
+            coverage[f'{column}_classified'] = column_classified
+            coverage[f'{column}_coverage'] = round(column_classified / column_total * 100, 2) if column_total > 0 else 0.0
+
+        return coverage
+    
+    def export_summary(self, output_dir: str, summary: Dict) -> str:
+        """
+        Write a JSON summary (statistics, coverage, stop reason) next to the CSV exports
+
+        Returns:
+            Path of the summary file
+        """
+        import json
+
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+
+        # Same timestamp as the CSV files, so the three files belong together
+        timestamp = self.export_timestamp or export_stamp()
+        summary_file = output_path / f"summary_{timestamp}.json"
+        summary_file.write_text(json.dumps(summary, indent=2, default=str), encoding='utf-8')
+
+        return str(summary_file)
     
     def reset(self):
         """Clear all data and results"""
         self.input_data = None
-        self.results = []
+        self.results = self._new_result_store()
+        self.stats = RunningStatistics(list(self.topic_slugs))
 
 
 # Test function
@@ -0,0 +1,231 @@
+"""
+Fake Ollama Server
+A stand-in for Ollama for load tests and local experiments (no GPU, no model)
+
+Answers /api/tags, /api/ps and /api/generate like Ollama does. Classification
+answers are deterministic (the same keyword and topic always get the same
+score), so runs can be compared. Capacity is simulated with a fixed number of
+"GPU slots": with more requests in flight than slots, requests queue and
+their latency grows - like a real Ollama server under load.
+
+Usage:
+    python fake_ollama.py --port 11434 --latency 0.2 --parallel 2
+
+    # Several models: a small fast one that disagrees on 20% of the keywords
+    python fake_ollama.py --model llama3.1:8b --model-profile qwen2.5:1.5b=0.02,0.2
+
+    # or from Python (port 0 = any free port)
+    server = FakeOllama(latency=0.02, parallel=4).start()
+    client = OllamaClient(server.url)
+    ...
+    server.stop()
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_MODELS = ('llama3.1:8b',)
+
+
+def _score(*parts: str) -> int:
+    """Deterministic 0-99 score of some text"""
+    digest = hashlib.md5('|'.join(parts).lower().encode('utf-8')).digest()
+    return digest[0] * 100 // 256
+
+
+def _between(text: str, start: str, end: str) -> str:
+    return text.split(start, 1)[-1].split(end, 1)[0] if start in text else ''
+
+
+def classification_answer(prompt: str, model: str = '', noise: float = 0.0) -> Dict:
+    """
+    The JSON a model would answer to one of our classification prompts
+
+    With noise > 0 that share of keywords gets a different answer (another
+    score and category) - like a smaller model that disagrees with the big one.
+    """
+    keyword = _between(prompt, 'Keyword: "', '"')
+    if noise and _score(keyword, model, 'noise') < noise * 100:
+        keyword = f"{keyword} ({model})"
+    categories = re.findall(r'^- (\S+)$', _between(prompt, 'Available Categories:', '\n\n'), re.M)
+    category = categories[_score(keyword) % len(categories)] if categories else 'unknown'
+
+    topics = re.findall(r'^(\d+)\. (.+)$', _between(prompt, 'Topics:', 'Keyword:'), re.M)
+    if topics:
+        # Multi-topic prompt: one entry per numbered topic
+        entries = []
+        for number, topic in topics:
+            score = _score(keyword, topic)
+            entries.append({'topic': int(number), 'relevant': score >= 50, 'relevance_confidence': score})
+        return {'topics': entries, 'category': category, 'category_confidence': 50 + _score(keyword, 'c') // 2}
+
+    topic = _between(prompt, 'Topic: ', '\n')
+    score = _score(keyword, topic)
+    relevant = score >= 50
+    return {
+        'relevant': relevant,
+        'relevance_confidence': score,
+        'category': category if relevant else 'none',
+        'category_confidence': 50 + _score(keyword, 'c') // 2 if relevant else 0
+    }
+
+
+class FakeOllama:
+    """
+    In-process fake Ollama server.
+
+    Args:
+        host, port: Where to listen (port 0 picks a free port)
+        latency: Seconds one request occupies a slot (plus up to 20% jitter)
+        parallel: Requests processed at the same time; more requests queue
+        error_rate: Share of generate requests answered with HTTP 500
+        models: Model names reported by /api/tags
+        profiles: Optional {model: (latency, noise)} for models that are faster or
+            slower than `latency` and answer differently for a share of keywords
+            (added to `models`)
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.05, parallel: int = 4,
+                 error_rate: float = 0.0, models: Optional[List[str]] = None,
+                 profiles: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.latency = latency
+        self.parallel = parallel
+        self.error_rate = error_rate
+        self.profiles = dict(profiles or {})
+        self.models = list(models or ([] if self.profiles else DEFAULT_MODELS))
+        self.models += [name for name in self.profiles if name not in self.models]
+        self.requests = {}  # path -> count
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._slots = threading.Semaphore(parallel)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeOllama':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-ollama', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, path: str):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def generate(self, body: Dict) -> Optional[Dict]:
+        """Answer one /api/generate request (None = simulated server error)"""
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            latency, noise = self.profiles.get(body.get('model'), (self.latency, 0.0))
+            with self._slots:
+                started = time.time()
+                time.sleep(latency * (1 + random.random() * 0.2))
+                duration_ns = int((time.time() - started) * 1e9)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+        if self.error_rate and random.random() < self.error_rate:
+            return None
+
+        prompt = body.get('prompt', '')
+        prompt_tokens = max(1, len(prompt) // 4)
+        return {
+            'model': body.get('model'),
+            'response': json.dumps(classification_answer(prompt, body.get('model') or '', noise)),
+            'done': True,
+            'total_duration': duration_ns,
+            'load_duration': 0,
+            'prompt_eval_count': prompt_tokens,
+            'prompt_eval_duration': duration_ns // 3,
+            'eval_count': 30,
+            'eval_duration': duration_ns // 2
+        }
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload: Optional[Dict] = None):
+                body = json.dumps(payload or {}).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                fake._count(self.path)
+                if self.path == '/api/tags':
+                    self._send(200, {'models': [{'name': name} for name in fake.models]})
+                elif self.path == '/api/ps':
+                    self._send(200, {'models': [
+                        {'name': name, 'size': 5_000_000_000, 'size_vram': 5_000_000_000} for name in fake.models[:1]
+                    ]})
+                else:
+                    self._send(404, {'error': 'not found'})
+
+            def do_POST(self):
+                fake._count(self.path)
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if self.path != '/api/generate':
+                    self._send(404, {'error': 'not found'})
+                elif body.get('model') not in fake.models:
+                    self._send(404, {'error': f"model '{body.get('model')}' not found"})
+                else:
+                    answer = fake.generate(body)
+                    if answer is None:
+                        self._send(500, {'error': 'simulated failure'})
+                    else:
+                        self._send(200, answer)
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake Ollama server for load tests")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per request (default 0.05)")
+    parser.add_argument('--parallel', type=int, default=4, help="Requests processed at the same time (default 4)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests failing with HTTP 500")
+    parser.add_argument('--model', action='append', help="Model name to report (repeatable)")
+    parser.add_argument('--model-profile', action='append', default=[], metavar='NAME=LATENCY,NOISE',
+                        help="Extra model with its own latency and share of differing answers (repeatable)")
+    args = parser.parse_args()
+
+    profiles = {}
+    for spec in args.model_profile:
+        name, _, values = spec.rpartition('=')
+        latency, _, noise = values.partition(',')
+        profiles[name] = (float(latency), float(noise or 0))
+
+    server = FakeOllama(args.host, args.port, args.latency, args.parallel, args.error_rate, args.model, profiles)
+    print(f"🤖 Fake Ollama on {server.url} ({args.parallel} slots, {args.latency * 1000:.0f} ms per request)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,180 @@
+"""
+Ollama Health Monitor
+Checks Ollama in the background, so nobody has to wait for it
+
+/api/health used to call Ollama on every request. With several open tabs
+and a hung Ollama, every one of those requests held a server thread for
+the full timeout. The monitor checks Ollama on its own schedule (every
+HEALTH_POLL_INTERVAL seconds, every HEALTH_RETRY_INTERVAL seconds while it
+is down) and everyone reads the last result:
+
+- /api/health answers instantly from the snapshot
+- running jobs stop handing out keywords while Ollama is down and continue
+  when it is back (instead of turning every keyword into a failed rejection)
+- queue workers leave jobs in the queue while Ollama is down
+- "auto" concurrency starts at 1 when the model does not fit into VRAM
+
+One check = GET /api/tags (running? which models?) + GET /api/ps (which
+models are loaded, how much of them is in VRAM and how much in RAM).
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+from config import HEALTH_POLL_INTERVAL, HEALTH_RETRY_INTERVAL, HEALTH_TIMEOUT
+from log_setup import get_logger
+from ollama_client import OllamaClient
+
+logger = get_logger('health')
+
+
+class OllamaHealthMonitor:
+    """
+    Background checks of one Ollama server.
+
+    Usage:
+        health = OllamaHealthMonitor(ollama_client).start()
+        health.snapshot()                 # last check (never blocks on Ollama)
+        health.available                  # True if the last check reached Ollama
+        health.wait_until_available(60)   # block until Ollama is back (or timeout)
+    """
+
+    def __init__(self, client: OllamaClient, interval: float = HEALTH_POLL_INTERVAL,
+                 retry_interval: float = HEALTH_RETRY_INTERVAL, timeout: float = HEALTH_TIMEOUT):
+        self.client = client
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self.available = False  # Read without the lock (a single attribute)
+        self.checked = False  # False until the first check finished
+
+        self._snapshot = {
+            'checked': False,
+            'ollama_available': False,
+            'models': [],
+            'loaded_models': [],
+            'model': client.model
+        }
+        self._condition = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> 'OllamaHealthMonitor':
+        """Start the background checks (the first one runs right away)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ollama-health', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def refresh(self):
+        """Ask for a check now instead of at the next interval"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                logger.warning(f"Ollama health check failed: {e}")
+            self._wake.wait(self.interval if self.available else self.retry_interval)
+            self._wake.clear()
+
+    def check(self) -> Dict:
+        """Check Ollama once and store the result (runs in the monitor thread)"""
+        started = time.time()
+        available, models = self.client.status(timeout=self.timeout)
+        loaded = self.client.running_models(timeout=self.timeout) if available else None
+        check_seconds = time.time() - started
+
+        loaded_models = []
+        for model in loaded or []:
+            size = model['size'] or 0
+            vram = model['size_vram'] or 0
+            loaded_models.append({
+                **model,
+                'ram_bytes': max(0, size - vram),
+                'vram_share': round(vram / size, 3) if size else None,
+                'placement': placement(size, vram)
+            })
+        own = next((model for model in loaded_models if _same_model(model['name'], self.client.model)), None)
+
+        with self._condition:
+            previous = self._snapshot
+            if available != previous['ollama_available'] or not previous['checked']:
+                if available:
+                    logger.info(f"Ollama is up at {self.client.base_url}")
+                else:
+                    logger.warning(f"Ollama is not reachable at {self.client.base_url}")
+                changed_at = started
+            else:
+                changed_at = previous.get('changed_at', started)
+
+            self._snapshot = {
+                'checked': True,
+                'ollama_available': available,
+                'models': models,
+                'model': self.client.model,
+                'model_installed': any(_same_model(name, self.client.model) for name in models),
+                'model_loaded': own is not None,
+                'model_placement': own['placement'] if own else None,
+                'loaded_models': loaded_models,
+                'vram_bytes': sum(model['size_vram'] or 0 for model in loaded_models),
+                'ram_bytes': sum(model['ram_bytes'] for model in loaded_models),
+                'checked_at': started,
+                'check_ms': round(check_seconds * 1000, 1),
+                'changed_at': changed_at,
+                'consecutive_failures': 0 if available else previous.get('consecutive_failures', 0) + 1
+            }
+            self.available = available
+            self.checked = True
+            self._condition.notify_all()
+            return dict(self._snapshot)
+
+    def snapshot(self) -> Dict:
+        """Result of the last check, with its age in seconds"""
+        with self._condition:
+            snapshot = dict(self._snapshot)
+        if snapshot['checked']:
+            snapshot['age_seconds'] = round(time.time() - snapshot['checked_at'], 1)
+        return snapshot
+
+    def model_placement(self) -> Optional[str]:
+        """'gpu', 'partial' or 'cpu' for the client's model, None if it is not loaded"""
+        with self._condition:
+            return self._snapshot.get('model_placement')
+
+    def wait_until_available(self, timeout: float) -> bool:
+        """
+        Block until a check reaches Ollama
+
+        Returns:
+            True if Ollama is available, False after `timeout` seconds
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while not self.available:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+
+def placement(size: int, size_vram: int) -> str:
+    """Where a loaded model lives: fully in VRAM, split between VRAM and RAM, or RAM only"""
+    if size and size_vram >= size:
+        return 'gpu'
+    if size_vram > 0:
+        return 'partial'
+    return 'cpu'
+
+
+def _same_model(name: str, model: str) -> bool:
+    """"llama3.1" and "llama3.1:latest" are the same model"""
+    return name == model or name == f"{model}:latest" or model == f"{name}:latest"
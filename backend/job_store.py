@@ -0,0 +1,237 @@
+"""
+Job Store
+Shared, process-safe job state and job queue backed by SQLite
+
+In queue mode the API workers and the classification worker processes do not
+share memory. Everything they need to agree on lives here:
+- the queue of jobs waiting for a worker
+- the latest progress snapshot of every running job
+- the final results (statistics + output files) of finished jobs
+"""
+
+import json
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+
+from config import JOB_DB_PATH, WORKER_STALE_TIMEOUT
+
+
+class JobLost(Exception):
+    """The job was requeued (and maybe claimed by another worker) or deleted"""
+
+
+class JobStore:
+    """
+    A tiny job queue on top of SQLite.
+
+    SQLite is part of Python, works the same on Windows and Linux, and handles
+    locking between processes for us. WAL mode lets API workers read progress
+    while a worker process is writing it.
+    """
+
+    def __init__(self, db_path: Path = JOB_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per operation keeps this safe to use
+        # from any thread and any process
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    settings TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    progress TEXT,
+                    results TEXT,
+                    error TEXT,
+                    worker_id TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        finally:
+            conn.close()
+
+    def enqueue(self, topic: str, total: int, settings: Dict, source: Dict) -> str:
+        """
+        Put a new job into the queue
+
+        Args:
+            topic: What the keywords should be about
+            total: Number of keywords in the job
+            settings: Per-job settings (threshold, categories, prompts)
+            source: Where the worker loads keywords from
+                ({'upload_id': ...} or {'manual_input': ...})
+
+        Returns:
+            The new job id
+        """
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        progress = {
+            'status': 'queued',
+            'progress': 0,
+            'total': total,
+            'current_keyword': '',
+            'current_result': None,
+            'percentage': 0,
+            'time_remaining': None,
+            'avg_time_per_keyword': None,
+            'eta_source': None,
+            'estimate': None,
+            'statistics': None,
+            'concurrency': None
+        }
+
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (job_id, status, topic, total, settings, source, progress, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, topic, total, json.dumps(settings), json.dumps(source), json.dumps(progress), now, now)
+            )
+        finally:
+            conn.close()
+
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """
+        Atomically take the oldest queued job
+
+        Returns:
+            The job row as a dictionary, or None if the queue is empty
+        """
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers
+            # can never claim the same job
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET status = 'processing', worker_id = ?, updated_at = ? WHERE job_id = ?",
+                (worker_id, time.time(), row['job_id'])
+            )
+            conn.execute("COMMIT")
+            return self._row_to_dict(row)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def publish(self, job_id: str, worker_id: str, status: str, progress: Dict,
+                results: Optional[Dict] = None, error: Optional[str] = None):
+        """
+        Write the latest progress snapshot (and final results) of a job
+
+        Only the worker that claimed the job can write it. A worker that was
+        too slow for requeue_stale would otherwise overwrite the progress of
+        the worker that runs the job now.
+
+        Raises:
+            JobLost: the job no longer belongs to worker_id (the worker must stop it)
+        """
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, progress = ?, results = ?, error = ?, updated_at = ? "
+                "WHERE job_id = ? AND worker_id = ?",
+                (status, json.dumps(progress), json.dumps(results) if results is not None else None,
+                 error, time.time(), job_id, worker_id)
+            )
+            if cursor.rowcount == 0:
+                raise JobLost(f"Job {job_id} is no longer claimed by worker {worker_id}")
+        finally:
+            conn.close()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Get a job by id, or None if it does not exist"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+
+        return self._row_to_dict(row) if row else None
+
+    def requeue_stale(self, timeout: float = WORKER_STALE_TIMEOUT) -> int:
+        """
+        Put jobs back into the queue whose worker stopped sending updates
+
+        A worker that crashed (or was killed) leaves its job in 'processing'
+        forever. Jobs without a progress write for `timeout` seconds are
+        started again from the beginning by the next free worker.
+
+        Returns:
+            Number of jobs requeued
+        """
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL, updated_at = ? "
+                "WHERE status = 'processing' AND updated_at < ?",
+                (time.time(), time.time() - timeout)
+            )
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a worker"""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        finally:
+            conn.close()
+
+    def active_jobs(self) -> list:
+        """All jobs currently being processed by a worker"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT * FROM jobs WHERE status = 'processing'").fetchall()
+        finally:
+            conn.close()
+
+        return [self._row_to_dict(row) for row in rows]
+
+    def live_jobs(self) -> list:
+        """Queued and running jobs (their upload and output files must be kept)"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT * FROM jobs WHERE status IN ('queued', 'processing')").fetchall()
+        finally:
+            conn.close()
+
+        return [self._row_to_dict(row) for row in rows]
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        for field in ('settings', 'source', 'progress', 'results'):
+            if job.get(field):
+                job[field] = json.loads(job[field])
+        return job
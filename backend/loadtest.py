@@ -0,0 +1,405 @@
+"""
+Load Test
+Many simulated users against the API at once, with a fake Ollama behind it
+
+What one simulated user does (--users of them at the same time):
+    1. upload a CSV file (every other user with the chunked /api/uploads protocol)
+    2. start a job for it
+    3. keep a progress tab open (GET /api/progress every --poll-interval seconds)
+    4. fetch the results and download the accepted/rejected files
+On top of that, --health-pollers clients call /api/health in a loop.
+
+Reported at the end:
+- latency percentiles and error rates per endpoint
+- race checks: progress going backwards, jobs disappearing, results that do
+  not add up (downloaded rows != keywords), output files shared by two jobs
+- lock contention: where the server's threads were seen waiting on a lock
+  (sampled like profiling.py does, in-process runs only)
+
+Usage:
+    python loadtest.py                          # 20 users, server + fake Ollama in this process
+    python loadtest.py --users 50 --keywords 500 --latency 0.05 --parallel 4 --json report.json
+    python loadtest.py --url http://localhost:5000   # against a running server (its own Ollama)
+"""
+
+import argparse
+import csv
+import io
+import json
+import linecache
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+# Source lines where a thread waits for a lock/condition ("with self._lock:", ".acquire(", ".wait(")
+LOCK_WAIT_PATTERN = re.compile(r'with [\w.]*(lock|condition)\b|\.acquire\(|\.wait\(', re.I)
+
+
+class Recorder:
+    """Latencies and errors per endpoint, and race-check failures (thread-safe)"""
+
+    def __init__(self):
+        self.latencies = {}  # endpoint -> [seconds]
+        self.errors = Counter()  # endpoint -> failed requests
+        self.error_samples = []
+        self.failures = []  # Race/consistency check failures
+        self._lock = threading.Lock()
+
+    def request(self, endpoint: str, seconds: float, ok: bool, detail: str = ''):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+                if len(self.error_samples) < 20:
+                    self.error_samples.append(f"{endpoint}: {detail}")
+
+    def failure(self, message: str):
+        with self._lock:
+            self.failures.append(message)
+
+    def summary(self) -> Dict:
+        endpoints = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            ordered = sorted(values)
+            endpoints[endpoint] = {
+                'requests': len(ordered),
+                'errors': self.errors[endpoint],
+                'error_rate': round(self.errors[endpoint] / len(ordered), 4),
+                'p50_ms': _percentile_ms(ordered, 50),
+                'p90_ms': _percentile_ms(ordered, 90),
+                'p99_ms': _percentile_ms(ordered, 99),
+                'max_ms': round(ordered[-1] * 1000, 1)
+            }
+        return {'endpoints': endpoints, 'error_samples': self.error_samples, 'race_failures': self.failures}
+
+
+def _percentile_ms(ordered: List[float], percent: float) -> float:
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return round(ordered[index] * 1000, 1)
+
+
+class LockContentionSampler:
+    """
+    Samples all threads of this process and counts the ones waiting at a lock
+
+    A thread blocked in lock.acquire() shows the "with lock:" line of its
+    caller as its current line, so lines matching LOCK_WAIT_PATTERN are
+    counted per file:line. Idle pool/server threads waiting for work are
+    left out (they wait in the standard library, not in our code).
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.sites = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='lock-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        backend = os.path.dirname(os.path.abspath(__file__))
+        own = {threading.get_ident()}
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id in own:
+                    continue
+                filename = frame.f_code.co_filename
+                if not filename.startswith(backend) or filename == __file__:
+                    continue
+                line = linecache.getline(filename, frame.f_lineno)
+                if LOCK_WAIT_PATTERN.search(line):
+                    self.sites[f"{os.path.basename(filename)}:{frame.f_lineno} {line.strip()}"] += 1
+
+    def summary(self, limit: int = 10) -> Dict:
+        return {
+            'samples': self.samples,
+            'waiting_threads_per_sample': round(sum(self.sites.values()) / self.samples, 3) if self.samples else 0,
+            'top_sites': [{'site': site, 'samples': count} for site, count in self.sites.most_common(limit)]
+        }
+
+
+def make_csv(user: int, keywords: int) -> bytes:
+    """A keyword file that no other simulated user has (no cache hits between users)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['title', 'views', 'views_per_year'])
+    for index in range(keywords):
+        writer.writerow([f"user {user} keyword {index} ys walkthrough", 1000 + index, 500.0 + index])
+    return buffer.getvalue().encode('utf-8')
+
+
+class SimulatedUser(threading.Thread):
+    """Uploads a file, starts a job, polls its progress and downloads the results"""
+
+    def __init__(self, index: int, base_url: str, args, recorder: Recorder, output_owners: Dict):
+        super().__init__(name=f'user-{index}', daemon=True)
+        self.index = index
+        self.base_url = base_url
+        self.args = args
+        self.recorder = recorder
+        self.output_owners = output_owners
+        self.finished = False
+
+    def call(self, endpoint: str, method: str, path: str, expect=(200,), **kwargs):
+        """One timed request; returns the response or None if it failed"""
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=60, **kwargs)
+        except Exception as e:
+            self.recorder.request(endpoint, time.perf_counter() - started, False, type(e).__name__)
+            return None
+        ok = response.status_code in expect
+        self.recorder.request(endpoint, time.perf_counter() - started, ok, f"HTTP {response.status_code} {response.text[:100]}")
+        return response if ok else None
+
+    def upload(self, data: bytes) -> Optional[Dict]:
+        name = f"loadtest_{self.index}.csv"
+        if self.index % 2 == 0:
+            response = self.call('POST /api/upload', 'POST', '/api/upload', files={'file': (name, data, 'text/csv')})
+            return response.json() if response is not None else None
+
+        # Chunked upload in 4 pieces
+        response = self.call('POST /api/uploads', 'POST', '/api/uploads', expect=(201,),
+                             json={'filename': name, 'size': len(data)})
+        if response is None:
+            return None
+        session_id = response.json()['session_id']
+        chunk = max(1, len(data) // 4 + 1)
+        for offset in range(0, len(data), chunk):
+            if self.call('PUT /api/uploads/<id>', 'PUT', f'/api/uploads/{session_id}', data=data[offset:offset + chunk],
+                         headers={'Content-Range': f'bytes {offset}-{min(offset + chunk, len(data)) - 1}/{len(data)}'}) is None:
+                return None
+        response = self.call('POST /api/uploads/<id>/complete', 'POST', f'/api/uploads/{session_id}/complete')
+        return response.json() if response is not None else None
+
+    def run(self):
+        import requests
+
+        self.session = requests.Session()
+        upload = self.upload(make_csv(self.index, self.args.keywords))
+        if upload is None:
+            return
+        if upload.get('keyword_count') != self.args.keywords:
+            self.recorder.failure(f"user {self.index}: upload reported {upload.get('keyword_count')} keywords, sent {self.args.keywords}")
+
+        response = self.call('POST /api/process', 'POST', '/api/process', json={
+            'topic': 'Ys games', 'upload_id': upload['upload_id'], 'concurrency': self.args.concurrency
+        })
+        if response is None:
+            return
+        job_id = response.json()['job_id']
+
+        last_progress, deadline = -1, time.time() + self.args.timeout
+        while time.time() < deadline:
+            response = self.call('GET /api/progress/<id>', 'GET', f'/api/progress/{job_id}', expect=(200, 404))
+            if response is None:
+                time.sleep(self.args.poll_interval)
+                continue
+            if response.status_code == 404:
+                self.recorder.failure(f"user {self.index}: job {job_id} not found while running")
+                return
+            progress = response.json()
+            if progress['progress'] < last_progress:
+                self.recorder.failure(f"user {self.index}: progress went back from {last_progress} to {progress['progress']}")
+            last_progress = progress['progress']
+            if progress['status'] in ('completed', 'failed'):
+                break
+            time.sleep(self.args.poll_interval)
+        else:
+            self.recorder.failure(f"user {self.index}: job {job_id} not finished after {self.args.timeout} s")
+            return
+
+        if progress['status'] == 'failed':
+            self.recorder.failure(f"user {self.index}: job failed: {progress.get('error')}")
+            return
+
+        response = self.call('GET /api/results/<id>', 'GET', f'/api/results/{job_id}')
+        if response is None:
+            return
+        results = response.json()
+
+        rows = 0
+        for key in ('accepted_file', 'rejected_file'):
+            filename = os.path.basename(results.get(key) or '')
+            owner = self.output_owners.setdefault(filename, job_id)
+            if owner != job_id:
+                self.recorder.failure(f"user {self.index}: output file {filename} is shared with job {owner}")
+            response = self.call('GET /api/download/<file>', 'GET', f'/api/download/{filename}')
+            if response is not None:
+                rows += max(0, len(response.text.splitlines()) - 1)
+        if rows != self.args.keywords:
+            self.recorder.failure(f"user {self.index}: downloaded {rows} result rows, expected {self.args.keywords}")
+        self.finished = True
+
+
+class HealthPoller(threading.Thread):
+    """Keeps calling /api/health (like open tabs checking the Ollama status)"""
+
+    def __init__(self, base_url: str, recorder: Recorder, interval: float, stop: threading.Event):
+        super().__init__(name='health-poller', daemon=True)
+        self.base_url = base_url
+        self.recorder = recorder
+        self.interval = interval
+        self.stop_event = stop
+
+    def run(self):
+        import requests
+
+        session = requests.Session()
+        while not self.stop_event.is_set():
+            started = time.perf_counter()
+            try:
+                response = session.get(f'{self.base_url}/api/health', timeout=30)
+                ok, detail = response.status_code == 200, f"HTTP {response.status_code}"
+            except Exception as e:
+                ok, detail = False, type(e).__name__
+            self.recorder.request('GET /api/health', time.perf_counter() - started, ok, detail)
+            self.stop_event.wait(self.interval)
+
+
+def start_local_server(args):
+    """Fake Ollama + the Flask app in this process, with data folders in a temp directory"""
+    from fake_ollama import FakeOllama
+
+    fake = FakeOllama(latency=args.latency, parallel=args.parallel, error_rate=args.error_rate).start()
+
+    workdir = tempfile.mkdtemp(prefix='kc_loadtest_')
+    os.environ['KC_OLLAMA_URL'] = fake.url
+    for name in ('UPLOAD', 'OUTPUT', 'DATA'):
+        os.environ[f'KC_{name}_FOLDER'] = os.path.join(workdir, name.lower())
+        os.makedirs(os.environ[f'KC_{name}_FOLDER'], exist_ok=True)
+    os.environ.setdefault('KC_LOG_LEVEL', 'ERROR')
+
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    import app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", fake, server, workdir
+
+
+def print_report(report: Dict):
+    print("\n" + "=" * 96)
+    print(f"{'endpoint':36} {'requests':>8} {'errors':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    print("-" * 96)
+    for endpoint, stats in report['endpoints'].items():
+        print(f"{endpoint:36} {stats['requests']:>8} {stats['errors']:>7} {stats['p50_ms']:>9} "
+              f"{stats['p90_ms']:>9} {stats['p99_ms']:>9} {stats['max_ms']:>9}")
+    print("=" * 96)
+
+    print(f"\n👥 Users finished: {report['users_finished']}/{report['users']} in {report['elapsed_seconds']} s")
+    if report.get('fake_ollama'):
+        fake = report['fake_ollama']
+        print(f"🤖 Fake Ollama: {fake['requests']} requests, at most {fake['max_in_flight']} in flight")
+
+    if report['error_samples']:
+        print("\n❌ Errors (first ones):")
+        for sample in report['error_samples']:
+            print(f"   {sample}")
+
+    if report['race_failures']:
+        print(f"\n🚨 Race/consistency failures: {len(report['race_failures'])}")
+        for failure in report['race_failures'][:20]:
+            print(f"   {failure}")
+    else:
+        print("\n✅ No race/consistency failures")
+
+    contention = report.get('lock_contention')
+    if contention:
+        print(f"\n🔒 Lock contention: {contention['waiting_threads_per_sample']} threads waiting per sample "
+              f"({contention['samples']} samples)")
+        for site in contention['top_sites']:
+            print(f"   {site['samples']:>6}  {site['site']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the Keyword Classifier API")
+    parser.add_argument('--url', help="Test a running server instead of starting one (with a fake Ollama) here")
+    parser.add_argument('--users', type=int, default=20, help="Simulated users uploading and polling (default 20)")
+    parser.add_argument('--keywords', type=int, default=200, help="Keywords per uploaded file (default 200)")
+    parser.add_argument('--concurrency', default=2, help="Concurrency of every job (number or auto, default 2)")
+    parser.add_argument('--poll-interval', type=float, default=0.5, help="Seconds between progress polls (default 0.5)")
+    parser.add_argument('--health-pollers', type=int, default=5, help="Clients polling /api/health (default 5)")
+    parser.add_argument('--health-interval', type=float, default=0.5)
+    parser.add_argument('--latency', type=float, default=0.02, help="Fake Ollama seconds per request (default 0.02)")
+    parser.add_argument('--parallel', type=int, default=4, help="Fake Ollama requests at the same time (default 4)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of fake Ollama requests failing")
+    parser.add_argument('--timeout', type=float, default=600, help="Seconds a job may take (default 600)")
+    parser.add_argument('--json', help="Also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    fake = server = workdir = None
+    sampler = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        base_url, fake, server, workdir = start_local_server(args)
+        sampler = LockContentionSampler()
+        sampler.start()
+
+    print(f"🚀 Load test against {base_url}: {args.users} users x {args.keywords} keywords, "
+          f"{args.health_pollers} health pollers")
+
+    recorder = Recorder()
+    output_owners = {}
+    stop = threading.Event()
+    started = time.time()
+
+    pollers = [HealthPoller(base_url, recorder, args.health_interval, stop) for _ in range(args.health_pollers)]
+    users = [SimulatedUser(index, base_url, args, recorder, output_owners) for index in range(args.users)]
+    for thread in pollers + users:
+        thread.start()
+    for user in users:
+        user.join()
+    stop.set()
+    for poller in pollers:
+        poller.join()
+
+    report = recorder.summary()
+    report.update({
+        'users': args.users,
+        'users_finished': sum(1 for user in users if user.finished),
+        'elapsed_seconds': round(time.time() - started, 2)
+    })
+    if sampler:
+        sampler.stop()
+        report['lock_contention'] = sampler.summary()
+    if fake:
+        report['fake_ollama'] = {'requests': dict(fake.requests), 'max_in_flight': fake.max_in_flight}
+        server.shutdown()
+        fake.stop()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if workdir:
+        import shutil
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # Non-zero exit code for CI: errors or failed checks
+    failed = report['race_failures'] or any(stats['errors'] for stats in report['endpoints'].values())
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
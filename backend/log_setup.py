@@ -0,0 +1,132 @@
+"""
+Logging Setup
+Structured (JSON) logging that never blocks the classification hot loop
+
+- Every record carries job/keyword context (job_id, keyword_index) set with
+  set_log_context(), plus fields passed via `extra` (host, attempt, duration_ms...)
+- Records go through a QueueHandler; a background QueueListener does the
+  formatting and console writes, so worker threads only put records on a queue
+- Per-keyword records are marked `sampled` and can be thinned out or turned
+  off entirely with KC_LOG_KEYWORD_SAMPLE_RATE
+
+Environment variables:
+    KC_LOG_LEVEL                 DEBUG, INFO (default), WARNING, ERROR
+    KC_LOG_FORMAT                json (default) or text
+    KC_LOG_KEYWORD_SAMPLE_RATE   0.0 - 1.0 share of per-keyword records kept (default 0.0)
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+
+# Fields copied from the record into the JSON line when present
+CONTEXT_FIELDS = ('job_id', 'keyword_index', 'keyword', 'host', 'model', 'attempt', 'duration_ms', 'status_code')
+
+_log_context = contextvars.ContextVar('kc_log_context', default={})
+_listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Get a logger below the "kc" namespace (e.g. get_logger('ollama') -> "kc.ollama")"""
+    return logging.getLogger(f"kc.{name}")
+
+
+def set_log_context(**fields):
+    """
+    Attach fields (job_id, keyword_index...) to every record logged from this thread/context
+
+    Passing None removes a field.
+    """
+    context = dict(_log_context.get())
+    for key, value in fields.items():
+        if value is None:
+            context.pop(key, None)
+        else:
+            context[key] = value
+    _log_context.set(context)
+
+
+class ContextFilter(logging.Filter):
+    """Copies the current log context onto the record (runs in the logging thread's caller)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a share of the records marked with extra={'sampled': True}"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'sampled', False):
+            return True
+        return self.rate > 0 and (self.rate >= 1 or random.random() < self.rate)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def setup_logging(level: str = None, log_format: str = None, keyword_sample_rate: float = None):
+    """
+    Configure the "kc" loggers (safe to call more than once)
+
+    Arguments override the KC_LOG_* environment variables.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = (level or os.environ.get('KC_LOG_LEVEL', 'INFO')).upper()
+    log_format = log_format or os.environ.get('KC_LOG_FORMAT', 'json')
+    if keyword_sample_rate is None:
+        keyword_sample_rate = float(os.environ.get('KC_LOG_KEYWORD_SAMPLE_RATE', '0.0'))
+
+    console = logging.StreamHandler()
+    if log_format == 'json':
+        console.setFormatter(JsonFormatter())
+    else:
+        console.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    # The QueueHandler only puts records on an in-memory queue; the listener
+    # thread formats and writes them
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(keyword_sample_rate))
+
+    kc_logger = logging.getLogger('kc')
+    kc_logger.setLevel(level)
+    kc_logger.addHandler(queue_handler)
+    kc_logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, console, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,342 @@
+"""
+Metrics
+Tiny Prometheus-compatible metrics registry (no extra dependency)
+
+Recording a value is a dictionary lookup plus a lock, so it is cheap enough
+for the classification hot loop. Everything expensive (RSS, job throughput,
+queue depth) is computed only when /api/metrics is scraped.
+
+In queue mode the classification runs in worker processes, which write a
+snapshot of their metrics to DATA_FOLDER/metrics/ every few seconds.
+The API merges those snapshots into its own output.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import DATA_FOLDER
+
+METRICS_SNAPSHOT_FOLDER = DATA_FOLDER / 'metrics'
+METRICS_SNAPSHOT_INTERVAL = 5.0  # Seconds between snapshot writes in worker processes
+METRICS_SNAPSHOT_MAX_AGE = 60.0  # Snapshots older than this belong to dead workers
+
+# Latency buckets (seconds) - LLM calls take anywhere from 100 ms to a minute
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 45, 60, 90)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 100, 150, 200, 400)
+
+
+class _Metric:
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {
+            'type': self.metric_type,
+            'help': self.documentation,
+            'labelnames': list(self.labelnames),
+            'values': values
+        }
+
+
+class Counter(_Metric):
+    """A value that only goes up (requests, retries, errors...)"""
+    metric_type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down (in-flight requests...)"""
+    metric_type = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (latencies, tokens/sec...)"""
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = state
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            values = [[list(key), [list(state[0]), state[1], state[2]]] for key, state in self._values.items()]
+        snap = super().snapshot()
+        snap['values'] = values
+        snap['buckets'] = list(self.buckets)
+        return snap
+
+
+class MetricsRegistry:
+    """Holds all metrics of this process and renders them in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], List[Tuple[str, str, str, List[Tuple[Dict, float]]]]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable):
+        """
+        Register a function that is called at scrape time
+
+        The collector returns a list of (name, type, help, [(labels, value), ...]).
+        Use it for values that are expensive to keep up to date (RSS, job stats).
+        """
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict:
+        """Serializable copy of all metric values (used by worker processes)"""
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def render(self, extra_snapshots: Optional[List[Dict]] = None) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format
+
+        Args:
+            extra_snapshots: Snapshots from other processes; their values are
+                added to the values of this process
+        """
+        merged = self.snapshot()
+        for snap in extra_snapshots or []:
+            _merge_snapshot(merged, snap)
+
+        lines = []
+        for name, snap in merged.items():
+            lines.append(f"# HELP {name} {snap['help']}")
+            lines.append(f"# TYPE {name} {snap['type']}")
+            labelnames = snap['labelnames']
+
+            for key, value in snap['values']:
+                labels = dict(zip(labelnames, key))
+                if snap['type'] == 'histogram':
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket_count in zip(snap['buckets'] + ['+Inf'], counts):
+                        cumulative += bucket_count
+                        le = bound if bound == '+Inf' else _format_value(bound)
+                        lines.append(f"{name}_bucket{_format_labels(dict(labels, le=le))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for collector in self._collectors:
+            try:
+                collected = collector()
+            except Exception:
+                continue
+            for name, metric_type, documentation, samples in collected:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _merge_snapshot(target: Dict, snap: Dict):
+    """Add the values of another process's snapshot to `target`"""
+    for name, metric in snap.get('metrics', {}).items():
+        if name not in target:
+            target[name] = {k: v for k, v in metric.items() if k != 'values'}
+            target[name]['values'] = []
+
+        existing = {tuple(key): i for i, (key, _) in enumerate(target[name]['values'])}
+        for key, value in metric['values']:
+            index = existing.get(tuple(key))
+            if index is None:
+                target[name]['values'].append([key, value])
+                continue
+            current = target[name]['values'][index][1]
+            if metric['type'] == 'histogram':
+                merged = [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1], current[2] + value[2]]
+            else:
+                merged = current + value
+            target[name]['values'][index][1] = merged
+
+
+def _format_labels(labels: Dict) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def process_rss_bytes() -> Optional[int]:
+    """Resident memory of this process (psutil if installed, /proc on Linux)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def write_snapshot(process_name: str, folder: Path = METRICS_SNAPSHOT_FOLDER):
+    """Write this process's metrics for the API process to merge (queue mode)"""
+    folder.mkdir(parents=True, exist_ok=True)
+    snapshot = {
+        'process': process_name,
+        'timestamp': time.time(),
+        'rss_bytes': process_rss_bytes(),
+        'metrics': REGISTRY.snapshot()
+    }
+    tmp_file = folder / f"{process_name}.json.tmp"
+    tmp_file.write_text(json.dumps(snapshot), encoding='utf-8')
+    os.replace(tmp_file, folder / f"{process_name}.json")
+
+
+def start_snapshot_writer(process_name: str, interval: float = METRICS_SNAPSHOT_INTERVAL):
+    """Write metric snapshots in a background thread, off the hot loop"""
+    def loop():
+        while True:
+            try:
+                write_snapshot(process_name)
+            except OSError:
+                pass
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
+
+
+def read_snapshots(folder: Path = METRICS_SNAPSHOT_FOLDER, max_age: float = METRICS_SNAPSHOT_MAX_AGE) -> List[Dict]:
+    """Read the recent snapshots written by worker processes"""
+    if not folder.exists():
+        return []
+
+    snapshots = []
+    now = time.time()
+    for path in folder.glob('*.json'):
+        try:
+            snap = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue
+        if now - snap.get('timestamp', 0) <= max_age:
+            snapshots.append(snap)
+    return snapshots
+
+
+# Process-wide registry and the metrics recorded by the backend
+REGISTRY = MetricsRegistry()
+
+OLLAMA_REQUEST_SECONDS = REGISTRY.histogram(
+    'kc_ollama_request_duration_seconds', 'Latency of Ollama generate requests',
+    ('model', 'host', 'outcome'))
+OLLAMA_TOKENS_PER_SECOND = REGISTRY.histogram(
+    'kc_ollama_tokens_per_second', 'Generation speed reported by Ollama (eval_count / eval_duration)',
+    ('model', 'host'), buckets=TOKENS_PER_SECOND_BUCKETS)
+OLLAMA_EVAL_TOKENS = REGISTRY.counter(
+    'kc_ollama_eval_tokens_total', 'Tokens generated by Ollama', ('model', 'host'))
+OLLAMA_RETRIES = REGISTRY.counter(
+    'kc_ollama_retries_total', 'Ollama requests that were retried', ('model', 'host'))
+OLLAMA_TIMEOUTS = REGISTRY.counter(
+    'kc_ollama_timeouts_total', 'Ollama requests that timed out', ('model', 'host'))
+OLLAMA_ERRORS = REGISTRY.counter(
+    'kc_ollama_errors_total', 'Ollama requests that failed (HTTP or connection errors)', ('model', 'host', 'reason'))
+OLLAMA_IN_FLIGHT = REGISTRY.gauge(
+    'kc_ollama_in_flight_requests', 'Ollama requests currently in flight', ('host',))
+PARSE_FAILURES = REGISTRY.counter(
+    'kc_parse_failures_total', 'AI responses that could not be parsed', ('stage',))
+CACHE_REQUESTS = REGISTRY.counter(
+    'kc_cache_requests_total', 'Cache lookups by result (hit/miss)', ('cache', 'result'))
+KEYWORDS_CLASSIFIED = REGISTRY.counter(
+    'kc_keywords_classified_total', 'Keywords classified', ('accepted',))
+
+
+def _collect_process() -> List:
+    rss = process_rss_bytes()
+    samples = [({'process': f"api-{os.getpid()}"}, rss)] if rss is not None else []
+    for snap in read_snapshots():
+        if snap.get('rss_bytes') is not None:
+            samples.append(({'process': snap['process']}, snap['rss_bytes']))
+    return [('kc_process_resident_memory_bytes', 'gauge', 'Resident memory per process', samples)]
+
+
+def _collect_cache_ratio() -> List:
+    hits, totals = {}, {}
+    for snap in [{'metrics': REGISTRY.snapshot()}] + read_snapshots():
+        cache_metric = snap['metrics'].get(CACHE_REQUESTS.name, {})
+        for (cache, result), value in cache_metric.get('values', []):
+            totals[cache] = totals.get(cache, 0) + value
+            if result == 'hit':
+                hits[cache] = hits.get(cache, 0) + value
+    samples = [({'cache': cache}, hits.get(cache, 0) / total) for cache, total in totals.items() if total]
+    return [('kc_cache_hit_ratio', 'gauge', 'Share of cache lookups that were hits', samples)]
+
+
+REGISTRY.add_collector(_collect_process)
+REGISTRY.add_collector(_collect_cache_ratio)
@@ -0,0 +1,684 @@
+"""
+Model Tuner
+Finds the fastest installed model that still classifies like the reference
+
+OLLAMA_MODEL is llama3.1:8b, but Ollama often has smaller or quantized models
+installed that run several times faster on CPU-only machines. Whether they
+are good enough depends on the topic, so the tuner classifies the same sample
+with every model and measures:
+
+- throughput: keywords per second (each model is loaded first, so loading
+  does not count)
+- agreement: share of keywords with the same decision as the reference
+  (accepted or rejected for every topic, and the same category if accepted).
+  The reference is the labels sent with the sample, or else the answers of
+  the reference model (OLLAMA_MODEL by default)
+
+The fastest model with agreement >= min_agreement is recommended. An applied
+recommendation is stored per topic (tuning.sqlite3), and jobs for that topic
+that do not ask for a "model" use it from then on. Runs started through the
+API keep their state there too (TuningRuns), so every API process can report
+on them and cancel them.
+
+A model stops early once it can no longer reach min_agreement, or when its
+first answers all fail (e.g. an embedding model). Tune while no jobs run:
+jobs share Ollama and would slow every model down.
+
+Usage:
+    python model_tuner.py keywords.csv --topic "Ys games"
+    python model_tuner.py keywords.csv --topic "Ys games" --model qwen2.5:3b --model llama3.2:3b --apply
+
+    # CSV with a "relevant" column (and optionally "category"): the labels are the reference
+    python model_tuner.py labeled.csv --topic "Ys games" --min-agreement 0.85
+"""
+
+import argparse
+import csv
+import json
+import math
+import random
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import (
+    OLLAMA_BASE_URL,
+    OLLAMA_MODEL,
+    DEFAULT_CONFIDENCE_THRESHOLD,
+    DEFAULT_CATEGORIES,
+    DEFAULT_RELEVANCE_PROMPT,
+    DEFAULT_CATEGORY_PROMPT,
+    TUNING_DB_PATH,
+    TUNING_SAMPLE_SIZE,
+    TUNING_MIN_AGREEMENT,
+    TUNING_STALE_TIMEOUT
+)
+from log_setup import get_logger
+
+logger = get_logger('tuner')
+
+# A model whose first answers all fail is not measured any further
+UNUSABLE_PROBE = 5
+
+# Keyword used to load a model before it is timed (not part of any sample)
+WARM_UP_KEYWORD = "model warm-up"
+
+
+def topic_key(topics: List[str]) -> str:
+    """The topics of a job as one lookup key (order and case do not matter)"""
+    return ' | '.join(sorted(topic.strip().lower() for topic in topics if topic.strip()))
+
+
+def sample_keywords(keywords: Iterable[Dict], size: int, seed: int = 0) -> List[Dict]:
+    """
+    Random sample of `size` keywords in one pass (the same seed gives the same sample)
+
+    Reservoir sampling: the input is streamed, so huge uploads need no extra memory.
+    """
+    rng = random.Random(seed)
+    sample = []
+    for index, keyword in enumerate(keywords):
+        if index < size:
+            sample.append(keyword)
+        else:
+            slot = rng.randint(0, index)
+            if slot < size:
+                sample[slot] = keyword
+    return sample
+
+
+def decision(result: Optional[Dict], topics: List[str]) -> Optional[Tuple]:
+    """
+    What a classification decided: (accepted per topic, category)
+
+    Returns:
+        None if the model gave no usable answer
+    """
+    if result is None or result.get('failed'):
+        return None
+    if 'topic_results' in result:
+        accepted = tuple(bool(result['topic_results'][topic]['relevance_accepted']) for topic in topics)
+    else:
+        accepted = (bool(result.get('relevance_accepted')),)
+    return accepted, result.get('category', 'none') if any(accepted) else 'none'
+
+
+def label_decision(keyword: Dict, topics: List[str]) -> Optional[Tuple]:
+    """
+    Decision of a labeled keyword, like decision() (None if it has no label)
+
+    Labels: "relevant" is true/false (one topic) or the list of relevant topics,
+    "category" is the expected category of a relevant keyword.
+    """
+    relevant = keyword.get('relevant')
+    if relevant is None or relevant == '':
+        return None
+    if isinstance(relevant, (list, tuple)):
+        wanted = {topic.strip().lower() for topic in relevant}
+        accepted = tuple(topic.strip().lower() in wanted for topic in topics)
+    else:
+        if isinstance(relevant, str):
+            relevant = relevant.strip().lower() in ('1', 'true', 'yes', 'ja', 'y', 'x')
+        accepted = tuple(bool(relevant) for _ in topics)
+    return accepted, (keyword.get('category') or 'none') if any(accepted) else 'none'
+
+
+def agreement(reference: List[Optional[Tuple]], answers: List[Optional[Tuple]]) -> Dict:
+    """
+    Compare the decisions of a model with the reference
+
+    Keywords without a reference decision (the reference model failed) are
+    left out; keywords the model failed count as disagreements.
+
+    Returns:
+        Dictionary with:
+        - agreement: share of keywords with the same decision (relevance AND category)
+        - relevance_agreement: share with the same accepted/rejected decision
+        - category_agreement: share with the same category, among keywords
+          both accepted (None if there are none)
+        - compared: keywords compared
+    """
+    pairs = [(ref, answer) for ref, answer in zip(reference, answers) if ref is not None]
+    if not pairs:
+        return {'agreement': None, 'relevance_agreement': None, 'category_agreement': None, 'compared': 0}
+
+    same = sum(1 for ref, answer in pairs if answer == ref)
+    same_relevance = sum(1 for ref, answer in pairs if answer is not None and answer[0] == ref[0])
+    both_accepted = [(ref, answer) for ref, answer in pairs if answer is not None and any(ref[0]) and any(answer[0])]
+    same_category = sum(1 for ref, answer in both_accepted if answer[1] == ref[1])
+    return {
+        'agreement': round(same / len(pairs), 4),
+        'relevance_agreement': round(same_relevance / len(pairs), 4),
+        'category_agreement': round(same_category / len(both_accepted), 4) if both_accepted else None,
+        'compared': len(pairs)
+    }
+
+
+def recommend(results: List[Dict], min_agreement: float) -> Optional[Dict]:
+    """The fastest fully measured model with at least `min_agreement` (None if no model qualifies)"""
+    qualified = [
+        result for result in results
+        if result['status'] == 'completed' and result['keywords_per_second']
+        and result['agreement'] is not None and result['agreement'] >= min_agreement
+    ]
+    return max(qualified, key=lambda result: result['keywords_per_second']) if qualified else None
+
+
+class ModelTuner:
+    """
+    Classifies one sample with several models and compares them.
+
+    Usage:
+        tuner = ModelTuner(['Ys games'], min_agreement=0.9)
+        report = tuner.run(sample)          # every installed model
+        report['recommended']               # fastest model with enough agreement (or None)
+        tuner.state()                       # progress while run() works in another thread
+
+    Args:
+        topics: Topics of the jobs the model is tuned for
+        settings: Job settings used for classification (confidence_threshold,
+            categories, relevance_prompt, category_prompt)
+        ollama_url: Ollama to tune
+        reference_model: Model whose answers are the reference (unless the sample is labeled)
+        min_agreement: Share of keywords that must get the reference decision (0-1)
+        concurrency: Keywords classified in parallel (1 measures per-call speed)
+    """
+
+    def __init__(self, topics: List[str], settings: Optional[Dict] = None, ollama_url: str = OLLAMA_BASE_URL,
+                 reference_model: str = OLLAMA_MODEL, min_agreement: float = TUNING_MIN_AGREEMENT,
+                 concurrency: int = 1):
+        self.topics = topics
+        self.settings = settings or {}
+        self.ollama_url = ollama_url
+        self.reference_model = reference_model
+        self.min_agreement = min_agreement
+        self.concurrency = concurrency
+
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._state = {'status': 'pending', 'model': None, 'models_done': 0, 'models_total': 0,
+                       'keywords_done': 0, 'results': []}
+
+    def state(self) -> Dict:
+        """Progress of run(): status, current model, finished model results, and the report when done"""
+        with self._lock:
+            state = dict(self._state)
+            state['results'] = list(state['results'])
+        return state
+
+    def _update(self, **fields):
+        with self._lock:
+            self._state.update(fields)
+
+    def mark_applied(self):
+        """Record that the recommendation of this run was applied (see ModelChoices.apply)"""
+        self._update(applied=True)
+
+    def cancel(self):
+        """Stop after the keywords in flight (run() returns the models measured so far)"""
+        self._cancel.set()
+
+    def classifier_for(self, model: str):
+        """A classifier for `model` with the job settings and WITHOUT the response cache (honest timings)"""
+        from ollama_client import OllamaClient
+        from classifier import KeywordClassifier
+
+        client = OllamaClient(self.ollama_url, model)
+        client.cache_size = 0
+        classifier = KeywordClassifier(client)
+        classifier.set_confidence_threshold(self.settings.get('confidence_threshold', DEFAULT_CONFIDENCE_THRESHOLD))
+        classifier.categories = self.settings.get('categories', DEFAULT_CATEGORIES)
+        classifier.set_relevance_prompt(self.settings.get('relevance_prompt', DEFAULT_RELEVANCE_PROMPT))
+        classifier.set_category_prompt(self.settings.get('category_prompt', DEFAULT_CATEGORY_PROMPT))
+        return classifier
+
+    def measure(self, model: str, keywords: List[str],
+                reference: Optional[List[Optional[Tuple]]] = None) -> Tuple[Dict, List[Optional[Tuple]]]:
+        """
+        Classify the keywords with one model
+
+        Args:
+            model: Ollama model name
+            keywords: Sample keywords
+            reference: Reference decision per keyword (None: this IS the
+                reference model, it is never stopped early)
+
+        Returns:
+            Tuple of (result dictionary, decision per measured keyword)
+        """
+        classifier = self.classifier_for(model)
+        multi_topic = len(self.topics) > 1
+        stop = threading.Event()
+
+        def classify_one(keyword: str):
+            if stop.is_set() or self._cancel.is_set():
+                return None, 0.0
+            started = time.time()
+            if multi_topic:
+                result = classifier.classify_keyword_multi(keyword, self.topics)
+            else:
+                result = classifier.classify_keyword(keyword, self.topics[0])
+            return result, time.time() - started
+
+        # Load the model before the clock starts (the first call of a cold model takes seconds)
+        load_started = time.time()
+        classify_one(WARM_UP_KEYWORD)
+        load_seconds = time.time() - load_started
+
+        # Disagreements allowed before min_agreement is out of reach
+        allowed_misses = None
+        if reference is not None:
+            allowed_misses = math.floor((1 - self.min_agreement) * sum(1 for ref in reference if ref is not None) + 1e-9)
+
+        decisions, call_seconds = [], []
+        failed = misses = 0
+        status = 'completed'
+        started = finished = time.time()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for index, (result, seconds) in enumerate(executor.map(classify_one, keywords)):
+                if result is None:
+                    status = 'cancelled' if self._cancel.is_set() else status
+                    break
+                finished = time.time()
+                answer = decision(result, self.topics)
+                decisions.append(answer)
+                call_seconds.append(seconds)
+                failed += answer is None
+                if reference is not None and reference[index] is not None and answer != reference[index]:
+                    misses += 1
+                self._update(keywords_done=len(decisions))
+
+                if failed == len(decisions) == UNUSABLE_PROBE:
+                    status = 'unusable'
+                elif allowed_misses is not None and misses > allowed_misses:
+                    status = 'below_target'
+                if status != 'completed':
+                    stop.set()
+                    break
+
+        measured = len(decisions)
+        elapsed = finished - started
+        result = {
+            'model': model,
+            'status': status,
+            'keywords': measured,
+            'failed': failed,
+            'keywords_per_second': round(measured / elapsed, 3) if measured and elapsed > 0 else None,
+            'seconds_per_keyword': round(sum(call_seconds) / measured, 3) if measured else None,
+            'load_seconds': round(load_seconds, 2),
+            'accepted_share': round(sum(1 for answer in decisions if answer and any(answer[0])) / measured, 4)
+            if measured else None,
+            'is_reference': reference is None
+        }
+        if reference is None:
+            result.update({'agreement': 1.0, 'relevance_agreement': 1.0, 'category_agreement': 1.0, 'compared': measured})
+        else:
+            result.update(agreement(reference[:measured], decisions))
+        logger.info(f"Tuned {model}: {result['status']}", extra={
+            'model': model, 'keywords_per_second': result['keywords_per_second'], 'agreement': result['agreement']
+        })
+        return result, decisions
+
+    def run(self, sample: List[Dict], models: Optional[List[str]] = None) -> Dict:
+        """
+        Measure every model on the sample and recommend one
+
+        Args:
+            sample: Keyword dictionaries ('title', optionally the labels
+                'relevant' and 'category' - see label_decision)
+            models: Models to compare (default: every installed model)
+
+        Returns:
+            The report: results per model (fastest first), 'recommended' model
+            (None if none reaches min_agreement) and its speedup over the reference
+
+        Raises:
+            ValueError: Ollama not reachable, a model not installed, or an empty sample
+        """
+        from ollama_client import OllamaClient
+        from ollama_client import model_installed
+
+        self._update(status='running', started_at=time.time())
+        try:
+            keywords = [str(keyword['title']) for keyword in sample]
+            if not keywords:
+                raise ValueError("The sample is empty")
+
+            available, installed = OllamaClient(self.ollama_url).status()
+            if not available:
+                raise ValueError(f"Ollama is not reachable at {self.ollama_url}")
+            models = list(dict.fromkeys(models or installed))
+            missing = [model for model in models if not model_installed(model, installed)]
+
+            labels = [label_decision(keyword, self.topics) for keyword in sample]
+            labeled = all(label is not None for label in labels)
+            if not labeled:
+                # The reference model runs first: its answers are what the others are compared with
+                if not model_installed(self.reference_model, installed):
+                    missing.append(self.reference_model)
+                models = [self.reference_model] + [model for model in models if model != self.reference_model]
+            if missing:
+                raise ValueError(f"Not installed in Ollama: {', '.join(missing)}")
+
+            reference = labels if labeled else None
+            results = []
+            self._update(models_total=len(models))
+            for model in models:
+                if self._cancel.is_set():
+                    break
+                self._update(model=model, keywords_done=0)
+                result, decisions = self.measure(model, keywords, reference)
+                if reference is None:
+                    # Keywords the reference did not get to (stopped, unusable) have no reference decision
+                    reference = decisions + [None] * (len(keywords) - len(decisions))
+                results.append(result)
+                self._update(models_done=len(results), results=list(results))
+
+            report = self.report(results, len(keywords), labeled)
+            self._update(status='cancelled' if self._cancel.is_set() else 'completed', model=None,
+                         report=report, finished_at=time.time())
+            return report
+        except Exception as e:
+            self._update(status='failed', model=None, error=str(e), finished_at=time.time())
+            raise
+
+    def report(self, results: List[Dict], sample_size: int, labeled: bool) -> Dict:
+        """Results sorted by throughput, with the recommendation"""
+        best = recommend(results, self.min_agreement)
+        baseline = next((result for result in results if result['model'] == self.reference_model), None)
+        speedup = None
+        if best and baseline and baseline['keywords_per_second']:
+            speedup = round(best['keywords_per_second'] / baseline['keywords_per_second'], 2)
+        return {
+            'topics': self.topics,
+            'topic_key': topic_key(self.topics),
+            'reference': 'labels' if labeled else self.reference_model,
+            'min_agreement': self.min_agreement,
+            'sample_size': sample_size,
+            'concurrency': self.concurrency,
+            'results': sorted(results, key=lambda result: result['keywords_per_second'] or 0, reverse=True),
+            'recommended': best['model'] if best else None,
+            'speedup_over_reference': speedup,
+            'tuned_at': time.time()
+        }
+
+
+class ModelChoices:
+    """
+    Model chosen per topic by tuning, in SQLite (read by the API and worker processes).
+
+    Usage:
+        choices = ModelChoices()
+        choices.apply(report)                # store report['recommended'] for its topics
+        choices.model_for(['Ys games'])      # None if the topic was never tuned
+    """
+
+    def __init__(self, db_path: Path = TUNING_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS model_choices (
+                    topic_key TEXT PRIMARY KEY,
+                    topics TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    reference TEXT NOT NULL,
+                    agreement REAL,
+                    keywords_per_second REAL,
+                    report TEXT NOT NULL,
+                    tuned_at REAL NOT NULL
+                )
+            """)
+        finally:
+            conn.close()
+
+    def apply(self, report: Dict) -> bool:
+        """
+        Use the recommended model of a tuning report for its topics from now on
+
+        Returns:
+            False if the report recommends no model (nothing is stored)
+        """
+        model = report.get('recommended')
+        if not model:
+            return False
+        best = next(result for result in report['results'] if result['model'] == model)
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO model_choices VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (report['topic_key'], json.dumps(report['topics']), model, report['reference'],
+                 best['agreement'], best['keywords_per_second'], json.dumps(report), report['tuned_at'])
+            )
+        finally:
+            conn.close()
+        return True
+
+    def model_for(self, topics: List[str]) -> Optional[str]:
+        """The tuned model for these topics (None if they were never tuned)"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT model FROM model_choices WHERE topic_key = ?", (topic_key(topics),)).fetchone()
+        finally:
+            conn.close()
+        return row['model'] if row else None
+
+    def remove(self, topics: List[str]) -> bool:
+        """Forget the tuned model of these topics (jobs use OLLAMA_MODEL again)"""
+        conn = self._connect()
+        try:
+            return conn.execute("DELETE FROM model_choices WHERE topic_key = ?", (topic_key(topics),)).rowcount > 0
+        finally:
+            conn.close()
+
+    def all(self) -> List[Dict]:
+        """Every stored choice (without the full reports)"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT topics, model, reference, agreement, keywords_per_second, tuned_at "
+                "FROM model_choices ORDER BY tuned_at DESC"
+            ).fetchall()
+        finally:
+            conn.close()
+        return [dict(row, topics=json.loads(row['topics'])) for row in rows]
+
+
+class TuningRuns:
+    """
+    State of the tuning runs started through the API, in SQLite (tuning.sqlite3).
+
+    Under gunicorn every API process has its own memory. The process that runs
+    a tuning writes its state here about once a second; GET/DELETE
+    /api/tune/<tune_id> can land on any process and read it from here.
+
+    Usage:
+        runs = TuningRuns()
+        runs.start(tune_id, tuner.state())    # False while another run is in progress
+        runs.save(tune_id, tuner.state())     # True once a cancel was requested
+        runs.get(tune_id)                     # latest state, or None
+        runs.request_cancel(tune_id)          # False if the run is unknown
+    """
+
+    def __init__(self, db_path: Path = TUNING_DB_PATH, stale_timeout: float = TUNING_STALE_TIMEOUT):
+        self.db_path = Path(db_path)
+        self.stale_timeout = stale_timeout
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tuning_runs (
+                    tune_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL
+                )
+            """)
+        finally:
+            conn.close()
+
+    def start(self, tune_id: str, state: Dict) -> bool:
+        """
+        Register a new run, unless another one is in progress
+
+        Measurements of two tunings at once would slow each other down. The
+        check and the insert are one transaction, so two API processes can
+        never both start a run.
+
+        Returns:
+            False if a run is already in progress (nothing is stored)
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            running = conn.execute(
+                "SELECT 1 FROM tuning_runs WHERE status IN ('pending', 'running') AND updated_at >= ?",
+                (time.time() - self.stale_timeout,)
+            ).fetchone()
+            if running is None:
+                conn.execute(
+                    "INSERT INTO tuning_runs (tune_id, status, state, updated_at) VALUES (?, ?, ?, ?)",
+                    (tune_id, state['status'], json.dumps(state), time.time())
+                )
+            conn.execute("COMMIT")
+            return running is None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def save(self, tune_id: str, state: Dict) -> bool:
+        """
+        Store the latest state of a run (called by the process that runs it)
+
+        Returns:
+            True if a cancel was requested (from any process)
+        """
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE tuning_runs SET status = ?, state = ?, updated_at = ? WHERE tune_id = ?",
+                (state['status'], json.dumps(state), time.time(), tune_id)
+            )
+            row = conn.execute("SELECT cancel_requested FROM tuning_runs WHERE tune_id = ?", (tune_id,)).fetchone()
+        finally:
+            conn.close()
+        return bool(row and row['cancel_requested'])
+
+    def get(self, tune_id: str) -> Optional[Dict]:
+        """Latest state of a run (None if unknown); a run whose process died is reported as failed"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT state, updated_at FROM tuning_runs WHERE tune_id = ?", (tune_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        state = json.loads(row['state'])
+        if state['status'] in ('pending', 'running') and row['updated_at'] < time.time() - self.stale_timeout:
+            state.update(status='failed', model=None, error="The process running the tuning stopped")
+        return state
+
+    def request_cancel(self, tune_id: str) -> bool:
+        """Ask the process running a tuning to stop it (it checks on its next state write)"""
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "UPDATE tuning_runs SET cancel_requested = 1 WHERE tune_id = ?", (tune_id,)
+            ).rowcount > 0
+        finally:
+            conn.close()
+
+
+def read_labeled_csv(filepath: str) -> Optional[List[Dict]]:
+    """Rows of a CSV with a "relevant" column (title, relevant, category), or None if it has no labels"""
+    with open(filepath, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        if 'title' not in (reader.fieldnames or []) or 'relevant' not in reader.fieldnames:
+            return None
+        return [{'title': row['title'], 'relevant': row['relevant'], 'category': row.get('category')}
+                for row in reader if row['title']]
+
+
+def print_report(report: Dict):
+    print(f"\n🎯 Topic: {report['topic_key']}   reference: {report['reference']}   "
+          f"sample: {report['sample_size']} keywords   target: {report['min_agreement']:.0%} agreement")
+    print(f"{'model':<28} {'status':<13} {'kw/s':>7} {'s/kw':>7} {'agree':>7} {'relev.':>7} {'categ.':>7}")
+    for result in report['results']:
+        def pct(value):
+            return '-' if value is None else f"{value:.0%}"
+        print(f"{result['model']:<28} {result['status']:<13} {result['keywords_per_second'] or 0:>7.2f} "
+              f"{result['seconds_per_keyword'] or 0:>7.2f} {pct(result['agreement']):>7} "
+              f"{pct(result['relevance_agreement']):>7} {pct(result['category_agreement']):>7}")
+    if report['recommended']:
+        speedup = f" ({report['speedup_over_reference']}x the reference)" if report['speedup_over_reference'] else ''
+        print(f"\n✅ Recommended: {report['recommended']}{speedup}")
+    else:
+        print(f"\n⚠️  No model reached {report['min_agreement']:.0%} agreement")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Find the fastest Ollama model that agrees with the reference")
+    parser.add_argument('input', help="Keyword CSV (title, views, views_per_year; optional labels: relevant, category)")
+    parser.add_argument('--topic', action='append', required=True, help="Topic (repeat for multi-topic jobs)")
+    parser.add_argument('--model', action='append', help="Model to compare (repeatable; default: all installed)")
+    parser.add_argument('--reference', default=OLLAMA_MODEL, help="Reference model for unlabeled samples (default %(default)s)")
+    parser.add_argument('--min-agreement', type=float, default=TUNING_MIN_AGREEMENT,
+                        help="Share of keywords that must get the reference decision (default %(default)s)")
+    parser.add_argument('--sample-size', type=int, default=TUNING_SAMPLE_SIZE, help="Keywords per model (default %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random sample")
+    parser.add_argument('--concurrency', type=int, default=1, help="Keywords classified in parallel (default 1)")
+    parser.add_argument('--threshold', type=int, default=DEFAULT_CONFIDENCE_THRESHOLD, help="Relevance confidence threshold")
+    parser.add_argument('--ollama-url', default=OLLAMA_BASE_URL, help="Ollama base URL (default %(default)s)")
+    parser.add_argument('--apply', action='store_true', help="Use the recommended model for this topic's jobs from now on")
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args()
+
+    from processing import load_keywords
+
+    rows = read_labeled_csv(args.input)
+    if rows is None:
+        rows, _ = load_keywords({'filepath': args.input}, {})
+    sample = sample_keywords(rows, args.sample_size, args.seed)
+
+    tuner = ModelTuner(args.topic, {'confidence_threshold': args.threshold}, args.ollama_url,
+                       args.reference, args.min_agreement, args.concurrency)
+    try:
+        report = tuner.run(sample, args.model)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(2)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.apply and ModelChoices().apply(report):
+        print(f"💾 Jobs for \"{report['topic_key']}\" now use {report['recommended']}")
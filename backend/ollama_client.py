@@ -3,11 +3,32 @@ Ollama API Client
 Handles communication with the local Ollama service
 """
 
-import requests
 import json
+import threading
 import time
-from typing import Dict, Any, Optional
-from config import OLLAMA_BASE_URL, OLLAMA_MODEL
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlparse
+from config import OLLAMA_BASE_URL, OLLAMA_MODEL, RESPONSE_CACHE_SIZE, OLLAMA_TIMING_FIELDS
+from log_setup import get_logger
+from metrics import (
+    OLLAMA_REQUEST_SECONDS,
+    OLLAMA_TOKENS_PER_SECOND,
+    OLLAMA_EVAL_TOKENS,
+    OLLAMA_RETRIES,
+    OLLAMA_TIMEOUTS,
+    OLLAMA_ERRORS,
+    OLLAMA_IN_FLIGHT,
+    PARSE_FAILURES,
+    CACHE_REQUESTS
+)
+
+logger = get_logger('ollama')
+
+
+def model_installed(model: str, installed: list) -> bool:
+    """True if Ollama has the model ("llama3.1" also matches "llama3.1:latest")"""
+    return model in installed or f"{model}:latest" in installed
 
 
 class OllamaClient:
@@ -29,6 +50,15 @@ class OllamaClient:
         self.model = model
         # Full API endpoint for generating responses
         self.api_url = f"{base_url}/api/generate"
+        # Host label used in metrics (e.g. "localhost:11434")
+        self.host = urlparse(base_url).netloc or base_url
+        
+        # Optional LRU cache of answers for identical prompts (off by default:
+        # a cached answer replaces a new, sampled one). Only answers that parsed
+        # as JSON are kept; the classifier discards answers it cannot use.
+        self.cache_size = RESPONSE_CACHE_SIZE
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
         
     def is_available(self) -> bool:
         """
@@ -40,6 +70,8 @@ class OllamaClient:
         Returns:
             True if Ollama is running, False otherwise
         """
+        import requests  # Imported on first use (keeps startup fast)
+        
         try:
             # Try to get list of available models from Ollama
             response = requests.get(f"{self.base_url}/api/tags", timeout=5)
@@ -51,16 +83,57 @@ class OllamaClient:
     
     def list_models(self) -> list:
         """List available models"""
+        return self.status()[1]
+    
+    def status(self, timeout: float = 5) -> Tuple[bool, list]:
+        """
+        Availability and installed models with ONE request to Ollama
+        
+        Args:
+            timeout: Seconds to wait for Ollama
+        
+        Returns:
+            Tuple of (is running, list of model names)
+        """
+        import requests
+        
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = requests.get(f"{self.base_url}/api/tags", timeout=timeout)
             if response.status_code == 200:
                 data = response.json()
-                return [model['name'] for model in data.get('models', [])]
-            return []
+                return True, [model['name'] for model in data.get('models', [])]
+            return False, []
         except:
-            return []
+            return False, []
     
-    def generate(self, prompt: str, max_retries: int = 3) -> Optional[str]:
+    def running_models(self, timeout: float = 5) -> Optional[list]:
+        """
+        Models Ollama has loaded right now (/api/ps) and where they live
+        
+        Returns:
+            List of {'name', 'size', 'size_vram', 'expires_at'} (bytes; size_vram
+            below size means part of the model runs on the CPU), or None if
+            Ollama did not answer
+        """
+        import requests
+        
+        try:
+            response = requests.get(f"{self.base_url}/api/ps", timeout=timeout)
+            if response.status_code != 200:
+                return None
+            return [
+                {
+                    'name': model.get('name'),
+                    'size': model.get('size', 0),
+                    'size_vram': model.get('size_vram', 0),
+                    'expires_at': model.get('expires_at')
+                }
+                for model in response.json().get('models', [])
+            ]
+        except Exception:
+            return None
+    
+    def generate(self, prompt: str, max_retries: int = 3, stats: Optional[Dict[str, Any]] = None) -> Optional[str]:
         """
         Send a prompt to Llama 3.1 and get a text response.
         
@@ -71,6 +144,12 @@ class OllamaClient:
         Args:
             prompt: The question/instructions to send to the AI
             max_retries: How many times to retry if it fails (default: 3)
+            stats: Optional dictionary that receives timing details:
+                - http: seconds spent in HTTP round-trips (all attempts)
+                - attempts: number of HTTP requests made
+                - Ollama's own fields (nanoseconds / token counts): total_duration,
+                  load_duration, prompt_eval_count, prompt_eval_duration,
+                  eval_count, eval_duration
             
         Returns:
             The AI's response as text, or None if all retries failed
@@ -85,7 +164,18 @@ class OllamaClient:
             }
         }
         
+        import requests
+        
+        if stats is not None:
+            stats.setdefault('http', 0.0)
+            stats['attempts'] = 0
+        
         for attempt in range(max_retries):
+            if attempt > 0:
+                OLLAMA_RETRIES.inc(model=self.model, host=self.host)
+            
+            request_start = time.time()
+            OLLAMA_IN_FLIGHT.inc(host=self.host)
             try:
                 response = requests.post(
                     self.api_url,
@@ -95,20 +185,68 @@ class OllamaClient:
                 
                 if response.status_code == 200:
                     data = response.json()
+                    OLLAMA_REQUEST_SECONDS.observe(time.time() - request_start, model=self.model, host=self.host, outcome='ok')
+                    self._record_token_stats(data)
+                    if stats is not None:
+                        for field in OLLAMA_TIMING_FIELDS:
+                            if field in data:
+                                stats[field] = data[field]
                     return data.get('response', '').strip()
                 else:
-                    print(f"Ollama API error: {response.status_code}")
+                    OLLAMA_REQUEST_SECONDS.observe(time.time() - request_start, model=self.model, host=self.host, outcome='error')
+                    OLLAMA_ERRORS.inc(model=self.model, host=self.host, reason=f"http_{response.status_code}")
+                    logger.warning("Ollama API error", extra={
+                        'host': self.host, 'model': self.model, 'attempt': attempt + 1,
+                        'status_code': response.status_code,
+                        'duration_ms': round((time.time() - request_start) * 1000, 1)
+                    })
                     
             except requests.exceptions.Timeout:
-                print(f"Request timeout (attempt {attempt + 1}/{max_retries})")
+                OLLAMA_REQUEST_SECONDS.observe(time.time() - request_start, model=self.model, host=self.host, outcome='timeout')
+                OLLAMA_TIMEOUTS.inc(model=self.model, host=self.host)
+                logger.warning(f"Request timeout (attempt {attempt + 1}/{max_retries})", extra={
+                    'host': self.host, 'model': self.model, 'attempt': attempt + 1,
+                    'duration_ms': round((time.time() - request_start) * 1000, 1)
+                })
             except Exception as e:
-                print(f"Error calling Ollama: {e}")
+                OLLAMA_REQUEST_SECONDS.observe(time.time() - request_start, model=self.model, host=self.host, outcome='error')
+                OLLAMA_ERRORS.inc(model=self.model, host=self.host, reason=type(e).__name__)
+                logger.warning(f"Error calling Ollama: {e}", extra={
+                    'host': self.host, 'model': self.model, 'attempt': attempt + 1,
+                    'duration_ms': round((time.time() - request_start) * 1000, 1)
+                })
+            finally:
+                OLLAMA_IN_FLIGHT.dec(host=self.host)
+                if stats is not None:
+                    stats['http'] += time.time() - request_start
+                    stats['attempts'] += 1
             
             if attempt < max_retries - 1:
                 time.sleep(1)  # Wait before retry
         
         return None
     
+    def _record_token_stats(self, data: Dict[str, Any]):
+        """Record generation speed from Ollama's eval_count / eval_duration (nanoseconds)"""
+        eval_count = data.get('eval_count')
+        eval_duration = data.get('eval_duration')
+        if eval_count and eval_duration:
+            OLLAMA_EVAL_TOKENS.inc(eval_count, model=self.model, host=self.host)
+            OLLAMA_TOKENS_PER_SECOND.observe(eval_count / (eval_duration / 1e9), model=self.model, host=self.host)
+    
+    def discard_cached(self, prompt: str):
+        """Forget the cached answer of a prompt (the caller could not use it - the next call asks again)"""
+        if self.cache_size:
+            with self._cache_lock:
+                self._cache.pop((self.model, prompt), None)
+    
+    def _cache_store(self, key, text: str):
+        with self._cache_lock:
+            self._cache[key] = text
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+    
     def parse_json_response(self, response: str) -> Optional[Dict[str, Any]]:
         """
         Parse JSON from Llama's response
@@ -133,16 +271,44 @@ class OllamaClient:
                 except json.JSONDecodeError:
                     pass
         
+        PARSE_FAILURES.inc(stage='json')
         return None
     
-    def generate_json(self, prompt: str, max_retries: int = 3) -> Optional[Dict[str, Any]]:
+    def generate_json(self, prompt: str, max_retries: int = 3,
+                      stats: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
         """
         Generate a response and parse it as JSON
         Returns parsed JSON dict or None if failed
+        
+        If `stats` is given it receives the timings of generate() plus
+        'parse' (seconds spent parsing the JSON) and 'cache_hit' (True if
+        the answer came from the response cache).
+        
+        With the response cache on (cache_size > 0), answers that parsed are
+        kept; garbled or truncated answers are never cached, so retries and
+        later jobs ask Ollama again.
         """
-        response = self.generate(prompt, max_retries)
+        cache_key = (self.model, prompt)
+        if self.cache_size:
+            with self._cache_lock:
+                cached = self._cache.get(cache_key)
+                if cached is not None:
+                    self._cache.move_to_end(cache_key)
+            CACHE_REQUESTS.inc(cache='ollama_response', result='hit' if cached is not None else 'miss')
+            if cached is not None:
+                if stats is not None:
+                    stats['cache_hit'] = True
+                return json.loads(cached)
+        
+        response = self.generate(prompt, max_retries, stats)
         if response:
-            return self.parse_json_response(response)
+            parse_start = time.time()
+            parsed = self.parse_json_response(response)
+            if stats is not None:
+                stats['parse'] = stats.get('parse', 0.0) + time.time() - parse_start
+            if self.cache_size and isinstance(parsed, dict):
+                self._cache_store(cache_key, json.dumps(parsed))
+            return parsed
         return None
 
 
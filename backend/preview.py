@@ -0,0 +1,316 @@
+"""
+Preview Runs
+Classify a small stratified sample first and project what the full run will give
+
+A 100k-keyword job runs for hours. A preview ("preview": true on /api/process)
+classifies PREVIEW_SAMPLE_SIZE keywords in a few minutes and projects from
+them: acceptance rate (with a 95% interval), category mix, throughput and the
+duration of the full run.
+
+The sample is stratified, so small groups of keywords are not missed by chance:
+- views bucket: 0, 1-9, 10-99, ... (powers of ten)
+- word count: 1, 2, 3, 4-5, 6+
+- intent marker: question ("how to ..."), comparison ("... vs ...", "best ...") or none
+
+Every stratum gets its share of the sample (and at least one keyword), and
+the projection weights each stratum by its size in the whole input.
+
+The answers of the preview are kept (data/previews/). A full run with the same
+settings (model, topics, threshold, categories, prompts) on the same input
+reuses them instead of asking Ollama again, so no work is thrown away.
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import (
+    OLLAMA_MODEL,
+    DEFAULT_CONFIDENCE_THRESHOLD,
+    DEFAULT_CATEGORIES,
+    DEFAULT_RELEVANCE_PROMPT,
+    DEFAULT_CATEGORY_PROMPT,
+    PREVIEW_FOLDER,
+    RETENTION_MAX_AGE_HOURS
+)
+
+QUESTION_PATTERN = re.compile(r'^(how|what|why|when|where|which|who|is|are|can|does|do|wie|was|warum|wann|wo)\b', re.I)
+COMPARISON_PATTERN = re.compile(r'\b(vs\.?|versus|best|top|review|reviews|compare|comparison|vergleich|test)\b', re.I)
+
+# 1.96 standard errors = 95% interval
+Z_95 = 1.96
+
+
+def stratum_of(keyword_data: Dict) -> str:
+    """The stratum of a keyword: views bucket, word count and intent marker"""
+    try:
+        views = float(keyword_data.get('views') or 0)
+    except (TypeError, ValueError):
+        views = 0.0
+    if math.isnan(views) or views < 1:
+        views_bucket = '0'
+    else:
+        views_bucket = f"1e{min(int(math.log10(views)), 7)}"
+
+    title = str(keyword_data.get('title', ''))
+    words = len(title.split())
+    words_bucket = '1' if words <= 1 else '2' if words == 2 else '3' if words == 3 else '4-5' if words <= 5 else '6+'
+
+    if QUESTION_PATTERN.search(title):
+        marker = 'question'
+    elif COMPARISON_PATTERN.search(title):
+        marker = 'comparison'
+    else:
+        marker = 'plain'
+    return f"views={views_bucket}|words={words_bucket}|{marker}"
+
+
+def allocate(counts: Dict[str, int], size: int) -> Dict[str, int]:
+    """
+    Keywords per stratum: proportional to the stratum sizes (largest remainder),
+    with at least one keyword for every stratum while the sample size allows it
+    """
+    total = sum(counts.values())
+    if total <= size:
+        return dict(counts)
+
+    quotas = {stratum: size * count / total for stratum, count in counts.items()}
+    allocation = {stratum: int(quota) for stratum, quota in quotas.items()}
+    by_remainder = sorted(counts, key=lambda stratum: quotas[stratum] - allocation[stratum], reverse=True)
+    for stratum in by_remainder[:size - sum(allocation.values())]:
+        allocation[stratum] += 1
+
+    # Strata without a keyword take one from the stratum with the most
+    for stratum in sorted(counts, key=counts.get, reverse=True):
+        if allocation[stratum]:
+            continue
+        donor = max(allocation, key=allocation.get)
+        if allocation[donor] <= 1:
+            break
+        allocation[donor] -= 1
+        allocation[stratum] = 1
+    return allocation
+
+
+def stratified_sample(keywords: Iterable[Dict], size: int, seed: int = 0) -> Tuple[List[Dict], Dict[str, int]]:
+    """
+    Stratified random sample of the keywords, in one pass over the input
+
+    Every stratum keeps a random reservoir of up to `size` keywords while the
+    input streams by; once all strata are counted, each gets its allocation.
+    The sample comes back shuffled, so a preview stopped by its deadline still
+    covers all strata.
+
+    Returns:
+        Tuple of (sampled keyword dictionaries with an added 'stratum' key,
+        number of input keywords per stratum)
+    """
+    rng = random.Random(seed)
+    counts = {}
+    reservoirs = {}
+    for keyword_data in keywords:
+        stratum = stratum_of(keyword_data)
+        seen = counts.get(stratum, 0)
+        counts[stratum] = seen + 1
+        reservoir = reservoirs.setdefault(stratum, [])
+        if seen < size:
+            reservoir.append(keyword_data)
+        else:
+            slot = rng.randint(0, seen)
+            if slot < size:
+                reservoir[slot] = keyword_data
+
+    sample = []
+    for stratum, take in allocate(counts, size).items():
+        for keyword_data in rng.sample(reservoirs[stratum], take):
+            sample.append(dict(keyword_data, stratum=stratum))
+    rng.shuffle(sample)
+    return sample, counts
+
+
+def project(rows: List[Tuple[str, Dict]], strata: Dict[str, int], topics: List[str]) -> Dict:
+    """
+    Project acceptance and category mix of the whole input from the sample
+
+    Stratified estimate: the rate of each stratum, weighted by that stratum's
+    share of the input. Strata the preview did not reach (deadline) are left
+    out and reported as uncovered.
+
+    Args:
+        rows: (stratum, classification result) of every classified sample keyword
+        strata: Number of input keywords per stratum (from stratified_sample)
+        topics: Topics of the job (multi-topic jobs get a rate per topic)
+    """
+    groups = {}
+    for stratum, result in rows:
+        groups.setdefault(stratum, []).append(result)
+
+    covered = sum(strata[stratum] for stratum in groups)
+    total = sum(strata.values())
+    acceptance = variance = 0.0
+    categories = {}
+    topic_acceptance = {topic: 0.0 for topic in topics} if len(topics) > 1 else {}
+    failed = 0
+    for stratum, results in groups.items():
+        weight = strata[stratum] / covered
+        n = len(results)
+        accepted = [result for result in results if result['relevance_accepted']]
+        rate = len(accepted) / n
+        acceptance += weight * rate
+        variance += weight ** 2 * rate * (1 - rate) / n
+        for result in accepted:
+            categories[result['category']] = categories.get(result['category'], 0) + weight / n
+        for topic in topic_acceptance:
+            hits = sum(1 for result in results if result.get('topic_results', {}).get(topic, {}).get('relevance_accepted'))
+            topic_acceptance[topic] += weight * hits / n
+        failed += sum(1 for result in results if result.get('failed'))
+
+    margin = Z_95 * math.sqrt(variance)
+    projection = {
+        'sample_size': len(rows),
+        'input_rows': total,
+        'strata': len(strata),
+        'strata_sampled': len(groups),
+        'uncovered_share': round(1 - covered / total, 4) if total else 0,
+        'failed_keywords': failed,
+        'acceptance_rate': round(acceptance, 4),
+        'acceptance_interval': [round(max(0.0, acceptance - margin), 4), round(min(1.0, acceptance + margin), 4)],
+        'projected_accepted': round(acceptance * total),
+        # Share of each category among the accepted keywords
+        'category_mix': {
+            category: round(share / acceptance, 4)
+            for category, share in sorted(categories.items(), key=lambda item: item[1], reverse=True)
+        } if acceptance else {}
+    }
+    if topic_acceptance:
+        projection['topic_acceptance_rates'] = {topic: round(rate, 4) for topic, rate in topic_acceptance.items()}
+    return projection
+
+
+def settings_fingerprint(settings: Dict) -> str:
+    """Everything that changes an answer (same fingerprint = preview answers can be reused)"""
+    relevant = {
+        'model': settings.get('model') or OLLAMA_MODEL,
+        'topics': settings.get('topics'),
+        'confidence_threshold': settings.get('confidence_threshold', DEFAULT_CONFIDENCE_THRESHOLD),
+        'categories': settings.get('categories', DEFAULT_CATEGORIES),
+        'relevance_prompt': settings.get('relevance_prompt', DEFAULT_RELEVANCE_PROMPT),
+        'category_prompt': settings.get('category_prompt', DEFAULT_CATEGORY_PROMPT)
+    }
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def source_key(source: Dict) -> str:
+    """Which input a job reads (previews are only found for the same input)"""
+    if source.get('upload_id'):
+        return f"upload:{source['upload_id']}"
+    if 'manual_input' in source:
+        return 'manual:' + hashlib.sha1(str(source['manual_input']).encode('utf-8')).hexdigest()
+    return f"file:{source.get('filepath')}"
+
+
+class PreviewStore:
+    """
+    Answers and projections of preview runs, one JSON file per preview.
+
+    Next to them, one small "<key>.latest" file per input and settings holds
+    the id of the newest matching preview, so find() reads one file instead
+    of every stored preview.
+
+    Usage:
+        store = PreviewStore()
+        store.save(job_id, fingerprint, source_key, projection, classifier.sample_results)
+        preview_id = store.find(source_key, fingerprint)   # latest matching preview (or None)
+        classifier.reuse_results(store.known_results(preview_id))
+    """
+
+    def __init__(self, folder: Path = PREVIEW_FOLDER, max_age_hours: float = RETENTION_MAX_AGE_HOURS):
+        self.folder = Path(folder)
+        self.max_age_hours = max_age_hours
+
+    def _path(self, preview_id: str) -> Path:
+        if not re.fullmatch(r'[0-9a-f-]{8,64}', str(preview_id)):
+            raise ValueError("Invalid preview_id")
+        return self.folder / f"{preview_id}.json"
+
+    def _latest_path(self, source: str, fingerprint: str) -> Path:
+        key = hashlib.sha1(f"{source}\n{fingerprint}".encode('utf-8')).hexdigest()
+        return self.folder / f"{key}.latest"
+
+    def save(self, preview_id: str, fingerprint: str, source: str, projection: Dict,
+             results: Dict[Tuple[str, Tuple[str, ...]], Dict]) -> Path:
+        """Store a finished preview (written atomically, old previews are removed)"""
+        self.folder.mkdir(parents=True, exist_ok=True)
+        path = self._path(preview_id)
+        payload = {
+            'preview_id': preview_id,
+            'fingerprint': fingerprint,
+            'source': source,
+            'created_at': time.time(),
+            'projection': projection,
+            'results': [
+                {'keyword': keyword, 'topics': list(topics), 'result': result}
+                for (keyword, topics), result in results.items()
+            ]
+        }
+        temp = path.with_suffix('.json.part')
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, default=str)
+        os.replace(temp, path)
+
+        latest = self._latest_path(source, fingerprint)
+        temp = latest.with_suffix('.latest.part')
+        temp.write_text(preview_id, encoding='utf-8')
+        os.replace(temp, latest)
+        self.prune()
+        return path
+
+    def load(self, preview_id: str) -> Optional[Dict]:
+        """
+        A stored preview (None if it does not exist or was removed)
+
+        Raises:
+            ValueError: if preview_id is not a valid id
+        """
+        path = self._path(preview_id)
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def find(self, source: str, fingerprint: str) -> Optional[str]:
+        """The most recent preview of this input with the same settings (None if there is none)"""
+        try:
+            preview_id = self._latest_path(source, fingerprint).read_text(encoding='utf-8').strip()
+            # The preview itself may have been pruned since
+            return preview_id if self._path(preview_id).exists() else None
+        except (OSError, ValueError):
+            return None
+
+    def known_results(self, preview_id: str) -> Dict[Tuple[str, Tuple[str, ...]], Dict]:
+        """The preview's answers in the form KeywordClassifier.reuse_results expects"""
+        try:
+            payload = self.load(preview_id) or {}
+        except ValueError:
+            payload = {}
+        return {
+            (item['keyword'], tuple(item['topics'])): item['result']
+            for item in payload.get('results', [])
+        }
+
+    def prune(self):
+        """Remove previews (and pointers to them) older than the retention age"""
+        cutoff = time.time() - self.max_age_hours * 3600
+        for path in self.folder.glob('*'):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,896 @@
+"""
+Job Processing
+Runs a classification job from start to finish (classify -> export -> statistics)
+
+This module has no Flask dependency, so the same code runs in the Flask
+process (thread mode) and in separate worker processes (queue mode).
+"""
+
+import logging
+import time
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ollama_client import OllamaClient
+from classifier import KeywordClassifier
+from csv_processor import CSVProcessor
+from log_setup import get_logger, set_log_context
+from metrics import KEYWORDS_CLASSIFIED
+from profiling import JobProfiler
+from concurrency import AdaptiveConcurrencyController, call_outcome
+from throughput_history import ThroughputHistory, format_duration
+from preview import PreviewStore, stratified_sample, project, settings_fingerprint
+from upload_store import UploadStore
+from health_monitor import OllamaHealthMonitor
+from config import (
+    DEFAULT_CONFIDENCE_THRESHOLD,
+    DEFAULT_CATEGORIES,
+    DEFAULT_RELEVANCE_PROMPT,
+    DEFAULT_CATEGORY_PROMPT,
+    DEFAULT_CONCURRENCY,
+    MAX_CONCURRENCY,
+    ADAPTIVE_CONCURRENCY_START,
+    ETA_WINDOW,
+    ETA_PRIOR_WEIGHT,
+    OLLAMA_TIMING_FIELDS,
+    PROFILE_ALL_JOBS,
+    HEALTH_JOB_WAIT,
+    HEALTH_WAIT_HEARTBEAT,
+    DISTRIBUTED_DEFAULT,
+    SHARD_SIZE,
+    SHARD_WINDOW,
+    SHARD_POLL_INTERVAL,
+    SHARD_IDLE_TIMEOUT,
+    DEFAULT_EXPORT_FORMAT,
+    PREVIEW_SAMPLE_SIZE,
+    PREVIEW_DEADLINE_MINUTES
+)
+
+if TYPE_CHECKING:
+    from shard_store import ShardStore
+
+logger = get_logger('processing')
+
+# Local stages measured per keyword (seconds)
+LOCAL_STAGES = ['queue_wait', 'prompt_render', 'http', 'parse', 'keyword_total']
+
+
+def load_keywords(source: Dict, settings: Dict) -> Tuple[Iterable[Dict], Dict]:
+    """
+    Open the keywords of a job (stored upload, CSV file or manual input)
+
+    File-ordered jobs are streamed batch by batch, so memory stays flat no
+    matter how large the file is. Value-ordered jobs (order_by != 'file') need
+    all rows to sort them, so those are loaded into one DataFrame.
+
+    Args:
+        source: {'upload_id': ...}, {'filepath': ...} (CLI/internal only)
+            or {'manual_input': ...}
+        settings: Job settings (order_by, order_expression)
+
+    Returns:
+        Tuple of (keywords iterable, input totals {'rows', 'views_total', 'views_per_year_total'})
+
+    Raises:
+        ValueError: if the input is invalid or empty
+    """
+    processor = CSVProcessor()
+    order_by = settings.get('order_by', 'file') or 'file'
+
+    if 'upload_id' in source:
+        # Parsed once at upload time - just memory-map it
+        store = UploadStore()
+        meta = store.get(source['upload_id'])
+        if meta is None:
+            raise ValueError("Upload not found (upload the file again)")
+
+        totals = {
+            'rows': meta['rows'],
+            'views_total': meta['views_total'],
+            'views_per_year_total': meta['views_per_year_total'],
+            'title_chars_mean': meta.get('title_chars_mean')
+        }
+        if order_by == 'file':
+            return store.iter_keywords(source['upload_id']), totals
+
+        processor.input_data = store.load_dataframe(source['upload_id'])
+    elif 'filepath' in source:
+        filepath = source['filepath']
+        is_valid, message = processor.validate_header(filepath)
+        if not is_valid:
+            raise ValueError(message)
+
+        if order_by == 'file':
+            totals = processor.scan_csv(filepath)
+            if not totals['rows']:
+                raise ValueError("No keywords to process")
+            return processor.iter_keywords(filepath), totals
+
+        success, message, df = processor.load_csv(filepath)
+        if not success:
+            raise ValueError(message)
+    elif 'manual_input' in source:
+        processor.parse_manual_input(source['manual_input'])
+    else:
+        raise ValueError("No keywords provided")
+
+    processor.order_keywords(order_by, settings.get('order_expression'))
+    totals = processor.get_input_totals()
+    if not totals['rows']:
+        raise ValueError("No keywords to process")
+    return processor.iter_loaded_keywords(), totals
+
+
+class ProcessingJob:
+    def __init__(self, job_id, topic, keywords, settings: Optional[Dict] = None,
+                 input_totals: Optional[Dict] = None):
+        self.job_id = job_id
+        self.topic = topic
+        # Any iterable of keyword dictionaries (lists or streaming generators)
+        self.keywords = keywords
+        # Keyword count and view totals of the whole input (for progress and coverage)
+        self.input_totals = input_totals or {'rows': len(keywords)}
+        # Per-job settings (threshold, categories, prompts) sent with /api/process
+        self.settings = settings or {}
+        self.status = 'pending'  # pending, queued, processing, completed, failed
+        self.progress = 0
+        self.total = self.input_totals['rows']
+        self.current_keyword = ''
+        self.current_result = None  # Latest keyword result for live console
+        self.results = []
+        self.start_time = None
+        self.processing_times = []  # Track time per keyword for estimation
+        self.stage_totals = {}  # Summed per-stage timings (local stages + Ollama fields)
+        self.error = None
+        self.accepted_file = None
+        self.rejected_file = None
+        self.topic_files = {}  # Multi-topic jobs: topic -> accepted file
+        self.summary_file = None
+        self.profile_file = None  # Collapsed-stack profile (profiled jobs only)
+        self.statistics = {}
+        self.running_statistics = None  # Live RunningStatistics of the job's processor
+        self.result_store = None  # Compact result rows of the job (ResultStore, for paging)
+        self.concurrency_controller = None  # "concurrency": "auto" jobs (AdaptiveConcurrencyController)
+        self.estimate = None  # Duration estimate from earlier jobs (ThroughputHistory.estimate)
+        self.completion_times = deque(maxlen=ETA_WINDOW)  # When the most recent keywords finished
+        self.first_result_time = None
+        self.failed_keywords = 0  # Keywords without a usable answer from the model
+        self.title_chars = 0  # Summed keyword length (recorded in the throughput history)
+        self.stopped_early = False  # True if the deadline/budget ended the job
+        self.stop_reason = None
+        self.upload_id = None  # Upload the keywords came from (kept while the job runs, see retention.py)
+        self.waiting_for_ollama = False  # Paused because the health monitor sees Ollama down
+        self.shard_state = None  # Distributed jobs: shards pending/leased/done and active workers
+        self.preview = None  # Preview jobs: projection of the full run (see preview.py)
+        self.reused_keywords = 0  # Keywords answered from an earlier preview
+        self.reusable_keywords = 0  # Answers of an earlier preview this job may reuse
+
+    def get_progress(self) -> Dict:
+        """
+        Build the progress snapshot returned by /api/progress
+
+        In queue mode this same dictionary is written to the shared job store,
+        so every API worker returns exactly what the job's worker process sees.
+        """
+        # Calculate time estimate
+        avg_time_per_keyword = None
+        if self.processing_times and self.progress > 0:
+            avg_time_per_keyword = sum(self.processing_times) / len(self.processing_times)
+        time_remaining, eta_source = self.estimate_remaining()
+
+        return {
+            'status': self.status,
+            'progress': self.progress,
+            'total': self.total,
+            'current_keyword': self.current_keyword,
+            'current_result': self.current_result,  # Latest result for console
+            'percentage': round((self.progress / self.total * 100), 2) if self.total > 0 else 0,
+            'time_remaining': round(time_remaining) if time_remaining else None,
+            'eta_source': eta_source,  # history, measured or blended (see estimate_remaining)
+            'estimate': self.estimate,
+            'avg_time_per_keyword': round(avg_time_per_keyword, 2) if avg_time_per_keyword else None,
+            'stopped_early': self.stopped_early,
+            'stop_reason': self.stop_reason,
+            'waiting_for_ollama': self.waiting_for_ollama,
+            'shards': self.shard_state,
+            'preview': bool(self.settings.get('preview')),
+            'reused_keywords': self.reused_keywords,
+            # Acceptance rate, category mix, score histogram so far (kept up to date per result)
+            'statistics': self.running_statistics.as_dict() if self.running_statistics else None,
+            # Parallel Ollama calls (with "auto": the controller's limit, latency and adjustments)
+            'concurrency': self.concurrency_state(),
+            # Downloadable while the job runs (snapshot of the rows written so far)
+            'accepted_file': self.accepted_file,
+            'rejected_file': self.rejected_file
+        }
+
+    def get_results(self) -> Dict:
+        """Build the payload returned by /api/results once the job is completed"""
+        return {
+            'status': 'completed',
+            'statistics': self.statistics,
+            'accepted_file': self.accepted_file,
+            'rejected_file': self.rejected_file,
+            'topic_files': self.topic_files,
+            'summary_file': self.summary_file,
+            'profile_file': self.profile_file,
+            'stopped_early': self.stopped_early,
+            'stop_reason': self.stop_reason,
+            'preview': self.preview,
+            'reused_keywords': self.reused_keywords
+        }
+
+    def distributed(self) -> bool:
+        """True if shard workers on other machines classify this job (see shard_store.py; never for previews)"""
+        return bool(self.settings.get('distributed', DISTRIBUTED_DEFAULT)) and not self.settings.get('preview')
+
+    def adaptive_concurrency(self) -> bool:
+        """True if the job tunes its concurrency while it runs ("concurrency": "auto")"""
+        return str(self.settings.get('concurrency')).lower() == 'auto'
+
+    def concurrency(self) -> int:
+        """Number of keywords classified in parallel for this job (right now)"""
+        if self.concurrency_controller is not None:
+            return self.concurrency_controller.limit
+        if self.adaptive_concurrency():
+            return ADAPTIVE_CONCURRENCY_START
+        try:
+            concurrency = int(self.settings.get('concurrency') or DEFAULT_CONCURRENCY)
+        except (TypeError, ValueError):
+            concurrency = DEFAULT_CONCURRENCY
+        return max(1, min(MAX_CONCURRENCY, concurrency))
+
+    def estimate_remaining(self) -> Tuple[Optional[float], Optional[str]]:
+        """
+        Seconds until the job is done, and what the figure is based on
+
+        - before the first results: the estimate from earlier jobs ("history")
+        - while running: the wall-clock rate of the most recent keywords, which
+          already reflects the concurrency in use (also when "auto" changes it)
+          and leaves out the slow start (model loading) - blended with the
+          historical rate until enough keywords are measured ("blended")
+        """
+        # Keywords answered from a preview take no time
+        remaining = self.total - self.progress - max(0, self.reusable_keywords - self.reused_keywords)
+        remaining = max(0, remaining)
+        prior_rate = (self.estimate or {}).get('keywords_per_second')
+
+        times = self.completion_times
+        measured_rate = None
+        if len(times) >= 2 and times[-1] > times[0]:
+            measured_rate = (len(times) - 1) / (times[-1] - times[0])
+
+        if measured_rate is None:
+            if not prior_rate:
+                return None, None
+            warmup = (self.estimate.get('warmup_seconds') or 0) if not self.progress else 0
+            return remaining / prior_rate + warmup, 'history'
+
+        if not prior_rate:
+            return remaining / measured_rate, 'measured'
+
+        measured = len(times) - 1
+        rate = (ETA_PRIOR_WEIGHT * prior_rate + measured * measured_rate) / (ETA_PRIOR_WEIGHT + measured)
+        return remaining / rate, 'blended'
+
+    def history_record(self, model: str, host: str) -> Optional[Dict]:
+        """This job's throughput figures for ThroughputHistory.record (None if too few calls)"""
+        totals = self.stage_totals
+        calls = totals.get('http_n', 0)
+        if calls < 5 or not self.start_time:
+            return None
+
+        def per_second(count_field, duration_field):
+            duration = totals.get(duration_field, 0) / 1e9
+            return totals.get(count_field, 0) / duration if duration > 0 else None
+
+        def mean(field):
+            n = totals.get(f'{field}_n', 0)
+            return totals.get(field, 0) / n if n else None
+
+        return {
+            'model': model,
+            'host': host,
+            'concurrency': self.concurrency(),
+            'keywords': self.progress,
+            'calls': calls,
+            'duration_seconds': time.time() - self.start_time,
+            'call_seconds': totals['http'] / calls,
+            'first_result_seconds': self.first_result_time - self.start_time if self.first_result_time else None,
+            'prompt_tokens': mean('prompt_eval_count'),
+            'eval_tokens': mean('eval_count'),
+            'tokens_per_second': per_second('eval_count', 'eval_duration'),
+            'prompt_tokens_per_second': per_second('prompt_eval_count', 'prompt_eval_duration'),
+            'title_chars': self.title_chars / self.progress if self.progress else None,
+            'parse_failure_rate': self.failed_keywords / self.progress if self.progress else None
+        }
+
+    def concurrency_state(self) -> Dict:
+        """Concurrency settings/controller state for progress and metrics"""
+        if self.concurrency_controller is not None:
+            return self.concurrency_controller.state()
+        return {'mode': 'fixed', 'limit': self.concurrency()}
+
+    def record_timings(self, timings: Dict):
+        """Add one keyword's timings to the job totals"""
+        totals = self.stage_totals
+        for stage in LOCAL_STAGES + OLLAMA_TIMING_FIELDS:
+            value = timings.get(stage)
+            if value is not None:
+                totals[stage] = totals.get(stage, 0) + value
+                totals[f'{stage}_n'] = totals.get(f'{stage}_n', 0) + 1
+
+    def get_timing_summary(self) -> Dict:
+        """
+        Where did the time go? Mean per keyword for every stage (milliseconds)
+
+        Local stages (queue wait, prompt rendering, HTTP, JSON parsing) are
+        measured by us; prompt eval / generation / model load come from Ollama.
+        "overhead" is everything that is not Ollama's own total_duration.
+        """
+        totals = self.stage_totals
+
+        def mean(stage, scale=1000):
+            n = totals.get(f'{stage}_n', 0)
+            return round(totals.get(stage, 0) / n * scale, 2) if n else None
+
+        summary = {f'{stage}_ms': mean(stage) for stage in LOCAL_STAGES}
+        for field in ('total_duration', 'load_duration', 'prompt_eval_duration', 'eval_duration'):
+            summary[f'ollama_{field}_ms'] = mean(field, scale=1 / 1e6)
+        summary['ollama_prompt_eval_count'] = mean('prompt_eval_count', scale=1)
+        summary['ollama_eval_count'] = mean('eval_count', scale=1)
+
+        if summary['http_ms'] is not None and summary['ollama_total_duration_ms'] is not None:
+            summary['overhead_ms'] = round(summary['keyword_total_ms'] - summary['ollama_total_duration_ms'], 2)
+
+        return summary
+
+    def keywords_per_second(self) -> float:
+        """Average throughput of this job so far"""
+        if not self.start_time or not self.progress:
+            return 0.0
+        elapsed = time.time() - self.start_time
+        return self.progress / elapsed if elapsed > 0 else 0.0
+
+    def budget_exhausted(self, calls_made: int) -> Optional[str]:
+        """
+        Check the deadline/budget settings of the job
+
+        Settings:
+            deadline_minutes: stop after this much processing time
+            max_calls: stop after this many AI calls
+
+        Returns:
+            Why the job has to stop, or None to keep going
+        """
+        deadline_minutes = self.settings.get('deadline_minutes')
+        if not deadline_minutes and self.settings.get('preview'):
+            deadline_minutes = PREVIEW_DEADLINE_MINUTES
+        max_calls = self.settings.get('max_calls')
+
+        if deadline_minutes and time.time() - self.start_time >= float(deadline_minutes) * 60:
+            return f"Deadline of {deadline_minutes} minutes reached"
+        if max_calls and calls_made >= int(max_calls):
+            return f"Budget of {max_calls} calls reached"
+        return None
+
+
+def wait_for_ollama(job: ProcessingJob, health: OllamaHealthMonitor,
+                    on_update: Optional[Callable[[ProcessingJob], None]] = None):
+    """
+    Pause a job until the health monitor reaches Ollama again
+
+    While waiting, on_update is called every HEALTH_WAIT_HEARTBEAT seconds, so
+    a queue worker keeps writing progress and its job is not requeued as stale.
+
+    Raises:
+        RuntimeError: Ollama stayed down for HEALTH_JOB_WAIT seconds (the job fails,
+            keeping everything classified so far)
+    """
+    # Right after startup the monitor may simply not have checked yet
+    down = health.checked
+    if down:
+        logger.warning("Ollama is down - job paused until it is back")
+    job.waiting_for_ollama = True
+    if on_update:
+        on_update(job)
+    try:
+        deadline = time.time() + HEALTH_JOB_WAIT
+        while not health.wait_until_available(min(HEALTH_WAIT_HEARTBEAT, max(0.0, deadline - time.time()))):
+            if time.time() >= deadline:
+                raise RuntimeError(f"Ollama was not reachable for {HEALTH_JOB_WAIT} seconds")
+            if on_update:
+                on_update(job)
+    finally:
+        job.waiting_for_ollama = False
+    if down:
+        logger.info("Ollama is back - job continues")
+
+
+def classify_with_slot(classifier: KeywordClassifier, keyword: str, topics: List[str], dispatched_at: float,
+                       controller: Optional[AdaptiveConcurrencyController] = None) -> Tuple[Dict, Dict]:
+    """
+    Classify one keyword in a pool thread (one Ollama call, also for several topics)
+
+    With a controller, the call waits for a free concurrency slot first.
+
+    Returns:
+        Tuple of (result, timings); queue_wait is the time the keyword waited
+        for a free thread (and slot), keyword_total the time classifying it
+    """
+    if controller:
+        controller.acquire()
+    timings = {'queue_wait': time.time() - dispatched_at}
+    keyword_start = time.time()
+
+    result = None
+    try:
+        if len(topics) > 1:
+            result = classifier.classify_keyword_multi(keyword, topics, timings)
+        else:
+            result = classifier.classify_keyword(keyword, topics[0], timings)
+    finally:
+        if controller:
+            controller.release(timings.get('http'), call_outcome(result or {'failed': True}, timings))
+
+    timings['keyword_total'] = time.time() - keyword_start
+    return result, timings
+
+
+def classify_in_order(keyword_iter: Iterator[Dict], classify: Callable[[int, Dict, float], Tuple[Dict, Dict]],
+                      pool_size: int, window: Callable[[], int],
+                      stop: Optional[Callable[[int], bool]] = None,
+                      health: Optional[OllamaHealthMonitor] = None,
+                      wait_for_health: Optional[Callable[[], None]] = None,
+                      initializer: Optional[Callable[[], None]] = None) -> Iterator[Tuple[Dict, Dict, Dict]]:
+    """
+    Classify keywords in a small thread pool and yield the results in input order
+
+    Keywords are dispatched a few ahead of the oldest unfinished one, so the
+    pool stays busy while the output keeps the order of the input.
+
+    Args:
+        keyword_iter: Keyword dictionaries in input order
+        classify: Called in a pool thread with (index, keyword_data, dispatched_at),
+            returns (result, timings) - e.g. classify_with_slot
+        pool_size: Threads in the pool
+        window: Keywords to keep in flight (asked again before every dispatch)
+        stop: Called with the number of keywords dispatched so far; True stops
+            dispatching (deadline/budget), the keywords in flight still finish
+        health: While it reports Ollama down, nothing new is dispatched; once
+            nothing is in flight, wait_for_health is called (it blocks or raises)
+        initializer: Called once in every pool thread
+
+    Yields:
+        (keyword_data, result, timings) for every dispatched keyword, in input order
+    """
+    in_flight = deque()
+    dispatched = 0
+    exhausted = False
+    finished = False
+
+    executor = ThreadPoolExecutor(max_workers=pool_size, initializer=initializer)
+    try:
+        while True:
+            # Ollama down: finish what is in flight, then wait for it to come back
+            if health is not None and not health.available and not in_flight and not exhausted:
+                wait_for_health()
+
+            # Keep the pool busy (a few more keywords than threads)
+            while not exhausted and len(in_flight) < window() and (health is None or health.available):
+                if stop and stop(dispatched):
+                    exhausted = True
+                    break
+
+                keyword_data = next(keyword_iter, None)
+                if keyword_data is None:
+                    exhausted = True
+                    break
+
+                in_flight.append((keyword_data, executor.submit(classify, dispatched, keyword_data, time.time())))
+                dispatched += 1
+
+            if not in_flight:
+                if exhausted:
+                    break
+                continue  # Ollama went down again before a keyword was sent
+
+            keyword_data, future = in_flight.popleft()
+            result, timings = future.result()
+            yield keyword_data, result, timings
+        finished = True
+    finally:
+        # Failed or interrupted (Ctrl+C): do not wait for the keywords still queued
+        executor.shutdown(wait=finished, cancel_futures=True)
+
+
+def classify_distributed(job: ProcessingJob, keyword_iter: Iterator[Dict], shard_settings: Dict,
+                         record_result: Callable[[Dict, Dict, Dict], None],
+                         on_update: Optional[Callable[[ProcessingJob], None]] = None,
+                         store: Optional['ShardStore'] = None,
+                         classify_local: Optional[Callable[[int, Dict, float], Tuple[Dict, Dict]]] = None):
+    """
+    Classify a job's keywords on shard workers and merge the results in order
+
+    Up to SHARD_WINDOW shards are queued ahead of the oldest unfinished one, so
+    a streamed input is never held in memory as a whole. Expired leases are
+    retried by the shard store; a shard that fails for good fails the job.
+
+    If no shard worker touches the job for SHARD_IDLE_TIMEOUT seconds, the
+    oldest waiting shard is classified here with classify_local (the job
+    fails instead if there is none). Workers that show up later take over again.
+
+    Args:
+        keyword_iter: Keywords of the job (keyword dictionaries, in input order)
+        shard_settings: What workers need to classify (model, topics, threshold,
+            categories, prompts)
+        record_result: Called with (keyword_data, result, timings) for every
+            keyword, in input order
+        classify_local: Called with (index, keyword_data, dispatched_at), returns
+            (result, timings) - classifies a keyword with this process's Ollama
+    """
+    from shard_store import ShardStore, LeaseLost
+
+    store = store or ShardStore()
+    store.add_job(job.job_id, shard_settings)
+    pending = deque()  # (shard_id, index of the first keyword, [keyword_data]) in input order
+    dispatched = 0
+    seq = 0
+    exhausted = False
+    last_state = 0.0
+    started = time.time()
+
+    try:
+        while True:
+            while not exhausted and len(pending) < SHARD_WINDOW:
+                # Deadline/budget mode: stop cleanly and export what we have
+                stop_reason = job.budget_exhausted(dispatched)
+                if stop_reason:
+                    job.stopped_early = True
+                    job.stop_reason = stop_reason
+                    exhausted = True
+                    break
+
+                size = SHARD_SIZE
+                if job.settings.get('max_calls'):
+                    size = min(size, int(job.settings['max_calls']) - dispatched)
+                batch = list(islice(keyword_iter, size))
+                if not batch:
+                    exhausted = True
+                    break
+
+                pending.append((store.add_shard(job.job_id, seq, [k['title'] for k in batch]), dispatched, batch))
+                dispatched += len(batch)
+                seq += 1
+
+            if not pending:
+                break
+
+            shard_id, first_index, batch = pending[0]
+            results = store.results(shard_id)
+            if results is None:
+                if time.time() - last_state >= 1.0:
+                    # Leases also run out when no worker asks for work any more
+                    store.expire_leases()
+                    # Also keeps a queue worker's job from looking stale while it waits
+                    job.shard_state = store.job_state(job.job_id)
+                    last_state = time.time()
+                    if on_update:
+                        on_update(job)
+
+                    idle = time.time() - max(started, job.shard_state['last_activity'] or 0)
+                    if idle >= SHARD_IDLE_TIMEOUT:
+                        if classify_local is None:
+                            raise RuntimeError(f"No shard worker picked up the job for {SHARD_IDLE_TIMEOUT:.0f} seconds")
+                        lease_id = store.take_over(shard_id)
+                        if lease_id:
+                            logger.warning(f"No shard worker for {idle:.0f} seconds - classifying keywords "
+                                           f"{first_index + 1}-{first_index + len(batch)} locally")
+                            dispatched_at = time.time()
+                            local = []
+                            with ThreadPoolExecutor(max_workers=job.concurrency()) as executor:
+                                for answer in executor.map(
+                                    lambda item: classify_local(first_index + item[0], item[1], dispatched_at),
+                                    enumerate(batch)
+                                ):
+                                    local.append(answer)
+                                    if time.time() - last_state >= 1.0:
+                                        # Keep the lease and a queue worker's job alive while the batch runs
+                                        try:
+                                            store.heartbeat(shard_id, lease_id)
+                                        except LeaseLost:
+                                            pass  # Expired: complete() still accepts the results if nobody was faster
+                                        last_state = time.time()
+                                        if on_update:
+                                            on_update(job)
+                            try:
+                                store.complete(shard_id, lease_id, [
+                                    {'result': result, 'timings': timings} for result, timings in local
+                                ])
+                            except LeaseLost:
+                                pass  # A worker finished it first; its results are used
+                            continue
+                time.sleep(SHARD_POLL_INTERVAL)
+                continue
+
+            pending.popleft()
+            for keyword_data, item in zip(batch, results):
+                job.current_keyword = keyword_data['title']
+                record_result(keyword_data, item['result'], item['timings'])
+    finally:
+        job.shard_state = store.job_state(job.job_id)
+        store.remove_job(job.job_id)
+
+
+def preview_projection(job: ProcessingJob, rows: List[Tuple[str, Dict]], strata: Dict[str, int],
+                       topics: List[str], classifier: KeywordClassifier, model: str, classify_start: float) -> Dict:
+    """
+    Projection of the full run from a finished preview, stored for reuse
+
+    Throughput is measured from the first to the last answer (model loading
+    shows up once, as warm-up). The full run skips the keywords the preview
+    already answered.
+    """
+    projection = project(rows, strata, topics)
+    projection['preview_id'] = job.job_id
+
+    rate = None
+    times = job.completion_times
+    measured = job.progress - job.reused_keywords
+    if job.first_result_time and measured > 1 and times[-1] > job.first_result_time:
+        rate = (measured - 1) / (times[-1] - job.first_result_time)
+    warmup = job.first_result_time - classify_start if job.first_result_time else 0
+    projection['throughput'] = {
+        'model': model,
+        'keywords_per_second': round(rate, 3) if rate else None,
+        'warmup_seconds': round(warmup, 1),
+        'concurrency': job.concurrency_state()
+    }
+    if rate:
+        rows_total = job.input_totals['rows']
+        full_run = warmup + rows_total / rate
+        with_reuse = warmup + max(0, rows_total - len(classifier.sample_results)) / rate
+        projection['duration'] = {
+            'full_run_seconds': round(full_run),
+            'full_run': format_duration(full_run),
+            'with_reuse_seconds': round(with_reuse),
+            'with_reuse': format_duration(with_reuse)
+        }
+
+    try:
+        PreviewStore().save(job.job_id, settings_fingerprint(job.settings), job.settings.get('preview_source', ''),
+                            projection, classifier.sample_results)
+        projection['reusable_keywords'] = len(classifier.sample_results)
+    except OSError as e:
+        logger.warning(f"Could not store the preview answers: {e}")
+        projection['reusable_keywords'] = 0
+    return projection
+
+
+def process_keywords(job: ProcessingJob, ollama_client: OllamaClient, output_folder: Path,
+                     on_update: Optional[Callable[[ProcessingJob], None]] = None,
+                     health: Optional[OllamaHealthMonitor] = None):
+    """
+    Background processing of keywords
+
+    Args:
+        job: The job to run (keywords and settings are read from it)
+        ollama_client: Client used for all AI calls of this job
+        output_folder: Where the accepted/rejected CSV files are written
+        on_update: Optional callback invoked after every keyword and when the
+            job finishes (queue workers use it to publish progress)
+        health: Optional health monitor of ollama_client's server; while it sees
+            Ollama down no new keywords are sent (they would only fail)
+    """
+    settings = job.settings
+
+    job.status = 'processing'
+    job.start_time = time.time()
+
+    set_log_context(job_id=job.job_id)
+    logger.info("Job started")
+
+    # Optional sampling profiler around classification AND export
+    profiler = JobProfiler() if settings.get('profile') or PROFILE_ALL_JOBS else None
+    if profiler:
+        profiler.start()
+
+    processor = None
+    try:
+        # Initialize classifier
+        classifier = KeywordClassifier(ollama_client)
+        classifier.set_confidence_threshold(settings.get('confidence_threshold', DEFAULT_CONFIDENCE_THRESHOLD))
+        classifier.categories = settings.get('categories', DEFAULT_CATEGORIES)
+        classifier.set_relevance_prompt(settings.get('relevance_prompt', DEFAULT_RELEVANCE_PROMPT))
+        classifier.set_category_prompt(settings.get('category_prompt', DEFAULT_CATEGORY_PROMPT))
+
+        # Multi-topic jobs score every keyword against all topics in one call
+        topics = settings.get('topics') or [job.topic]
+        distributed = job.distributed()
+
+        # Preview: classify a stratified sample instead of every keyword (see preview.py)
+        preview = bool(settings.get('preview'))
+        strata = None
+        preview_rows = []  # (stratum, result) of the sample keywords
+        if preview:
+            sample, strata = stratified_sample(job.keywords, int(settings.get('preview_size') or PREVIEW_SAMPLE_SIZE))
+            job.keywords = sample
+            job.total = len(sample)
+            classifier.set_preview_mode()
+            logger.info(f"Preview of {len(sample)} keywords from {len(strata)} strata")
+        elif settings.get('reuse_preview'):
+            if distributed:
+                # The answers would have to travel with the shards; the workers classify everything
+                logger.info("Preview answers are not reused by distributed jobs")
+            else:
+                classifier.reuse_results(PreviewStore().known_results(settings['reuse_preview']))
+                job.reusable_keywords = len(classifier.known_results)
+        classify_start = time.time()
+
+        # Initialize processor; results are written to the output files as they come in
+        processor = CSVProcessor(topics, include_timings=bool(settings.get('export_timings')))
+        job.running_statistics = processor.stats
+        job.result_store = processor.results
+        job.accepted_file, job.rejected_file, job.topic_files = processor.start_export(
+            str(output_folder), settings.get('export_format') or DEFAULT_EXPORT_FORMAT
+        )
+
+        # Expected duration from earlier jobs with this model/host (until our own rate is known);
+        # distributed jobs run on the shard workers' Ollama, so the local history does not apply
+        history = None
+        if not distributed:
+            try:
+                history = ThroughputHistory()
+                job.estimate = history.estimate(
+                    ollama_client.model, ollama_client.host, job.total,
+                    'auto' if job.adaptive_concurrency() else job.concurrency(),
+                    job.input_totals.get('title_chars_mean')
+                )
+            except Exception as e:
+                logger.warning(f"Throughput history not available: {e}")
+
+        # "auto": the pool is sized for the maximum and the controller decides
+        # how many of its threads may call Ollama at the same time
+        controller = None
+        if job.adaptive_concurrency() and not distributed:
+            initial = ADAPTIVE_CONCURRENCY_START
+            if health is not None and health.model_placement() in ('partial', 'cpu'):
+                # Part of the model runs on the CPU: parallel calls mostly queue
+                initial = 1
+            controller = job.concurrency_controller = AdaptiveConcurrencyController(initial)
+        pool_size = controller.max_limit if controller else job.concurrency()
+
+        def classify(index, keyword_data, dispatched_at):
+            # Runs in a pool thread
+            set_log_context(job_id=job.job_id, keyword_index=index)
+            job.current_keyword = keyword_data['title']
+            return classify_with_slot(classifier, keyword_data['title'], topics, dispatched_at, controller)
+
+        def record_result(keyword_data, result, timings):
+            """Bookkeeping for one classified keyword (in input order, local and distributed)"""
+            # Add to processor results
+            processor.add_result(keyword_data, result, timings)
+            KEYWORDS_CLASSIFIED.inc(accepted='true' if result['relevance_accepted'] else 'false')
+
+            # Track timing
+            job.processing_times.append(timings['keyword_total'])
+            job.record_timings(timings)
+            if timings.get('reused'):
+                # Answered by the preview: not part of the measured throughput
+                job.reused_keywords += 1
+            else:
+                job.completion_times.append(time.time())
+                if job.first_result_time is None:
+                    job.first_result_time = job.completion_times[-1]
+            if preview:
+                preview_rows.append((keyword_data['stratum'], result))
+            job.title_chars += len(keyword_data['title'])
+            if result.get('failed'):
+                job.failed_keywords += 1
+
+            # Store latest result for live console
+            job.current_result = {
+                'keyword': keyword_data['title'],
+                'accepted': result['relevance_accepted'],
+                'score': result['relevance_score'],
+                'category': result['category'],
+                'timestamp': time.time()
+            }
+
+            # Update progress
+            job.progress += 1
+
+            # Per-keyword record (sampled, off by default - see log_setup.py)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Keyword classified", extra={
+                    'sampled': True,
+                    'keyword_index': job.progress - 1,
+                    'keyword': keyword_data['title'],
+                    'duration_ms': round(timings['keyword_total'] * 1000, 1)
+                })
+
+            if on_update:
+                on_update(job)
+
+        if distributed:
+            # Shard workers on other machines classify, this process merges in order
+            classify_distributed(job, iter(job.keywords), {
+                'model': ollama_client.model,
+                'topics': topics,
+                'confidence_threshold': classifier.confidence_threshold,
+                'categories': classifier.categories,
+                'relevance_prompt': settings.get('relevance_prompt', DEFAULT_RELEVANCE_PROMPT),
+                'category_prompt': settings.get('category_prompt', DEFAULT_CATEGORY_PROMPT)
+            }, record_result, on_update, classify_local=classify)
+        else:
+            def stop(dispatched):
+                # Deadline/budget mode: stop cleanly and export what we have
+                stop_reason = job.budget_exhausted(dispatched)
+                if stop_reason:
+                    job.stopped_early = True
+                    job.stop_reason = stop_reason
+                return bool(stop_reason)
+
+            # Keywords are dispatched to a small thread pool, but results are
+            # collected in keyword order so the exports keep the job order
+            for keyword_data, result, timings in classify_in_order(
+                iter(job.keywords), classify, pool_size, lambda: job.concurrency() * 2, stop,
+                health, lambda: wait_for_ollama(job, health, on_update),
+                initializer=profiler.register_thread if profiler else None
+            ):
+                record_result(keyword_data, result, timings)
+
+        # Finalize the streamed exports (atomic rename of the .part files)
+        processor.finish_export()
+
+        if preview:
+            job.preview = preview_projection(job, preview_rows, strata, topics, classifier,
+                                             ollama_client.model, classify_start)
+
+        # Get statistics (incl. how much of the view volume was classified)
+        job.statistics = processor.get_statistics()
+        job.statistics['coverage'] = processor.get_view_coverage(job.input_totals)
+        job.statistics['timing'] = job.get_timing_summary()
+        job.summary_file = processor.export_summary(str(output_folder), {
+            'job_id': job.job_id,
+            'upload_id': job.upload_id,
+            'topic': job.topic,
+            'topics': topics,
+            'order_by': settings.get('order_by', 'file'),
+            'stopped_early': job.stopped_early,
+            'stop_reason': job.stop_reason,
+            'reused_keywords': job.reused_keywords,
+            'preview': job.preview,
+            'statistics': job.statistics
+        })
+
+        # Remember how fast this model/host was (estimates for the next jobs)
+        record = job.history_record(ollama_client.model, ollama_client.host)
+        if history is not None and record is not None:
+            try:
+                history.record(record)
+            except Exception as e:
+                logger.warning(f"Could not record throughput history: {e}")
+
+        # Mark as completed
+        job.status = 'completed'
+
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        logger.exception(f"Error processing job {job.job_id}: {e}")
+        # Keep everything classified before the error
+        if processor is not None:
+            processor.finish_export()
+
+    logger.info(f"Job {job.status}", extra={'duration_ms': round((time.time() - job.start_time) * 1000, 1)})
+
+    if profiler:
+        job.profile_file = profiler.stop_and_save(Path(output_folder) / f"profile_{job.job_id}.folded")
+        job.statistics['profile_top_functions'] = profiler.top_functions()
+
+    if on_update:
+        on_update(job)
@@ -0,0 +1,119 @@
+"""
+Job Profiler
+Low-overhead sampling profiler for a running classification job
+
+A background thread looks at the stacks of the job's threads every few
+milliseconds (sys._current_frames) and counts how often each stack is seen.
+Nothing is hooked into the code being profiled, so the job runs at
+practically full speed.
+
+The result is written in the "collapsed stack" format (one line per stack:
+"frame;frame;frame count"), which flamegraph.pl, speedscope.app and most
+other flame graph tools open directly.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import PROFILE_SAMPLE_INTERVAL
+
+
+class JobProfiler:
+    """
+    Samples the stacks of the threads registered for one job.
+
+    Usage:
+        profiler = JobProfiler()
+        profiler.start()                      # registers the calling thread
+        ThreadPoolExecutor(initializer=profiler.register_thread)
+        ...
+        profiler.stop_and_save(path)
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._thread_ids = {}  # thread id -> thread name
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self.started_at = None
+
+    def register_thread(self):
+        """Include the calling thread in the profile (use as pool initializer)"""
+        thread = threading.current_thread()
+        with self._lock:
+            self._thread_ids[thread.ident] = thread.name
+
+    def start(self):
+        """Register the calling thread and start sampling"""
+        self.register_thread()
+        self.started_at = time.time()
+        self._sampler = threading.Thread(target=self._run, name='job-profiler', daemon=True)
+        self._sampler.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                thread_ids = dict(self._thread_ids)
+
+            for thread_id, thread_name in thread_ids.items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                self.stacks[self._collapse(frame, thread_name)] += 1
+            self.samples += 1
+
+    @staticmethod
+    def _collapse(frame, thread_name: str) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        # Group pool threads together ("ThreadPoolExecutor-3_1" -> "ThreadPoolExecutor")
+        stack.append(thread_name.split('-')[0])
+        return ';'.join(reversed(stack))
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def top_functions(self, limit: int = 10) -> List[Dict]:
+        """Functions where the sampled threads spent most of their time (self time)"""
+        self_samples = Counter()
+        for stack, count in self.stacks.items():
+            self_samples[stack.rsplit(';', 1)[-1]] += count
+
+        total = sum(self_samples.values()) or 1
+        return [
+            {'function': function, 'samples': count, 'percent': round(count / total * 100, 2)}
+            for function, count in self_samples.most_common(limit)
+        ]
+
+    def stop_and_save(self, filepath: Path) -> Optional[str]:
+        """
+        Stop sampling and write the collapsed stacks
+
+        Returns:
+            Path of the profile file, or None if nothing was sampled
+        """
+        self.stop()
+        if not self.stacks:
+            return None
+
+        filepath = Path(filepath)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        return str(filepath)
@@ -0,0 +1,365 @@
+"""
+Result Store
+Compact, column-by-column storage of the classification results of a job
+
+A Python dict per keyword costs several hundred bytes; at a million keywords
+that adds up to gigabytes. The store keeps every column in a typed array
+instead (about 40 bytes per keyword plus the title text):
+- titles: one UTF-8 byte buffer plus offsets (the Arrow string layout)
+- categories: small integer codes into a list of distinct category names
+- accepted flags: packed bits, 8 per byte (the Arrow boolean layout)
+- numbers: float64/int32 arrays, missing values as NaN
+
+Supports append, slicing (pagination) and conversion to Arrow/pandas without
+copying the numeric columns.
+
+In queue mode the store lives in the worker process. The worker copies new
+rows to a ResultRowsFile (Arrow IPC stream, rows_<job_id>.arrows in the output
+folder), so /api/results/<job_id>/rows can page through them from any API process.
+"""
+
+import os
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import OUTPUT_COLUMNS, OUTPUT_FOLDER
+
+# array typecode -> numpy dtype
+DTYPES = {'h': np.int16, 'i': np.int32, 'q': np.int64, 'd': np.float64}
+
+# Stored as float64, shown as ints when they are whole numbers (49, not 49.0)
+WHOLE_NUMBER_COLUMNS = ('views', 'views_per_year')
+
+
+class _Column:
+    """Typed, append-only array that can be viewed by numpy/Arrow without a copy"""
+
+    def __init__(self, typecode: str):
+        self.values = array(typecode)
+        self.dtype = DTYPES[typecode]
+
+    def append(self, value):
+        try:
+            self.values.append(value)
+        except BufferError:
+            # A zero-copy view (to_pandas/to_arrow) still uses the buffer:
+            # keep it as it is and continue in a copy
+            self.values = array(self.values.typecode, self.values)
+            self.values.append(value)
+
+    def view(self, length: int) -> np.ndarray:
+        """The first `length` values (no copy)"""
+        return np.frombuffer(self.values, dtype=self.dtype, count=length)
+
+
+class _BitColumn:
+    """Booleans packed 8 per byte, least significant bit first (like Arrow)"""
+
+    def __init__(self):
+        self.bytes = bytearray()
+        self.length = 0
+
+    def append(self, value: bool):
+        try:
+            if self.length % 8 == 0:
+                self.bytes.append(0)
+        except BufferError:
+            self.bytes = bytearray(self.bytes)
+            self.bytes.append(0)
+        if value:
+            self.bytes[self.length >> 3] |= 1 << (self.length & 7)
+        self.length += 1
+
+    def get(self, index: int) -> bool:
+        return bool(self.bytes[index >> 3] >> (index & 7) & 1)
+
+    def to_numpy(self, length: int) -> np.ndarray:
+        packed = np.frombuffer(self.bytes, dtype=np.uint8, count=(length + 7) // 8)
+        return np.unpackbits(packed, bitorder='little', count=length).astype(bool)
+
+
+class _StringColumn:
+    """UTF-8 text in one byte buffer, row i = data[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = _Column('q')
+        self.offsets.append(0)
+
+    def append(self, value: str):
+        try:
+            self.data += (value or '').encode('utf-8')
+        except BufferError:
+            self.data = bytearray(self.data) + (value or '').encode('utf-8')
+        self.offsets.append(len(self.data))
+
+    def get(self, index: int) -> str:
+        offsets = self.offsets.values
+        return self.data[offsets[index]:offsets[index + 1]].decode('utf-8')
+
+
+class ResultStore:
+    """
+    Typed, column-by-column result rows (same columns as the exported files).
+
+    Usage:
+        store = ResultStore(['ys_origin'], timing_columns=[])
+        store.append(row_dict)           # row as built by CSVProcessor.add_result
+        store.page(0, 50)                # one page of row dicts
+        store.to_pandas() / store.to_arrow()
+    """
+
+    def __init__(self, topic_slugs: Optional[List[str]] = None, timing_columns: Optional[List[str]] = None):
+        self.topic_slugs = list(topic_slugs or [])
+        self.timing_columns = list(timing_columns or [])
+        self.length = 0
+
+        self.titles = _StringColumn()
+        self.categories = []  # Code -> category name
+        self._category_codes = {}  # Category name -> code
+        self.category_codes = _Column('h')
+
+        self.numbers = {
+            'views': _Column('d'),
+            'views_per_year': _Column('d'),
+            'relevance_score': _Column('i'),
+            'category_confidence': _Column('i')
+        }
+        self.flags = {'relevance_accepted': _BitColumn()}
+        for slug in self.topic_slugs:
+            self.numbers[f'relevance_score_{slug}'] = _Column('i')
+            self.flags[f'relevance_accepted_{slug}'] = _BitColumn()
+        for column in self.timing_columns:
+            self.numbers[column] = _Column('d')
+
+        self.columns = list(OUTPUT_COLUMNS)
+        for slug in self.topic_slugs:
+            self.columns += [f'relevance_score_{slug}', f'relevance_accepted_{slug}']
+        self.columns += self.timing_columns
+
+        # (column name, column, is float) - looked up once, used for every row
+        self._number_columns = [
+            (column, values, values.dtype == np.float64) for column, values in self.numbers.items()
+        ]
+
+    def __len__(self) -> int:
+        return self.length
+
+    def append(self, row: Dict):
+        """Add one result row (missing numbers are stored as NaN / 0)"""
+        self.titles.append(row['title'])
+
+        category = row['category']
+        code = self._category_codes.get(category)
+        if code is None:
+            code = self._category_codes[category] = len(self.categories)
+            self.categories.append(category)
+        self.category_codes.append(code)
+
+        for column, values, is_float in self._number_columns:
+            value = row.get(column)
+            values.append(_to_float(value) if is_float else int(value or 0))
+        for column, flags in self.flags.items():
+            flags.append(bool(row.get(column)))
+
+        # Last, so readers never see a half-written row
+        self.length += 1
+
+    def row(self, index: int) -> Dict:
+        """One result row as a dictionary"""
+        row = {'title': self.titles.get(index)}
+        for column in self.columns[1:]:
+            if column == 'category':
+                row[column] = self.categories[self.category_codes.values[index]]
+            elif column in self.flags:
+                row[column] = self.flags[column].get(index)
+            else:
+                row[column] = _plain_number(column, self.numbers[column].values[index])
+        return row
+
+    def slice(self, start: int, stop: int) -> List[Dict]:
+        """Rows start..stop-1 as dictionaries"""
+        start, stop, _ = slice(start, stop).indices(self.length)
+        return [self.row(index) for index in range(start, stop)]
+
+    def page(self, offset: int, limit: int, accepted: Optional[bool] = None) -> Tuple[List[Dict], int]:
+        """
+        One page of rows, optionally only accepted (True) or rejected (False) ones
+
+        Returns:
+            Tuple of (rows, number of matching rows)
+        """
+        length = self.length  # Rows appended while we read are not part of this page
+        if accepted is None:
+            return self.slice(offset, min(offset + limit, length)), length
+
+        flags = self.flags['relevance_accepted'].to_numpy(length)
+        matching = np.flatnonzero(flags if accepted else ~flags)
+        return [self.row(int(index)) for index in matching[offset:offset + limit]], len(matching)
+
+    def _title_array(self, length: int):
+        import pyarrow as pa
+
+        return pa.LargeStringArray.from_buffers(
+            length, pa.py_buffer(self.titles.offsets.view(length + 1)), pa.py_buffer(self.titles.data)
+        )
+
+    def to_arrow(self):
+        """
+        The results as a pyarrow Table
+
+        Numbers, packed flags, category codes and the title buffer are
+        handed to Arrow as they are (no copy).
+        """
+        import pyarrow as pa
+
+        length = self.length
+        arrays = {'title': self._title_array(length)}
+        for column in self.columns[1:]:
+            if column == 'category':
+                arrays[column] = pa.DictionaryArray.from_arrays(
+                    pa.array(self.category_codes.view(length)), pa.array(self.categories, pa.string())
+                )
+            elif column in self.flags:
+                arrays[column] = pa.BooleanArray.from_buffers(
+                    pa.bool_(), length, [None, pa.py_buffer(self.flags[column].bytes)]
+                )
+            else:
+                arrays[column] = pa.array(self.numbers[column].view(length))
+        return pa.table(arrays)
+
+    def to_pandas(self):
+        """
+        The results as a pandas DataFrame (same columns as the exported files)
+
+        Numeric columns are views of the store's arrays; category becomes a
+        pandas Categorical built from the codes.
+        """
+        import pandas as pd
+
+        length = self.length
+        columns = {'title': self._title_array(length).to_numpy(zero_copy_only=False)}
+        for column in self.columns[1:]:
+            if column == 'category':
+                columns[column] = pd.Categorical.from_codes(self.category_codes.view(length), self.categories)
+            elif column in self.flags:
+                columns[column] = self.flags[column].to_numpy(length)
+            else:
+                values = self.numbers[column].view(length)
+                if column in WHOLE_NUMBER_COLUMNS and length and np.all(values % 1 == 0):
+                    values = values.astype(np.int64)
+                columns[column] = values
+        return pd.DataFrame(columns, copy=False)
+
+
+class ResultRowsFile:
+    """
+    The rows of a ResultStore on disk, readable by other processes while the job runs
+
+    append() writes the rows added since its last call as one Arrow record
+    batch and then records the written size in "<name>.committed" (like
+    result_writer.py), so readers only ever see whole batches.
+
+    Usage:
+        rows_file = ResultRowsFile(rows_file_path(job_id))
+        rows_file.append(store)               # worker: on every progress update
+        rows_file.close()                     # worker: when the job is done
+        rows_file.page(0, 50, accepted=True)  # any process: same result as ResultStore.page
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.committed_path = self.path.with_name(self.path.name + '.committed')
+        self.rows_written = 0
+        self._handle = None
+        self._writer = None
+
+    def exists(self) -> bool:
+        return self.committed_path.exists()
+
+    def append(self, store: ResultStore):
+        """Write the rows added to the store since the last call"""
+        import pyarrow as pa
+
+        length = len(store)
+        if self._writer is not None and length == self.rows_written:
+            return
+        table = store.to_arrow().slice(self.rows_written, length - self.rows_written)
+        # Plain strings: the category dictionary grows from batch to batch
+        index = table.schema.get_field_index('category')
+        table = table.set_column(index, 'category', table['category'].cast(pa.string()))
+
+        if self._writer is None:
+            # A requeued job starts over: readers must not use the size of the old file
+            self.committed_path.unlink(missing_ok=True)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._handle = open(self.path, 'wb')
+            self._writer = pa.ipc.new_stream(self._handle, table.schema)
+        self._writer.write_table(table)
+        self._handle.flush()
+        self.rows_written = length
+
+        tmp = self.committed_path.with_name(self.committed_path.name + '.tmp')
+        tmp.write_text(str(self._handle.tell()), encoding='utf-8')
+        os.replace(tmp, self.committed_path)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._handle.close()
+            self._writer = self._handle = None
+
+    def page(self, offset: int, limit: int, accepted: Optional[bool] = None) -> Tuple[List[Dict], int]:
+        """
+        One page of the committed rows, optionally only accepted (True) or rejected (False) ones
+
+        Returns:
+            Tuple of (rows, number of matching rows)
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        try:
+            size = int(self.committed_path.read_text(encoding='utf-8'))
+        except (FileNotFoundError, ValueError):
+            return [], 0
+
+        # Memory-mapped: only the requested rows (and the accepted flags) are read
+        try:
+            with pa.memory_map(str(self.path)) as source:
+                table = pa.ipc.open_stream(source.read_buffer(size)).read_all()
+                if accepted is not None:
+                    flags = table['relevance_accepted']
+                    table = table.filter(flags if accepted else pc.invert(flags))
+                rows = table.slice(offset, limit).to_pylist()
+        except (OSError, pa.ArrowException):
+            return [], 0  # The job was requeued and its new worker just started the file over
+        for row in rows:
+            for column, value in row.items():
+                if isinstance(value, float):
+                    row[column] = _plain_number(column, value)
+        return rows, table.num_rows
+
+
+def rows_file_path(job_id: str, output_folder: Path = OUTPUT_FOLDER) -> Path:
+    """Where the worker keeps the result rows of a job (see ResultRowsFile)"""
+    return Path(output_folder) / f"rows_{job_id}.arrows"
+
+
+def _plain_number(column: str, value: float):
+    """NaN as None, whole views/views_per_year as ints"""
+    if value != value:
+        return None
+    if column in WHOLE_NUMBER_COLUMNS and value.is_integer():
+        return int(value)
+    return value
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
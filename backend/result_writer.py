@@ -0,0 +1,340 @@
+"""
+Result Writer
+Appends classified keywords to the output files while a job is running
+
+Every file is written as "<name>.part" next to its final name:
+- rows are appended as soon as a keyword is classified (no big DataFrame at the end)
+- a background timer flushes the files every EXPORT_FLUSH_INTERVAL seconds and
+  records the flushed size in "<name>.part.committed"
+- finalize() renames the .part files to their final names (atomic), so a
+  final file is always complete
+
+Readers (downloads while the job runs, from any process) use open_snapshot(),
+which returns exactly the committed bytes: a header plus whole rows.
+
+Output formats (see EXPORT_FORMATS in config.py):
+    csv      plain CSV
+    csv.gz   gzip-compressed CSV; every flush is a complete gzip member, so
+             the committed part is always a valid .gz file
+    jsonl    one JSON object per line
+    parquet  compressed columnar file, one row group per flush; only
+             readable once finalized (the footer is written last)
+"""
+
+import csv
+import gzip
+import io
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import EXPORT_FLUSH_INTERVAL, EXPORT_FORMATS
+
+PART_SUFFIX = '.part'
+COMMITTED_SUFFIX = '.committed'
+
+# Download content types of the export formats
+MIMETYPES = {
+    'csv': 'text/csv',
+    'csv.gz': 'application/gzip',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+
+def file_extension(export_format: str) -> str:
+    """File name extension of an export format ('csv.gz' -> '.csv.gz')"""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format} (use one of {', '.join(EXPORT_FORMATS)})")
+    return f".{export_format}"
+
+
+def format_of(filename: str) -> Optional[str]:
+    """Export format of a file name, or None"""
+    for export_format in sorted(EXPORT_FORMATS, key=len, reverse=True):
+        if filename.endswith(f".{export_format}"):
+            return export_format
+    return None
+
+
+def _part_path(path: Path) -> Path:
+    return path.with_name(path.name + PART_SUFFIX)
+
+
+def _committed_path(path: Path) -> Path:
+    return path.with_name(path.name + PART_SUFFIX + COMMITTED_SUFFIX)
+
+
+def _missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+class _CsvSink:
+    """Plain CSV (same output as pandas' to_csv: missing numbers become empty cells)"""
+
+    def __init__(self, path: Path, columns: List[str]):
+        self.columns = columns
+        self.handle = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.handle)
+        self.writer.writerow(columns)
+
+    def write(self, row: Dict):
+        self.writer.writerow(['' if _missing(row.get(column)) else row.get(column) for column in self.columns])
+
+    def flush(self) -> Optional[int]:
+        self.handle.flush()
+        return self.handle.tell()
+
+    def close(self):
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+        self.handle.close()
+
+
+class _GzipCsvSink(_CsvSink):
+    """CSV collected in memory and appended as one gzip member per flush"""
+
+    def __init__(self, path: Path, columns: List[str]):
+        self.columns = columns
+        self.raw = open(path, 'wb')
+        self.handle = io.StringIO(newline='')
+        self.writer = csv.writer(self.handle)
+        self.writer.writerow(columns)
+
+    def flush(self) -> Optional[int]:
+        data = self.handle.getvalue()
+        if data:
+            self.raw.write(gzip.compress(data.encode('utf-8'), compresslevel=6))
+            self.raw.flush()
+            self.handle.seek(0)
+            self.handle.truncate()
+        return self.raw.tell()
+
+    def close(self):
+        self.flush()
+        os.fsync(self.raw.fileno())
+        self.raw.close()
+
+
+class _JsonlSink:
+    """One JSON object per line (missing numbers become null)"""
+
+    def __init__(self, path: Path, columns: List[str]):
+        self.columns = columns
+        self.handle = open(path, 'w', encoding='utf-8')
+
+    def write(self, row: Dict):
+        record = {column: None if _missing(row.get(column)) else row.get(column) for column in self.columns}
+        self.handle.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def flush(self) -> Optional[int]:
+        self.handle.flush()
+        return self.handle.tell()
+
+    def close(self):
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+        self.handle.close()
+
+
+class _ParquetSink:
+    """Compressed Parquet, one row group per flush (no snapshot before close)"""
+
+    def __init__(self, path: Path, columns: List[str]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.columns = columns
+        self.schema = pa.schema([(column, _parquet_type(pa, column)) for column in columns])
+        self.writer = pq.ParquetWriter(str(path), self.schema, compression='zstd')
+        self.rows = []
+
+    def write(self, row: Dict):
+        self.rows.append(row)
+
+    def flush(self) -> Optional[int]:
+        if self.rows:
+            columns = {
+                column: [_parquet_value(field.type, row.get(column)) for row in self.rows]
+                for column, field in zip(self.columns, self.schema)
+            }
+            self.writer.write_table(self.pa.table(columns, schema=self.schema))
+            self.rows = []
+        return None
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def _parquet_type(pa, column: str):
+    if column in ('title', 'category'):
+        return pa.string()
+    if column.startswith('relevance_accepted'):
+        return pa.bool_()
+    if column.startswith('relevance_score') or column in ('category_confidence', 'ollama_prompt_eval_count', 'ollama_eval_count'):
+        return pa.int64()
+    return pa.float64()
+
+
+def _parquet_value(arrow_type, value):
+    if _missing(value):
+        return None
+    if str(arrow_type) == 'int64':
+        return int(value)
+    if str(arrow_type) == 'double':
+        return float(value)
+    return value
+
+
+SINKS = {
+    'csv': _CsvSink,
+    'csv.gz': _GzipCsvSink,
+    'jsonl': _JsonlSink,
+    'parquet': _ParquetSink
+}
+
+
+class StreamingResultWriter:
+    """
+    Append-only writer for several output files of one job.
+
+    Usage:
+        writer = StreamingResultWriter({'accepted': path1, 'rejected': path2}, columns, 'csv')
+        writer.open()
+        writer.write('accepted', row_dict)
+        ...
+        writer.finalize()
+    """
+
+    def __init__(self, files: Dict[str, Path], columns: List[str], export_format: str = 'csv',
+                 flush_interval: float = EXPORT_FLUSH_INTERVAL):
+        file_extension(export_format)  # Validates the format
+        self.files = {key: Path(path) for key, path in files.items()}
+        self.columns = columns
+        self.export_format = export_format
+        self.flush_interval = flush_interval
+        self.rows_written = {key: 0 for key in self.files}
+        self._sinks = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._timer = None
+
+    def open(self):
+        """Create the .part files (with header) and start the flush timer"""
+        sink_class = SINKS[self.export_format]
+        for key, path in self.files.items():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._sinks[key] = sink_class(_part_path(path), self.columns)
+            self._dirty.add(key)
+
+        with self._lock:
+            self._flush_locked()
+
+        self._timer = threading.Thread(target=self._run, name='result-writer', daemon=True)
+        self._timer.start()
+
+    def write(self, key: str, row: Dict):
+        """Append one result row to a file (buffered until the next flush)"""
+        with self._lock:
+            self._sinks[key].write(row)
+            self.rows_written[key] += 1
+            self._dirty.add(key)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            with self._lock:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        # Only whole rows are ever buffered here (writes hold the same lock)
+        for key in self._dirty:
+            size = self._sinks[key].flush()
+            if size is not None:
+                _write_committed(self.files[key], size)
+        self._dirty.clear()
+
+    def flush(self):
+        """Flush all files now (normally done by the timer)"""
+        with self._lock:
+            self._flush_locked()
+
+    def finalize(self) -> Dict[str, str]:
+        """
+        Flush, close and atomically rename the .part files to their final names
+
+        Returns:
+            Dictionary of key -> final filepath
+        """
+        self._stop.set()
+        if self._timer is not None:
+            self._timer.join()
+
+        with self._lock:
+            for key, sink in self._sinks.items():
+                sink.close()
+                _replace(_part_path(self.files[key]), self.files[key])
+                _committed_path(self.files[key]).unlink(missing_ok=True)
+            self._sinks = {}
+            self._dirty.clear()
+
+        return {key: str(path) for key, path in self.files.items()}
+
+
+def _write_committed(path: Path, size: int):
+    committed = _committed_path(path)
+    tmp = committed.with_name(committed.name + '.tmp')
+    tmp.write_text(str(size), encoding='utf-8')
+    os.replace(tmp, committed)
+
+
+def _replace(source: Path, target: Path, attempts: int = 50):
+    # On Windows the rename fails while a download still has the .part file
+    # open, so wait a little for it to finish
+    for attempt in range(attempts):
+        try:
+            os.replace(source, target)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.1)
+
+
+def is_in_progress(path: Path) -> bool:
+    """True if the file is still being written by a running job"""
+    return _part_path(Path(path)).exists()
+
+
+def open_snapshot(path: Path, chunk_size: int = 64 * 1024) -> Optional[Tuple[Iterator[bytes], int]]:
+    """
+    Open a consistent snapshot of a file that is still being written
+
+    Returns:
+        (byte chunks, size) of everything flushed so far, or None if there
+        is no snapshot (not started, already finalized, or a Parquet file)
+    """
+    path = Path(path)
+    try:
+        size = int(_committed_path(path).read_text(encoding='utf-8'))
+        handle = open(_part_path(path), 'rb')
+    except (FileNotFoundError, ValueError):
+        return None
+
+    def chunks():
+        with handle:
+            remaining = size
+            while remaining > 0:
+                data = handle.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    return chunks(), size
@@ -0,0 +1,361 @@
+"""
+Retention
+Deletes old uploads and job outputs in the background, so the disk does not fill up
+
+Every upload and every job leaves files behind (Arrow copy of the upload,
+accepted/rejected files, per-topic files, summary, profile). Nothing removed
+them, so a busy shared machine slowly filled its disk.
+
+Files are grouped into artifacts, deleted as a whole:
+- upload:      <upload_id>.arrow + <upload_id>.json (and old <uuid>_<name>.csv uploads)
+- job outputs: all output files sharing one export stamp (accepted_keywords_<stamp>.csv,
+               rejected_..., per-topic files, summary_<stamp>.json, .part files)
+               plus the job's profile_<job_id>.folded and rows_<job_id>.arrows (queue mode)
+- leftovers:   temporary files of uploads that never finished
+
+A cleanup run (every RETENTION_INTERVAL seconds, in a background thread):
+1. deletes artifacts older than RETENTION_MAX_AGE_HOURS
+2. if uploads + outputs are still above RETENTION_MAX_TOTAL_MB, deletes the
+   oldest artifacts until they fit (never ones newer than RETENTION_GRACE_MINUTES)
+3. deletes unfinished chunked uploads (UPLOAD_SESSION_TIMEOUT)
+Artifacts of queued and running jobs (their upload and their outputs) are
+never deleted - the app tells the manager which ones are live.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from config import (
+    UPLOAD_FOLDER,
+    OUTPUT_FOLDER,
+    RETENTION_MAX_AGE_HOURS,
+    RETENTION_MAX_TOTAL_MB,
+    RETENTION_GRACE_MINUTES,
+    RETENTION_INTERVAL
+)
+from log_setup import get_logger
+
+logger = get_logger('retention')
+
+# "20260111_215930" or "20260111_215930_3f9a1c" (see csv_processor.export_stamp)
+EXPORT_STAMP_PATTERN = re.compile(r'(\d{8}_\d{6}(?:_[0-9a-f]{6})?)\.')
+# profile_<job_id>.folded, rows_<job_id>.arrows (+ .committed): files of one job, named by its id
+JOB_FILE_PATTERN = re.compile(r'^(?:profile_(.+)\.folded|rows_(.+)\.arrows(?:\.committed)?)$')
+UPLOAD_PATTERN = re.compile(r'^([0-9a-f]{32})\.(arrow|json)$')
+LEGACY_UPLOAD_PATTERN = re.compile(r'^[0-9a-f-]{36}_.+\.csv$')  # uuid_filename.csv of older versions
+UPLOAD_LEFTOVER_PATTERN = re.compile(r'\.(arrow\.tmp|upload\.csv|upload\.csv\.gz)$')
+
+
+def export_stamp_of(filename: str) -> Optional[str]:
+    """Export stamp in an output file name (None for other files)"""
+    matches = EXPORT_STAMP_PATTERN.findall(os.path.basename(filename or ''))
+    return matches[-1] if matches else None
+
+
+class RetentionManager:
+    """
+    Tracks disk usage of uploads/outputs and deletes what is past the limits.
+
+    Usage:
+        retention = RetentionManager(live_references=lambda: [{'job_id': ..., 'upload_id': ..., 'files': [...]}])
+        retention.start()       # cleanup every RETENTION_INTERVAL seconds
+        retention.usage()       # disk usage per job and upload (for /api/storage)
+        retention.collect()     # one cleanup run now (blocks - the thread calls it)
+
+    Args:
+        live_references: Returns the queued/running jobs as dicts with job_id,
+            upload_id and the output files they write; those are kept
+        on_deleted: Called with the job ids whose outputs were deleted
+    """
+
+    def __init__(self, upload_folder: Path = UPLOAD_FOLDER, output_folder: Path = OUTPUT_FOLDER,
+                 max_age_hours: float = RETENTION_MAX_AGE_HOURS, max_total_mb: float = RETENTION_MAX_TOTAL_MB,
+                 grace_minutes: float = RETENTION_GRACE_MINUTES, interval: float = RETENTION_INTERVAL,
+                 live_references: Optional[Callable[[], Iterable[Dict]]] = None,
+                 on_deleted: Optional[Callable[[List[str]], None]] = None):
+        self.upload_folder = Path(upload_folder)
+        self.output_folder = Path(output_folder)
+        self.max_age = max_age_hours * 3600
+        self.max_total_bytes = int(max_total_mb * 1024 * 1024)
+        self.grace = grace_minutes * 60
+        self.interval = interval
+        self.live_references = live_references or (lambda: [])
+        self.on_deleted = on_deleted
+        self.last_run = None  # Report of the last cleanup run
+
+        self._summary_cache = {}  # summary path -> (mtime, job_id, upload_id)
+        self._cache_lock = threading.Lock()  # usage() may scan while a cleanup runs
+        self._lock = threading.Lock()  # One cleanup run at a time
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> 'RetentionManager':
+        """Start the background cleanup (the first run is after one interval)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def refresh(self):
+        """Ask for a cleanup run now (it runs in the background thread)"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.collect()
+            except Exception as e:
+                logger.warning(f"Cleanup failed: {e}")
+
+    # Scanning
+
+    def _live(self) -> Dict:
+        live = {'job_ids': set(), 'upload_ids': set(), 'stamps': set()}
+        for reference in self.live_references():
+            if reference.get('job_id'):
+                live['job_ids'].add(reference['job_id'])
+            if reference.get('upload_id'):
+                live['upload_ids'].add(reference['upload_id'])
+            for filename in reference.get('files') or []:
+                stamp = export_stamp_of(filename)
+                if stamp:
+                    live['stamps'].add(stamp)
+        return live
+
+    def _summary_ids(self, path: Path, mtime: float):
+        """(job_id, upload_id) from a job summary (cached until the file changes)"""
+        with self._cache_lock:
+            cached = self._summary_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+        try:
+            summary = json.loads(path.read_text(encoding='utf-8'))
+            ids = (summary.get('job_id'), summary.get('upload_id'))
+        except (OSError, ValueError):
+            ids = (None, None)
+        with self._cache_lock:
+            self._summary_cache[path] = (mtime, *ids)
+        return ids
+
+    def scan(self) -> List[Dict]:
+        """
+        All artifacts in the upload and output folders
+
+        Returns:
+            List of {'kind', 'key', 'job_id', 'upload_id', 'files', 'bytes', 'modified', 'live'};
+            kind is 'upload', 'job' or 'leftover' (unknown files are not listed)
+        """
+        artifacts = {}
+
+        def add(kind: str, key: str, entry: os.DirEntry):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                return None
+            artifact = artifacts.setdefault((kind, key), {
+                'kind': kind, 'key': key, 'job_id': None, 'upload_id': None,
+                'files': [], 'bytes': 0, 'modified': 0.0, 'live': False
+            })
+            artifact['files'].append(Path(entry.path))
+            artifact['bytes'] += stat.st_size
+            artifact['modified'] = max(artifact['modified'], stat.st_mtime)
+            return artifact
+
+        for entry in _entries(self.upload_folder):
+            match = UPLOAD_PATTERN.match(entry.name)
+            if match:
+                artifact = add('upload', match.group(1), entry)
+                if artifact:
+                    artifact['upload_id'] = match.group(1)
+            elif LEGACY_UPLOAD_PATTERN.match(entry.name):
+                add('upload', entry.name, entry)
+            elif UPLOAD_LEFTOVER_PATTERN.search(entry.name):
+                add('leftover', entry.name, entry)
+
+        job_files = {}  # job_id -> profile/rows DirEntries
+        summaries = set()
+        for entry in _entries(self.output_folder):
+            stamp = export_stamp_of(entry.name)
+            job_file = JOB_FILE_PATTERN.match(entry.name)
+            if stamp:
+                artifact = add('job', stamp, entry)
+                if artifact and entry.name.startswith('summary_') and entry.name.endswith('.json'):
+                    path = Path(entry.path)
+                    summaries.add(path)
+                    artifact['job_id'], artifact['upload_id'] = self._summary_ids(path, entry.stat().st_mtime)
+            elif job_file:
+                job_files.setdefault(job_file.group(1) or job_file.group(2), []).append(entry)
+        with self._cache_lock:
+            for path in set(self._summary_cache) - summaries:
+                del self._summary_cache[path]
+
+        # Profiles and row files belong to the outputs of their job (or stand alone)
+        by_job = {artifact['job_id']: artifact for artifact in artifacts.values()
+                  if artifact['kind'] == 'job' and artifact['job_id']}
+        for job_id, entries in job_files.items():
+            for entry in entries:
+                if job_id in by_job:
+                    add('job', by_job[job_id]['key'], entry)
+                else:
+                    artifact = add('job', f"job:{job_id}", entry)
+                    if artifact:
+                        artifact['job_id'] = job_id
+
+        live = self._live()
+        for artifact in artifacts.values():
+            artifact['live'] = (
+                (artifact['kind'] == 'job' and artifact['key'] in live['stamps'])
+                or (artifact['job_id'] is not None and artifact['job_id'] in live['job_ids'])
+                or (artifact['kind'] == 'upload' and artifact['upload_id'] in live['upload_ids'])
+            )
+        return list(artifacts.values())
+
+    # Cleanup
+
+    def collect(self) -> Dict:
+        """
+        One cleanup run: age limit, then size limit, then stale chunked uploads
+
+        Returns:
+            Report with deleted artifacts/bytes and the usage afterwards
+        """
+        with self._lock:
+            started = time.time()
+            artifacts = self.scan()
+            total = sum(artifact['bytes'] for artifact in artifacts)
+            deleted = []
+
+            def delete(artifact: Dict, reason: str):
+                nonlocal total
+                for path in artifact['files']:
+                    try:
+                        path.unlink()
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        # e.g. a file still open on Windows - try again next run
+                        logger.warning(f"Could not delete {path.name}: {e}")
+                total -= artifact['bytes']
+                deleted.append({**_describe(artifact), 'reason': reason})
+
+            # Oldest first, so the size limit removes the least recent work
+            candidates = sorted((a for a in artifacts if not a['live']), key=lambda a: a['modified'])
+            remaining = []
+            for artifact in candidates:
+                if self.max_age and started - artifact['modified'] > self.max_age:
+                    delete(artifact, 'age')
+                elif artifact['kind'] == 'leftover' and started - artifact['modified'] > self.grace:
+                    delete(artifact, 'leftover')
+                else:
+                    remaining.append(artifact)
+
+            if self.max_total_bytes:
+                for artifact in remaining:
+                    if total <= self.max_total_bytes:
+                        break
+                    if started - artifact['modified'] > self.grace:
+                        delete(artifact, 'size')
+
+            sessions = self._purge_sessions()
+
+            self.last_run = {
+                'finished_at': time.time(),
+                'duration_ms': round((time.time() - started) * 1000, 1),
+                'deleted': len(deleted),
+                'deleted_bytes': sum(item['bytes'] for item in deleted),
+                'deleted_sessions': sessions,
+                'total_bytes': total,
+                'over_limit': bool(self.max_total_bytes) and total > self.max_total_bytes,
+                'artifacts': deleted[:50]
+            }
+            if deleted or sessions:
+                logger.info(f"Cleanup deleted {len(deleted)} artifacts ({_mb(self.last_run['deleted_bytes'])} MB), "
+                            f"{sessions} unfinished uploads")
+            if self.last_run['over_limit']:
+                logger.warning(f"Uploads/outputs use {_mb(total)} MB, above the limit of "
+                               f"{_mb(self.max_total_bytes)} MB (the rest is in use or recent)")
+
+        job_ids = [item['job_id'] for item in deleted if item['kind'] == 'job' and item['job_id']]
+        if job_ids and self.on_deleted:
+            self.on_deleted(job_ids)
+        return self.last_run
+
+    def _purge_sessions(self) -> int:
+        if not (self.upload_folder / 'sessions').is_dir():
+            return 0
+        from upload_store import UploadStore
+        return UploadStore(self.upload_folder).purge_stale_sessions()
+
+    # Reporting
+
+    def usage(self) -> Dict:
+        """Disk usage of uploads and outputs, per job and per upload (for /api/storage)"""
+        artifacts = self.scan()
+        uploads = {a['upload_id']: a for a in artifacts if a['kind'] == 'upload' and a['upload_id']}
+
+        jobs = []
+        for artifact in sorted((a for a in artifacts if a['kind'] == 'job'), key=lambda a: -a['modified']):
+            upload = uploads.get(artifact['upload_id'])
+            jobs.append({
+                **_describe(artifact),
+                'upload_bytes': upload['bytes'] if upload else 0
+            })
+
+        def folder_bytes(kinds) -> int:
+            return sum(a['bytes'] for a in artifacts if a['kind'] in kinds)
+
+        total = folder_bytes(('upload', 'leftover', 'job'))
+        return {
+            'total_bytes': total,
+            'uploads_bytes': folder_bytes(('upload', 'leftover')),
+            'outputs_bytes': folder_bytes(('job',)),
+            'limits': {
+                'max_age_hours': self.max_age / 3600 or None,
+                'max_total_bytes': self.max_total_bytes or None,
+                'grace_minutes': self.grace / 60
+            },
+            'over_limit': bool(self.max_total_bytes) and total > self.max_total_bytes,
+            'jobs': jobs,
+            'uploads': [_describe(a) for a in sorted(uploads.values(), key=lambda a: -a['modified'])],
+            'last_cleanup': self.last_run
+        }
+
+
+def _entries(folder: Path) -> List[os.DirEntry]:
+    try:
+        with os.scandir(folder) as entries:
+            return [entry for entry in entries if entry.is_file()]
+    except FileNotFoundError:
+        return []
+
+
+def _describe(artifact: Dict) -> Dict:
+    """JSON-friendly view of an artifact"""
+    return {
+        'kind': artifact['kind'],
+        'key': artifact['key'],
+        'job_id': artifact['job_id'],
+        'upload_id': artifact['upload_id'],
+        'files': sorted(path.name for path in artifact['files']),
+        'bytes': artifact['bytes'],
+        'modified': artifact['modified'],
+        'live': artifact['live']
+    }
+
+
+def _mb(size: int) -> float:
+    return round(size / 1024 / 1024, 1)
@@ -0,0 +1,89 @@
+"""
+Production Server
+Serves the API with a multi-worker WSGI server and runs classification
+in separate worker processes fed by the shared job queue
+
+Usage:
+    python serve.py --api-workers 4 --job-workers 2
+
+On Linux/macOS the API is served by gunicorn (several processes).
+On Windows gunicorn is not available, so waitress is used (one process,
+many threads) - classification still runs in separate worker processes.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+os.environ['KC_EXECUTION_MODE'] = 'queue'
+
+# The folders in config.py are relative to backend/: the API server and the
+# workers both run there, wherever serve.py was started from
+BACKEND_FOLDER = Path(__file__).resolve().parent
+os.chdir(BACKEND_FOLDER)
+
+
+def serve_gunicorn(host: str, port: int, api_workers: int, threads: int):
+    """Run the API with gunicorn (POSIX only)"""
+    from gunicorn.app.base import BaseApplication
+
+    class KeywordClassifierApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from wsgi import app
+            return app
+
+    KeywordClassifierApplication({
+        'bind': f"{host}:{port}",
+        'workers': api_workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'timeout': 120
+    }).run()
+
+
+def serve_waitress(host: str, port: int, threads: int):
+    """Run the API with waitress (works on Windows)"""
+    from waitress import serve
+    from wsgi import app
+
+    serve(app, host=host, port=port, threads=threads)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the Keyword Classifier API in production mode")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--api-workers', type=int, default=4, help="API server processes (gunicorn only)")
+    parser.add_argument('--threads', type=int, default=8, help="Threads per API server process")
+    parser.add_argument('--job-workers', type=int, default=2, help="Classification worker processes")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🚀 Keyword Classifier - Production Mode")
+    print("=" * 60)
+
+    # Workers run as a separate process tree (not forked from here), so the
+    # WSGI server's own worker processes never inherit them
+    workers = subprocess.Popen([sys.executable, str(BACKEND_FOLDER / 'worker.py'), '--processes', str(args.job_workers)],
+                               cwd=BACKEND_FOLDER)
+    print(f"👷 Started {args.job_workers} classification worker process(es)")
+
+    try:
+        if sys.platform != 'win32':
+            print(f"🌐 Serving API with gunicorn on http://{args.host}:{args.port} ({args.api_workers} workers)")
+            serve_gunicorn(args.host, args.port, args.api_workers, args.threads)
+        else:
+            print(f"🌐 Serving API with waitress on http://{args.host}:{args.port} ({args.threads} threads)")
+            serve_waitress(args.host, args.port, args.threads)
+    finally:
+        workers.terminate()
@@ -0,0 +1,443 @@
+"""
+Shard Store
+Hands out the keywords of distributed jobs to shard workers, in leased pieces
+
+A distributed job does not call Ollama itself. It cuts its keywords into
+shards (SHARD_SIZE keywords each) and puts them here. Shard workers on other
+machines lease a shard over HTTP, classify it with their own Ollama and send
+the results back. The job reads the results shard by shard, in order, so the
+output files keep the order of the input file.
+
+Leases:
+- a lease is valid for SHARD_LEASE_SECONDS; workers extend it with heartbeats
+- a shard whose lease ran out goes back to the queue (a worker crashed,
+  lost its network or its Ollama hung) and the next worker gets it
+- after SHARD_MAX_ATTEMPTS leases the shard is marked failed and the job fails
+- results of an expired lease are still accepted if nobody finished the shard
+  yet (the first complete answer wins), but only if they answer exactly the
+  shard's keywords, in order, with every field the job needs
+- the coordinator expires leases too, so a shard fails even when no worker
+  asks for work any more; if no worker touches the job's shards for
+  SHARD_IDLE_TIMEOUT seconds, the coordinator takes the next shard over and
+  classifies it itself (see processing.classify_distributed)
+
+Like job_store.py this lives in SQLite, so it works in thread mode and in
+queue mode (job in a worker process, lease requests in any API process).
+"""
+
+import json
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import SHARD_DB_PATH, SHARD_LEASE_SECONDS, SHARD_MAX_ATTEMPTS
+
+# worker_id of shards the coordinator classifies itself
+COORDINATOR = 'coordinator'
+
+# Fields every result needs (the job writes them to the output files)
+RESULT_FIELDS = ['relevance_score', 'relevance_accepted', 'category', 'category_confidence']
+
+
+class ShardFailed(Exception):
+    """A shard could not be classified after SHARD_MAX_ATTEMPTS leases"""
+
+
+class LeaseLost(Exception):
+    """The lease is unknown or the shard was already finished by another worker"""
+
+
+def _results_error(keywords: List[str], results: List[Dict]) -> Optional[str]:
+    """Why results do not belong to a shard's keywords (None if they do)"""
+    if len(results) != len(keywords):
+        return f"Expected {len(keywords)} results, got {len(results)}"
+    for index, (keyword, item) in enumerate(zip(keywords, results)):
+        result = item.get('result') if isinstance(item, dict) else None
+        if not isinstance(result, dict) or result.get('keyword') != keyword:
+            return f"Result {index} does not answer keyword {keyword!r}"
+        missing = [field for field in RESULT_FIELDS if field not in result]
+        if missing:
+            return f"Result {index} has no {', '.join(missing)}"
+        if not isinstance(result['relevance_accepted'], bool):
+            return f"Result {index}: relevance_accepted must be true or false"
+        timings = item.get('timings')
+        if not isinstance(timings, dict) or not isinstance(timings.get('keyword_total'), (int, float)):
+            return f"Result {index} has no timings.keyword_total"
+    return None
+
+
+class ShardStore:
+    """
+    Shards of distributed jobs and their leases, in SQLite.
+
+    Coordinator (the job):
+        store.add_job(job_id, settings)
+        shard_id = store.add_shard(job_id, seq, ['keyword 1', ...])
+        results = store.results(shard_id)     # None until a worker finished it
+        store.expire_leases()                 # also done on every lease request
+        lease = store.take_over(shard_id)     # no worker came: classify it locally
+        store.remove_job(job_id)
+
+    Shard worker (through the /api/shards endpoints):
+        lease = store.lease(worker_id)        # None if there is nothing to do
+        store.heartbeat(shard_id, lease_id)
+        store.complete(shard_id, lease_id, results)
+    """
+
+    def __init__(self, db_path: Path = SHARD_DB_PATH, lease_seconds: float = SHARD_LEASE_SECONDS,
+                 max_attempts: int = SHARD_MAX_ATTEMPTS):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shard_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    settings TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shards (
+                    shard_id TEXT PRIMARY KEY,
+                    job_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    keywords TEXT NOT NULL,
+                    results TEXT,
+                    lease_id TEXT,
+                    lease_ids TEXT NOT NULL DEFAULT '',
+                    worker_id TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    completed_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_shards_status ON shards (status, created_at, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_shards_job ON shards (job_id, seq)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shard_workers (
+                    worker_id TEXT PRIMARY KEY,
+                    last_seen REAL NOT NULL,
+                    shards_done INTEGER NOT NULL DEFAULT 0,
+                    keywords_done INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+        finally:
+            conn.close()
+
+    # Coordinator side
+
+    def add_job(self, job_id: str, settings: Dict):
+        """Register a distributed job (settings are sent to the workers with every lease)"""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO shard_jobs (job_id, settings, created_at) VALUES (?, ?, ?)",
+                (job_id, json.dumps(settings), time.time())
+            )
+        finally:
+            conn.close()
+
+    def add_shard(self, job_id: str, seq: int, keywords: List[str]) -> str:
+        """Queue one shard of a job; returns its shard id"""
+        shard_id = uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO shards (shard_id, job_id, seq, status, keywords, created_at) "
+                "VALUES (?, ?, ?, 'pending', ?, ?)",
+                (shard_id, job_id, seq, json.dumps(keywords), time.time())
+            )
+        finally:
+            conn.close()
+        return shard_id
+
+    def results(self, shard_id: str) -> Optional[List[Dict]]:
+        """
+        Results of a finished shard ([{'result': ..., 'timings': ...}] in keyword order)
+
+        Returns:
+            None while the shard is pending or leased
+
+        Raises:
+            ShardFailed: the shard ran out of attempts
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT status, results, attempts, error, seq FROM shards WHERE shard_id = ?", (shard_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if row is None:
+            raise ShardFailed(f"Shard {shard_id} disappeared")
+        if row['status'] == 'failed':
+            raise ShardFailed(f"Shard {row['seq']} failed after {row['attempts']} attempts: {row['error']}")
+        if row['status'] != 'done':
+            return None
+        return json.loads(row['results'])
+
+    def job_state(self, job_id: str) -> Dict:
+        """
+        Shards of a job per status, plus the workers seen recently (for job progress)
+
+        'last_activity' is the last time a shard worker leased, extended or
+        finished one of the job's shards (None if none ever did).
+        """
+        conn = self._connect()
+        try:
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM shards WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+            # A lease (or heartbeat) sets lease_expires to its time + lease_seconds
+            # (shards the coordinator took over itself do not count)
+            last_activity = conn.execute(
+                "SELECT MAX(MAX(COALESCE(completed_at, 0), COALESCE(lease_expires - ?, 0))) FROM shards "
+                "WHERE job_id = ? AND COALESCE(worker_id, '') != ?",
+                (self.lease_seconds, job_id, COORDINATOR)
+            ).fetchone()[0]
+            workers = conn.execute(
+                "SELECT COUNT(*) FROM shard_workers WHERE last_seen > ?", (time.time() - self.lease_seconds,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+        return {
+            'pending': counts.get('pending', 0),
+            'leased': counts.get('leased', 0),
+            'done': counts.get('done', 0),
+            'workers': workers,
+            'last_activity': last_activity or None
+        }
+
+    def expire_leases(self):
+        """Requeue (or fail) shards whose lease ran out, without waiting for a worker to ask for work"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._expire_leases(conn, time.time())
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def take_over(self, shard_id: str) -> Optional[str]:
+        """
+        Lease a waiting shard to the coordinator itself (no shard worker came for it)
+
+        Returns:
+            The lease id to complete the shard with, or None if the shard is
+            not waiting any more (a worker leased it in the meantime)
+        """
+        lease_id = uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE shards SET status = 'leased', lease_id = ?, lease_ids = lease_ids || ? || ',', "
+                "worker_id = ?, lease_expires = ?, attempts = attempts + 1 WHERE shard_id = ? AND status = 'pending'",
+                (lease_id, lease_id, COORDINATOR, time.time() + self.lease_seconds, shard_id)
+            )
+        finally:
+            conn.close()
+        return lease_id if cursor.rowcount else None
+
+    def remove_job(self, job_id: str):
+        """Forget a finished (or failed) job and its shards"""
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM shards WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM shard_jobs WHERE job_id = ?", (job_id,))
+        finally:
+            conn.close()
+
+    # Worker side
+
+    def _expire_leases(self, conn: sqlite3.Connection, now: float):
+        """Shards whose lease ran out go back to the queue (or fail after too many attempts)"""
+        conn.execute(
+            "UPDATE shards SET status = 'failed', lease_id = NULL, error = 'lease expired' "
+            "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, self.max_attempts)
+        )
+        conn.execute(
+            "UPDATE shards SET status = 'pending', lease_id = NULL, worker_id = NULL "
+            "WHERE status = 'leased' AND lease_expires < ?",
+            (now,)
+        )
+
+    def _seen(self, conn: sqlite3.Connection, worker_id: str, shards: int = 0, keywords: int = 0):
+        conn.execute(
+            "INSERT INTO shard_workers (worker_id, last_seen, shards_done, keywords_done) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(worker_id) DO UPDATE SET last_seen = excluded.last_seen, "
+            "shards_done = shards_done + excluded.shards_done, keywords_done = keywords_done + excluded.keywords_done",
+            (worker_id, time.time(), shards, keywords)
+        )
+
+    def lease(self, worker_id: str) -> Optional[Dict]:
+        """
+        Atomically lease the next shard (oldest job first, shards in order)
+
+        Returns:
+            {'shard_id', 'lease_id', 'lease_seconds', 'job_id', 'seq', 'keywords', 'settings'}
+            or None if no shard is waiting
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE: two workers can never lease the same shard
+            conn.execute("BEGIN IMMEDIATE")
+            self._expire_leases(conn, now)
+            self._seen(conn, worker_id)
+            row = conn.execute(
+                "SELECT shards.*, shard_jobs.settings FROM shards JOIN shard_jobs USING (job_id) "
+                "WHERE shards.status = 'pending' ORDER BY shard_jobs.created_at, shards.seq LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            lease_id = uuid.uuid4().hex
+            conn.execute(
+                "UPDATE shards SET status = 'leased', lease_id = ?, lease_ids = lease_ids || ? || ',', "
+                "worker_id = ?, lease_expires = ?, attempts = attempts + 1 WHERE shard_id = ?",
+                (lease_id, lease_id, worker_id, now + self.lease_seconds, row['shard_id'])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        return {
+            'shard_id': row['shard_id'],
+            'lease_id': lease_id,
+            'lease_seconds': self.lease_seconds,
+            'job_id': row['job_id'],
+            'seq': row['seq'],
+            'attempt': row['attempts'] + 1,
+            'keywords': json.loads(row['keywords']),
+            'settings': json.loads(row['settings'])
+        }
+
+    def heartbeat(self, shard_id: str, lease_id: str) -> float:
+        """
+        Extend a lease while the worker is still classifying
+
+        Returns:
+            The new expiry time
+
+        Raises:
+            LeaseLost: the lease expired and the shard went to another worker (or is done)
+        """
+        expires = time.time() + self.lease_seconds
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE shards SET lease_expires = ? WHERE shard_id = ? AND lease_id = ? AND status = 'leased'",
+                (expires, shard_id, lease_id)
+            )
+            if cursor.rowcount == 0:
+                raise LeaseLost("Lease expired or shard already finished")
+            row = conn.execute("SELECT worker_id FROM shards WHERE shard_id = ?", (shard_id,)).fetchone()
+            if row['worker_id'] != COORDINATOR:
+                self._seen(conn, row['worker_id'])
+        finally:
+            conn.close()
+        return expires
+
+    def complete(self, shard_id: str, lease_id: str, results: List[Dict]):
+        """
+        Store the results of a shard
+
+        Accepted from any lease this shard ever had, as long as the shard is not
+        finished yet - a slow worker whose lease ran out may still be first.
+
+        Raises:
+            LeaseLost: unknown lease, or another worker already finished the shard
+            ValueError: the results do not answer the shard's keywords (count or order)
+                or lack fields the job needs (see RESULT_FIELDS)
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT status, keywords, lease_ids, worker_id FROM shards WHERE shard_id = ?", (shard_id,)
+            ).fetchone()
+            if row is None or f"{lease_id}," not in row['lease_ids'] or row['status'] in ('done', 'failed'):
+                conn.execute("COMMIT")
+                raise LeaseLost("Unknown lease or shard already finished")
+            error = _results_error(json.loads(row['keywords']), results)
+            if error:
+                conn.execute("COMMIT")
+                raise ValueError(error)
+
+            conn.execute(
+                "UPDATE shards SET status = 'done', results = ?, lease_id = NULL, completed_at = ? WHERE shard_id = ?",
+                (json.dumps(results), time.time(), shard_id)
+            )
+            if row['worker_id'] and row['worker_id'] != COORDINATOR:
+                self._seen(conn, row['worker_id'], shards=1, keywords=len(results))
+            conn.execute("COMMIT")
+        except (LeaseLost, ValueError):
+            raise
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def release(self, shard_id: str, lease_id: str, error: Optional[str] = None):
+        """Give a leased shard back right away (worker shutting down or its Ollama failed)"""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE shards SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_id = NULL, worker_id = NULL, error = ? WHERE shard_id = ? AND lease_id = ? AND status = 'leased'",
+                (self.max_attempts, error, shard_id, lease_id)
+            )
+        finally:
+            conn.close()
+
+    # Overview
+
+    def overview(self) -> Dict:
+        """All distributed jobs and workers (for GET /api/shards)"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            jobs = {}
+            for row in conn.execute("SELECT job_id, status, COUNT(*) AS n FROM shards GROUP BY job_id, status"):
+                jobs.setdefault(row['job_id'], {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0})[row['status']] = row['n']
+            workers = [
+                {
+                    'worker_id': row['worker_id'],
+                    'last_seen_seconds': round(now - row['last_seen'], 1),
+                    'active': now - row['last_seen'] < self.lease_seconds,
+                    'shards_done': row['shards_done'],
+                    'keywords_done': row['keywords_done']
+                }
+                for row in conn.execute("SELECT * FROM shard_workers ORDER BY last_seen DESC")
+            ]
+        finally:
+            conn.close()
+        return {'jobs': jobs, 'workers': workers}
@@ -0,0 +1,233 @@
+"""
+Shard Worker
+Classifies shards of distributed jobs for a coordinator on another machine
+
+Run this next to an Ollama on any machine that can reach the backend. The
+worker leases a shard (SHARD_SIZE keywords) from the coordinator, classifies
+it with its own Ollama and sends the results back. While it works it sends
+heartbeats, so the coordinator knows the shard is not lost. If the worker
+dies, its lease expires and another worker gets the shard.
+
+Usage:
+    python shard_worker.py --coordinator http://192.168.1.10:5000
+    python shard_worker.py --coordinator http://192.168.1.10:5000 --concurrency 4 --processes 2
+
+    # Everything on one machine, with fake Ollama servers instead of GPUs:
+    KC_DISTRIBUTED=1 python app.py
+    python shard_worker.py --processes 3 --fake-ollama --fake-latency 0.1
+
+Jobs are distributed with "distributed": true on /api/process (or every job
+with KC_DISTRIBUTED=1 on the backend). Set KC_SHARD_TOKEN on both sides to
+keep strangers from leasing shards.
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from config import OLLAMA_BASE_URL, SHARD_TOKEN
+
+# Share of keywords without a usable answer above which a shard is handed
+# back instead of completed (this worker's Ollama is probably broken)
+MAX_FAILED_SHARE = 0.5
+
+
+class ShardWorker:
+    """
+    Leases shards from a coordinator and classifies them.
+
+    Args:
+        coordinator: Base URL of the backend (http://host:5000)
+        ollama_url: Ollama this worker uses
+        concurrency: Keywords classified in parallel
+        worker_id: Name shown in GET /api/shards
+        token: Shared secret (KC_SHARD_TOKEN of the backend)
+    """
+
+    def __init__(self, coordinator: str, ollama_url: str = OLLAMA_BASE_URL, concurrency: int = 4,
+                 worker_id: Optional[str] = None, token: str = SHARD_TOKEN, poll_interval: float = 1.0):
+        import requests
+
+        self.api = coordinator.rstrip('/') + '/api/shards'
+        self.ollama_url = ollama_url
+        self.concurrency = concurrency
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.session = requests.Session()
+        if token:
+            self.session.headers['X-KC-Shard-Token'] = token
+        self.shards_done = 0
+        self._classifiers = {}  # job_id -> KeywordClassifier (settings of that job)
+
+    def _post(self, path: str, payload: Dict):
+        return self.session.post(f"{self.api}{path}", json=payload, timeout=30)
+
+    def classifier_for(self, job_id: str, settings: Dict):
+        """A classifier configured like the job (kept while the job's shards keep coming)"""
+        from ollama_client import OllamaClient
+        from classifier import KeywordClassifier
+
+        if job_id not in self._classifiers:
+            classifier = KeywordClassifier(OllamaClient(self.ollama_url, settings['model']))
+            classifier.set_confidence_threshold(settings['confidence_threshold'])
+            classifier.categories = settings['categories']
+            classifier.set_relevance_prompt(settings['relevance_prompt'])
+            classifier.set_category_prompt(settings['category_prompt'])
+            # Only the current job's classifier is kept
+            self._classifiers = {job_id: classifier}
+        return self._classifiers[job_id]
+
+    def run_once(self) -> bool:
+        """
+        Lease and classify one shard
+
+        Returns:
+            False if the coordinator had nothing to do
+        """
+        response = self._post('/lease', {'worker_id': self.worker_id})
+        if response.status_code == 204:
+            return False
+        response.raise_for_status()
+        shard = response.json()
+
+        lost = threading.Event()
+        stop_heartbeat = threading.Event()
+
+        def heartbeat():
+            # Three heartbeats per lease period keep the lease alive through one lost request
+            while not stop_heartbeat.wait(shard['lease_seconds'] / 3):
+                try:
+                    if self._post(f"/{shard['shard_id']}/heartbeat", {'lease_id': shard['lease_id']}).status_code == 409:
+                        lost.set()
+                        return
+                except Exception:
+                    pass
+
+        beats = threading.Thread(target=heartbeat, daemon=True)
+        beats.start()
+        try:
+            results = self.classify(shard, lost)
+        except BaseException as e:
+            stop_heartbeat.set()
+            # Hand the shard back right away instead of waiting for the lease to expire
+            self._release(shard, f"{type(e).__name__}: {e}")
+            raise
+        stop_heartbeat.set()
+
+        if lost.is_set():
+            print(f"↩️  Shard {shard['seq']} of job {shard['job_id'][:8]} was taken over by another worker")
+            return True
+
+        failed = sum(1 for item in results if item['result'].get('failed'))
+        if failed > len(results) * MAX_FAILED_SHARE:
+            self._release(shard, f"{failed} of {len(results)} keywords got no usable answer from Ollama")
+            print(f"⚠️  Shard {shard['seq']}: Ollama at {self.ollama_url} failed, shard handed back")
+            time.sleep(self.poll_interval * 5)
+            return True
+
+        response = self._post(f"/{shard['shard_id']}/complete", {'lease_id': shard['lease_id'], 'results': results})
+        if response.status_code == 409:
+            print(f"↩️  Shard {shard['seq']} was already finished by another worker")
+        else:
+            response.raise_for_status()
+            self.shards_done += 1
+        return True
+
+    def _release(self, shard: Dict, error: str):
+        try:
+            self._post(f"/{shard['shard_id']}/release", {'lease_id': shard['lease_id'], 'error': error})
+        except Exception:
+            pass
+
+    def classify(self, shard: Dict, lost: threading.Event) -> List[Dict]:
+        """Classify the keywords of a shard (results in keyword order)"""
+        settings = shard['settings']
+        classifier = self.classifier_for(shard['job_id'], settings)
+        topics = settings['topics']
+        leased_at = time.time()
+
+        def classify_one(keyword: str) -> Dict:
+            timings = {'queue_wait': time.time() - leased_at}
+            if lost.is_set():
+                # Another worker has the shard now - do not spend Ollama time on it
+                return {'result': {'failed': True}, 'timings': dict(timings, keyword_total=0.0)}
+            started = time.time()
+            if len(topics) > 1:
+                result = classifier.classify_keyword_multi(keyword, topics, timings)
+            else:
+                result = classifier.classify_keyword(keyword, topics[0], timings)
+            timings['keyword_total'] = time.time() - started
+            return {'result': result, 'timings': timings}
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return list(executor.map(classify_one, shard['keywords']))
+
+    def run(self, max_idle: Optional[float] = None):
+        """Work until interrupted (or until idle for max_idle seconds)"""
+        print(f"👷 Shard worker {self.worker_id}: {self.api} -> Ollama {self.ollama_url}")
+        idle_since = time.time()
+        while True:
+            try:
+                if self.run_once():
+                    idle_since = time.time()
+                    continue
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                # Coordinator restarting or unreachable: keep trying
+                print(f"⚠️  {type(e).__name__}: {e}")
+            if max_idle is not None and time.time() - idle_since > max_idle:
+                print(f"💤 Shard worker {self.worker_id} idle, {self.shards_done} shards done")
+                return
+            time.sleep(self.poll_interval)
+
+
+def worker_main(args, index: int):
+    """One worker process (optionally with its own fake Ollama)"""
+    from log_setup import setup_logging
+
+    setup_logging(level=args.log_level)
+    ollama_url = args.ollama_url
+    if args.fake_ollama:
+        from fake_ollama import FakeOllama
+        ollama_url = FakeOllama(latency=args.fake_latency, parallel=args.fake_parallel,
+                                error_rate=args.fake_error_rate).start().url
+
+    name = f"{args.name or socket.gethostname()}-{os.getpid()}-{index}"
+    worker = ShardWorker(args.coordinator, ollama_url, args.concurrency, name, args.token, args.poll_interval)
+    try:
+        worker.run(args.max_idle)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Classify shards of distributed jobs for a coordinator")
+    parser.add_argument('--coordinator', default='http://localhost:5000', help="Backend URL (default %(default)s)")
+    parser.add_argument('--ollama-url', default=OLLAMA_BASE_URL, help="Ollama of this worker (default %(default)s)")
+    parser.add_argument('--concurrency', type=int, default=4, help="Keywords classified in parallel (default 4)")
+    parser.add_argument('--processes', type=int, default=1, help="Worker processes (default 1)")
+    parser.add_argument('--name', help="Worker name prefix (default: host name)")
+    parser.add_argument('--token', default=SHARD_TOKEN, help="Shared secret (default: KC_SHARD_TOKEN)")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between lease attempts when idle")
+    parser.add_argument('--max-idle', type=float, help="Exit after this many idle seconds (default: run forever)")
+    parser.add_argument('--fake-ollama', action='store_true', help="Use an in-process fake Ollama (testing)")
+    parser.add_argument('--fake-latency', type=float, default=0.05)
+    parser.add_argument('--fake-parallel', type=int, default=4)
+    parser.add_argument('--fake-error-rate', type=float, default=0.0)
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    processes = [multiprocessing.Process(target=worker_main, args=(args, i)) for i in range(args.processes)]
+    for proc in processes:
+        proc.start()
+    try:
+        for proc in processes:
+            proc.join()
+    except KeyboardInterrupt:
+        print("\n👋 Shard workers shutting down...")
@@ -0,0 +1,48 @@
+"""
+Tests that whole numbers keep their integer form in the exported CSV files
+
+Run from backend/:  python -m pytest -q
+"""
+
+from csv_processor import CSVProcessor, iter_dataframe_keywords
+from upload_store import UploadStore
+
+RESULT = {'relevance_score': 90, 'relevance_accepted': True, 'category': 'Gameplay', 'category_confidence': 80}
+
+
+def export_text(keywords, output_dir, streaming: bool = False) -> str:
+    """Accepted CSV file of the keywords (written at the end, or streamed row by row like a job)"""
+    processor = CSVProcessor()
+    if streaming:
+        accepted_file, _, _ = processor.start_export(str(output_dir), 'csv')
+    for keyword in keywords:
+        processor.add_result(keyword, RESULT)
+    if streaming:
+        processor.finish_export()
+    else:
+        accepted_file, _ = processor.export_results(str(output_dir), 'csv')
+    with open(accepted_file, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_manual_input_exports_whole_numbers(tmp_path):
+    df = CSVProcessor().parse_manual_input("ys origin speedrun, 1200, 49\nys viii boss, 30, 7")
+    text = export_text(iter_dataframe_keywords(df), tmp_path)
+    assert 'ys origin speedrun,1200,49,' in text
+    assert 'ys viii boss,30,7,' in text
+
+
+def test_fractions_are_kept(tmp_path):
+    df = CSVProcessor().parse_manual_input("ys viii boss, 30, 2.5")
+    assert 'ys viii boss,30,2.5,' in export_text(iter_dataframe_keywords(df), tmp_path)
+
+
+def test_upload_exports_whole_numbers(tmp_path):
+    csv_path = tmp_path / 'keywords.csv'
+    csv_path.write_text("title,views,views_per_year\nys origin speedrun,1200,49\nys viii boss,30,7\n", encoding='utf-8')
+    store = UploadStore(tmp_path / 'uploads')
+    upload_id = store.create_from_csv(str(csv_path), 'keywords.csv')['upload_id']
+    for streaming in (False, True):
+        text = export_text(store.iter_keywords(upload_id), tmp_path / f'outputs_{streaming}', streaming)
+        assert 'ys origin speedrun,1200,49,' in text
+        assert 'ys viii boss,30,7,' in text
@@ -0,0 +1,62 @@
+"""
+Tests for the order expression of /api/process (order_by='expression')
+
+Run from backend/:  python -m pytest -q
+"""
+
+import pandas as pd
+import pytest
+
+from csv_processor import CSVProcessor, evaluate_order_expression
+
+
+def load(processor: CSVProcessor) -> CSVProcessor:
+    processor.input_data = pd.DataFrame({
+        'title': ['a', 'b', 'c'],
+        'views': [10.0, 300.0, 20.0],
+        'views_per_year': [50.0, 1.0, 5.0]
+    })
+    return processor
+
+
+def test_arithmetic_orders_keywords():
+    processor = load(CSVProcessor())
+    processor.order_keywords('expression', 'views_per_year * 2 + views / 10')
+    assert processor.input_data['title'].tolist() == ['a', 'b', 'c']
+
+    processor.order_keywords('expression', '-views')
+    assert processor.input_data['title'].tolist() == ['a', 'c', 'b']
+
+
+@pytest.mark.parametrize('expression', [
+    'views.to_csv("/tmp/kc_order_expression_test.csv")',
+    'title.to_pickle("/tmp/kc_order_expression_test.pkl")',
+    '__import__("os").system("true")',
+    'abs(views)',
+    'views.__class__',
+    'views[0]',
+    'title',
+    'views if views else 1',
+    '"text"',
+    'views == 1'
+])
+def test_calls_attributes_and_other_nodes_are_rejected(expression, tmp_path):
+    processor = load(CSVProcessor())
+    with pytest.raises(ValueError):
+        processor.order_keywords('expression', expression)
+    # Nothing was reordered
+    assert processor.input_data['title'].tolist() == ['a', 'b', 'c']
+
+
+def test_attribute_call_does_not_run(tmp_path):
+    target = tmp_path / 'written.csv'
+    columns = {'views': pd.Series([1.0]), 'views_per_year': pd.Series([1.0])}
+    with pytest.raises(ValueError):
+        evaluate_order_expression(f'views.to_csv("{target}")', columns)
+    assert not target.exists()
+
+
+def test_huge_powers_do_not_hang():
+    columns = {'views': pd.Series([1.0]), 'views_per_year': pd.Series([1.0])}
+    with pytest.raises(ValueError):
+        evaluate_order_expression('9 ** 9 ** 9 ** 9', columns)
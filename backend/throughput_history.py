@@ -0,0 +1,210 @@
+"""
+Throughput History
+Remembers how fast finished jobs ran, per model and Ollama host, and uses
+that to estimate how long a new job will take - before it starts
+
+Every finished job adds one row: keywords, duration, mean Ollama call time,
+tokens per second, mean prompt length, parse-failure rate, time to the first
+result (model loading) and how many calls Ollama really ran in parallel.
+
+Estimate (a "roofline" model):
+    seconds per call = mean call time of recent runs, corrected for the
+                       keyword length of the new file (longer prompts)
+    parallel calls   = min(concurrency, most parallel calls Ollama handled so far)
+    duration         = warm-up + keywords * seconds per call / parallel calls
+"""
+
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from config import HISTORY_DB_PATH, HISTORY_RUNS, MAX_CONCURRENCY
+
+# Roughly 4 characters per token for English/German keywords
+CHARS_PER_TOKEN = 4
+
+# Concurrency levels listed in an estimate, so users can compare
+ESTIMATE_CONCURRENCY_LEVELS = (1, 2, 4, 8)
+
+
+class ThroughputHistory:
+    """
+    Throughput of finished jobs in SQLite (shared by the API and worker processes).
+
+    Usage:
+        history = ThroughputHistory()
+        history.record({...})                       # when a job finishes (see processing.py)
+        history.estimate('llama3.1:8b', 'localhost:11434', keywords=5000, concurrency=4)
+    """
+
+    def __init__(self, db_path: Path = HISTORY_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    model TEXT NOT NULL,
+                    host TEXT NOT NULL,
+                    finished_at REAL NOT NULL,
+                    concurrency INTEGER NOT NULL,
+                    keywords INTEGER NOT NULL,
+                    calls INTEGER NOT NULL,
+                    duration_seconds REAL NOT NULL,
+                    call_seconds REAL NOT NULL,
+                    first_result_seconds REAL,
+                    prompt_tokens REAL,
+                    eval_tokens REAL,
+                    tokens_per_second REAL,
+                    prompt_tokens_per_second REAL,
+                    title_chars REAL,
+                    parse_failure_rate REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_model_host ON runs (model, host, finished_at)")
+        finally:
+            conn.close()
+
+    def record(self, run: Dict):
+        """
+        Add one finished job
+
+        Args:
+            run: model, host, concurrency, keywords, calls (real Ollama calls,
+                no cache hits), duration_seconds, call_seconds and optionally
+                first_result_seconds, prompt_tokens, eval_tokens,
+                tokens_per_second, prompt_tokens_per_second, title_chars,
+                parse_failure_rate
+        """
+        columns = [
+            'model', 'host', 'concurrency', 'keywords', 'calls', 'duration_seconds', 'call_seconds',
+            'first_result_seconds', 'prompt_tokens', 'eval_tokens', 'tokens_per_second',
+            'prompt_tokens_per_second', 'title_chars', 'parse_failure_rate'
+        ]
+        conn = self._connect()
+        try:
+            conn.execute(
+                f"INSERT INTO runs (finished_at, {', '.join(columns)}) VALUES (?, {', '.join('?' * len(columns))})",
+                [time.time()] + [run.get(column) for column in columns]
+            )
+        finally:
+            conn.close()
+
+    def recent_runs(self, model: str, host: str, limit: int = HISTORY_RUNS) -> List[Dict]:
+        """Most recent runs of a model on a host (falls back to the model on any host)"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT * FROM runs WHERE model = ? AND host = ? ORDER BY finished_at DESC LIMIT ?",
+                (model, host, limit)
+            ).fetchall()
+            if not rows:
+                rows = conn.execute(
+                    "SELECT * FROM runs WHERE model = ? ORDER BY finished_at DESC LIMIT ?",
+                    (model, limit)
+                ).fetchall()
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+
+    def estimate(self, model: str, host: str, keywords: int, concurrency: Union[int, str] = 1,
+                 title_chars: Optional[float] = None) -> Dict:
+        """
+        Estimate how long classifying `keywords` keywords will take
+
+        Args:
+            model, host: Ollama model and host (as in OllamaClient)
+            keywords: Number of keywords of the job
+            concurrency: Parallel calls of the job, or 'auto'
+            title_chars: Mean keyword length of the file (corrects the prompt length)
+
+        Returns:
+            {'available': False, ...} without history, otherwise the duration
+            (seconds), keywords per second and the figures it is based on
+        """
+        runs = self.recent_runs(model, host)
+        if not runs:
+            return {
+                'available': False,
+                'model': model,
+                'host': host,
+                'message': f"No finished jobs with {model} yet - the estimate appears after the first job"
+            }
+
+        weights = [run['calls'] for run in runs]
+        call_seconds = _weighted_mean([run['call_seconds'] for run in runs], weights)
+
+        # Longer keywords than usual -> longer prompts -> slower prompt evaluation
+        history_chars = _weighted_mean([run['title_chars'] for run in runs], weights)
+        prompt_speed = _weighted_mean([run['prompt_tokens_per_second'] for run in runs], weights)
+        if title_chars is not None and history_chars is not None and prompt_speed:
+            extra_tokens = (title_chars - history_chars) / CHARS_PER_TOKEN
+            call_seconds = max(call_seconds + extra_tokens / prompt_speed, call_seconds * 0.5)
+
+        # How many calls Ollama really ran at the same time (1 = one after another)
+        max_parallel = max(
+            max(1.0, run['calls'] / run['duration_seconds'] * run['call_seconds']) for run in runs
+        )
+
+        # Time to the first result beyond a normal call (model loading)
+        warmups = [max(0.0, run['first_result_seconds'] - run['call_seconds'])
+                   for run in runs if run['first_result_seconds'] is not None]
+        warmup = sum(warmups) / len(warmups) if warmups else 0.0
+
+        def duration(parallel_calls: float) -> float:
+            return warmup + keywords * call_seconds / parallel_calls
+
+        if concurrency == 'auto':
+            parallel = max_parallel
+        else:
+            parallel = min(max(1, int(concurrency)), MAX_CONCURRENCY, max_parallel)
+
+        return {
+            'available': True,
+            'model': model,
+            'host': host,
+            'based_on_runs': len(runs),
+            'keywords': keywords,
+            'concurrency': concurrency,
+            'duration_seconds': round(duration(parallel), 1),
+            'keywords_per_second': round(parallel / call_seconds, 3) if call_seconds > 0 else None,
+            'seconds_per_call': round(call_seconds, 3),
+            'parallel_calls': round(parallel, 2),
+            'warmup_seconds': round(warmup, 2),
+            'by_concurrency': {
+                level: round(duration(min(level, max_parallel)), 1) for level in ESTIMATE_CONCURRENCY_LEVELS
+            },
+            'tokens_per_second': _round(_weighted_mean([run['tokens_per_second'] for run in runs], weights)),
+            'prompt_tokens_mean': _round(_weighted_mean([run['prompt_tokens'] for run in runs], weights)),
+            'parse_failure_rate': _round(_weighted_mean([run['parse_failure_rate'] for run in runs], weights), 4)
+        }
+
+
+def _weighted_mean(values: List[Optional[float]], weights: List[float]) -> Optional[float]:
+    pairs = [(value, weight) for value, weight in zip(values, weights) if value is not None and weight]
+    total = sum(weight for _, weight in pairs)
+    return sum(value * weight for value, weight in pairs) / total if total else None
+
+
+def _round(value: Optional[float], digits: int = 2) -> Optional[float]:
+    return round(value, digits) if value is not None else None
+
+
+def format_duration(seconds: float) -> str:
+    """Human-readable duration ("45 s", "12 min", "3.5 h")"""
+    if seconds < 90:
+        return f"{seconds:.0f} s"
+    if seconds < 90 * 60:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
@@ -0,0 +1,458 @@
+"""
+Upload Store
+Keeps a parsed, columnar copy of every uploaded keyword file
+
+/api/upload parses the CSV exactly once and writes the result as an Arrow
+IPC file (<upload_id>.arrow) plus a small metadata file (<upload_id>.json)
+with row count, schema and view totals. /api/process then references the
+upload by id: the Arrow file is memory-mapped, so starting a job needs no
+second parse and no client-supplied server file paths.
+
+Uploads are received as streams: the size limit (MAX_FILE_SIZE_MB) is checked
+while the bytes arrive and the header line is validated from the first bytes,
+so a wrong or oversized file is rejected before it is stored completely.
+.csv.gz files are unpacked before parsing, with their own limit
+(MAX_DECOMPRESSED_MB), so a small file that unpacks to gigabytes is rejected.
+
+Large files can be sent in pieces with the chunked, resumable protocol
+(start_session / append_chunk / complete_session): every chunk is appended
+to a .part file, and after a broken connection the client asks for the
+current offset and continues from there.
+"""
+
+import csv
+import gzip
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc
+
+from config import (
+    UPLOAD_FOLDER,
+    INGEST_CHUNK_SIZE,
+    REQUIRED_COLUMNS,
+    MAX_FILE_SIZE_MB,
+    MAX_DECOMPRESSED_MB,
+    UPLOAD_CHUNK_SIZE_MB,
+    UPLOAD_SESSION_TIMEOUT,
+    UPLOAD_HEADER_PROBE_BYTES
+)
+
+# Columnar schema of a stored upload
+UPLOAD_SCHEMA = pa.schema([
+    ('title', pa.string()),
+    ('views', pa.float64()),
+    ('views_per_year', pa.float64())
+])
+
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+MAX_UPLOAD_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+MAX_DECOMPRESSED_BYTES = MAX_DECOMPRESSED_MB * 1024 * 1024
+MAX_CHUNK_BYTES = UPLOAD_CHUNK_SIZE_MB * 1024 * 1024
+READ_BLOCK_BYTES = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """The upload is bigger than MAX_FILE_SIZE_MB, or unpacks to more than MAX_DECOMPRESSED_MB (HTTP 413)"""
+
+
+class OffsetMismatch(ValueError):
+    """A chunk does not start where the stored part ends (HTTP 409)"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Chunk must start at offset {offset}")
+        self.offset = offset
+
+
+def is_gzip_name(filename: str) -> bool:
+    return filename.lower().endswith('.gz')
+
+
+def check_header(first_bytes: bytes, compressed: bool) -> Tuple[bool, Optional[str]]:
+    """
+    Validate the header line from the first bytes of an upload
+
+    Returns:
+        (complete, error): complete is False while the first line has not
+        arrived yet; error is a message if the file can already be rejected
+    """
+    if compressed:
+        try:
+            first_bytes = zlib.decompressobj(zlib.MAX_WBITS | 16).decompress(first_bytes, UPLOAD_HEADER_PROBE_BYTES)
+        except zlib.error:
+            return True, "Not a valid gzip file"
+
+    if b'\n' not in first_bytes:
+        return False, None
+
+    line = first_bytes.split(b'\n', 1)[0].decode('utf-8', errors='replace').lstrip('\ufeff').rstrip('\r')
+    columns = next(csv.reader([line]), [])
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in columns]
+    if missing_columns:
+        return True, f"Missing required columns: {', '.join(missing_columns)}"
+    return True, None
+
+
+class _HeaderCheck:
+    """Collects the first bytes of an upload until the header line can be checked"""
+
+    def __init__(self, compressed: bool, head: bytes = b''):
+        self.compressed = compressed
+        self.head = b''
+        self.done = False
+        if head:
+            self.feed(head)
+
+    def feed(self, data: bytes):
+        if self.done:
+            return
+        self.head += data
+        complete, error = check_header(self.head[:UPLOAD_HEADER_PROBE_BYTES], self.compressed)
+        if error:
+            raise ValueError(error)
+        if complete:
+            self.done = True
+        elif len(self.head) >= UPLOAD_HEADER_PROBE_BYTES:
+            raise ValueError("No header line found in the first 64 KB")
+
+
+def _copy_stream(stream: BinaryIO, target: BinaryIO, limit: int, header: _HeaderCheck,
+                 max_bytes: Optional[int] = None) -> int:
+    """
+    Copy a request body to a file in small blocks
+
+    Raises:
+        UploadTooLarge: as soon as more than `limit` bytes arrived
+        ValueError: as soon as the header line is known to be wrong
+
+    Returns:
+        Number of bytes written
+    """
+    written = 0
+    while True:
+        block = stream.read(READ_BLOCK_BYTES if max_bytes is None else min(READ_BLOCK_BYTES, max_bytes - written))
+        if not block:
+            return written
+        written += len(block)
+        if written > limit:
+            raise UploadTooLarge(f"File too large (maximum {MAX_FILE_SIZE_MB} MB)")
+        header.feed(block)
+        target.write(block)
+        if max_bytes is not None and written >= max_bytes:
+            return written
+
+
+def _inflate(gz_path: Path, target_path: Path, limit: int = MAX_DECOMPRESSED_BYTES) -> int:
+    """
+    Unpack a .csv.gz file block by block
+
+    Raises:
+        UploadTooLarge: as soon as more than `limit` bytes were unpacked
+        ValueError: if the file is not valid gzip
+
+    Returns:
+        Number of bytes written
+    """
+    written = 0
+    try:
+        with gzip.open(gz_path, 'rb') as source, open(target_path, 'wb') as target:
+            while True:
+                block = source.read(READ_BLOCK_BYTES)
+                if not block:
+                    return written
+                written += len(block)
+                if written > limit:
+                    raise UploadTooLarge(f"File too large when unpacked (maximum {MAX_DECOMPRESSED_MB} MB)")
+                target.write(block)
+    except (OSError, EOFError, zlib.error) as e:
+        raise ValueError(f"Not a valid gzip file: {e}")
+
+
+class UploadStore:
+    def __init__(self, folder: Path = UPLOAD_FOLDER):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.sessions_folder = self.folder / 'sessions'
+        self.sessions_folder.mkdir(exist_ok=True)
+        # One lock per chunked upload: chunks of the same upload are appended
+        # one after another, different uploads do not wait for each other
+        self._session_locks = {}
+        self._session_locks_lock = threading.Lock()
+
+    def _paths(self, upload_id: str):
+        # Upload ids are generated by us; anything else could be a path trick
+        if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+            raise ValueError("Invalid upload id")
+        return self.folder / f"{upload_id}.arrow", self.folder / f"{upload_id}.json"
+
+    def create_from_csv(self, csv_path: str, original_filename: str) -> Dict:
+        """
+        Parse a CSV file once (chunk by chunk) into the columnar store
+
+        Returns:
+            Metadata of the new upload (upload_id, filename, rows, schema, totals)
+
+        Raises:
+            UploadTooLarge: if a .csv.gz file unpacks to more than MAX_DECOMPRESSED_MB
+            ValueError: if the CSV is invalid or has no keywords
+        """
+        if is_gzip_name(csv_path):
+            plain_path = Path(csv_path).with_name(f"{uuid.uuid4().hex}.unpacked.csv")
+            try:
+                _inflate(Path(csv_path), plain_path)
+                return self.create_from_csv(str(plain_path), original_filename)
+            finally:
+                plain_path.unlink(missing_ok=True)
+
+        from csv_processor import CSVProcessor
+
+        processor = CSVProcessor()
+        is_valid, message = processor.validate_header(csv_path)
+        if not is_valid:
+            raise ValueError(message)
+
+        upload_id = uuid.uuid4().hex
+        arrow_path, meta_path = self._paths(upload_id)
+        tmp_path = arrow_path.with_suffix('.arrow.tmp')
+
+        rows, views_total, views_per_year_total, title_chars = 0, 0.0, 0.0, 0
+        try:
+            with pa.OSFile(str(tmp_path), 'wb') as sink:
+                with pa.ipc.new_file(sink, UPLOAD_SCHEMA) as writer:
+                    for chunk in processor.read_chunks(csv_path):
+                        batch = pa.RecordBatch.from_pandas(chunk, schema=UPLOAD_SCHEMA, preserve_index=False)
+                        writer.write_batch(batch)
+                        rows += len(chunk)
+                        views_total += float(chunk['views'].sum())
+                        views_per_year_total += float(chunk['views_per_year'].sum())
+                        # Average keyword length (longer prompts -> slower calls, see throughput_history.py)
+                        title_chars += pc.sum(pc.utf8_length(batch.column('title'))).as_py() or 0
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        if rows == 0:
+            tmp_path.unlink(missing_ok=True)
+            raise ValueError("CSV file is empty")
+
+        os.replace(tmp_path, arrow_path)
+
+        meta = {
+            'upload_id': upload_id,
+            'filename': original_filename,
+            'rows': rows,
+            'views_total': views_total,
+            'views_per_year_total': views_per_year_total,
+            'title_chars_mean': round(title_chars / rows, 2),
+            'schema': {field.name: str(field.type) for field in UPLOAD_SCHEMA},
+            'size_bytes': arrow_path.stat().st_size,
+            'created_at': time.time()
+        }
+        meta_path.write_text(json.dumps(meta), encoding='utf-8')
+        return meta
+
+    def save_stream(self, stream: BinaryIO, filename: str, content_length: Optional[int] = None) -> Dict:
+        """
+        Receive a whole upload from a stream and store it (see create_from_csv)
+
+        The size limit and the header are checked while reading, so a bad
+        file is rejected after the first bytes, not after the whole upload.
+        """
+        if content_length is not None and content_length > MAX_UPLOAD_BYTES:
+            raise UploadTooLarge(f"File too large (maximum {MAX_FILE_SIZE_MB} MB)")
+
+        compressed = is_gzip_name(filename)
+        tmp_path = self.folder / f"{uuid.uuid4().hex}.upload{'.csv.gz' if compressed else '.csv'}"
+        header = _HeaderCheck(compressed)
+        try:
+            with open(tmp_path, 'wb') as target:
+                _copy_stream(stream, target, MAX_UPLOAD_BYTES, header)
+            return self.create_from_csv(str(tmp_path), filename)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    # Chunked, resumable uploads
+
+    def _session_paths(self, session_id: str):
+        if not UPLOAD_ID_PATTERN.match(session_id or ''):
+            raise ValueError("Invalid upload session id")
+        return self.sessions_folder / f"{session_id}.part", self.sessions_folder / f"{session_id}.json"
+
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        with self._session_locks_lock:
+            return self._session_locks.setdefault(session_id, threading.Lock())
+
+    def start_session(self, filename: str, size: Optional[int] = None) -> Dict:
+        """
+        Start a chunked upload
+
+        Args:
+            filename: Original file name (.csv or .csv.gz)
+            size: Total size in bytes, if known (checked against the limit now)
+
+        Returns:
+            Session info (session_id, offset, chunk_size, max_size)
+        """
+        if size is not None and size > MAX_UPLOAD_BYTES:
+            raise UploadTooLarge(f"File too large (maximum {MAX_FILE_SIZE_MB} MB)")
+
+        self.purge_stale_sessions()
+
+        session_id = uuid.uuid4().hex
+        part_path, meta_path = self._session_paths(session_id)
+        part_path.touch()
+        meta = {
+            'session_id': session_id,
+            'filename': filename,
+            'size': size,
+            'compressed': is_gzip_name(filename),
+            'created_at': time.time()
+        }
+        meta_path.write_text(json.dumps(meta), encoding='utf-8')
+        return self.session_info(session_id)
+
+    def session_info(self, session_id: str) -> Optional[Dict]:
+        """Session info incl. the current offset (where the next chunk starts)"""
+        try:
+            part_path, meta_path = self._session_paths(session_id)
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            offset = part_path.stat().st_size
+        except (ValueError, FileNotFoundError):
+            return None
+        return {**meta, 'offset': offset, 'chunk_size': MAX_CHUNK_BYTES, 'max_size': MAX_UPLOAD_BYTES}
+
+    def append_chunk(self, session_id: str, offset: int, stream: BinaryIO, length: Optional[int] = None) -> int:
+        """
+        Append one chunk to a chunked upload
+
+        Args:
+            offset: Where the chunk starts (must equal the current offset)
+            stream: Chunk body
+            length: Chunk size from Content-Length, if known
+
+        Raises:
+            OffsetMismatch: chunk does not continue the stored part (resume from .offset)
+            UploadTooLarge: chunk or total upload too large
+            ValueError: unknown session or wrong header (the session is deleted)
+
+        Returns:
+            The new offset
+        """
+        if length is not None and length > MAX_CHUNK_BYTES:
+            raise UploadTooLarge(f"Chunk too large (maximum {UPLOAD_CHUNK_SIZE_MB} MB)")
+
+        with self._session_lock(session_id):
+            info = self.session_info(session_id)
+            if info is None:
+                raise ValueError("Upload session not found")
+            if offset != info['offset']:
+                raise OffsetMismatch(info['offset'])
+
+            part_path, _ = self._session_paths(session_id)
+            head = b''
+            if offset > 0:
+                with open(part_path, 'rb') as f:
+                    head = f.read(UPLOAD_HEADER_PROBE_BYTES)
+            try:
+                header = _HeaderCheck(info['compressed'], head)
+                with open(part_path, 'ab') as target:
+                    try:
+                        _copy_stream(stream, target, min(MAX_CHUNK_BYTES, MAX_UPLOAD_BYTES - offset), header,
+                                     max_bytes=length)
+                    except UploadTooLarge:
+                        # Keep the session usable: drop the partial chunk
+                        target.truncate(offset)
+                        raise
+            except UploadTooLarge:
+                raise
+            except ValueError:
+                self.abort_session(session_id)
+                raise
+
+            return part_path.stat().st_size
+
+    def complete_session(self, session_id: str) -> Dict:
+        """Finish a chunked upload and store it like a normal upload"""
+        with self._session_lock(session_id):
+            info = self.session_info(session_id)
+            if info is None:
+                raise ValueError("Upload session not found")
+            if info['size'] is not None and info['offset'] != info['size']:
+                raise ValueError(f"Upload incomplete: {info['offset']} of {info['size']} bytes received")
+
+            part_path, _ = self._session_paths(session_id)
+            csv_path = part_path.with_suffix('.csv.gz' if info['compressed'] else '.csv')
+            os.replace(part_path, csv_path)
+            try:
+                return self.create_from_csv(str(csv_path), info['filename'])
+            finally:
+                csv_path.unlink(missing_ok=True)
+                self.abort_session(session_id)
+
+    def abort_session(self, session_id: str):
+        """Delete a chunked upload and its data"""
+        for path in self._session_paths(session_id):
+            path.unlink(missing_ok=True)
+        with self._session_locks_lock:
+            self._session_locks.pop(session_id, None)
+
+    def purge_stale_sessions(self, max_age: float = UPLOAD_SESSION_TIMEOUT) -> int:
+        """Delete chunked uploads that were started more than max_age seconds ago"""
+        removed = 0
+        cutoff = time.time() - max_age
+        for meta_path in self.sessions_folder.glob('*.json'):
+            try:
+                if json.loads(meta_path.read_text(encoding='utf-8'))['created_at'] < cutoff:
+                    self.abort_session(meta_path.stem)
+                    removed += 1
+            except (ValueError, KeyError, FileNotFoundError):
+                continue
+        return removed
+
+    def get(self, upload_id: str) -> Optional[Dict]:
+        """Metadata of an upload, or None if it does not exist"""
+        try:
+            arrow_path, meta_path = self._paths(upload_id)
+        except ValueError:
+            return None
+        if not meta_path.exists() or not arrow_path.exists():
+            return None
+        return json.loads(meta_path.read_text(encoding='utf-8'))
+
+    def open_table(self, upload_id: str) -> pa.Table:
+        """Memory-map the stored upload (no copy, no parsing)"""
+        arrow_path, _ = self._paths(upload_id)
+        return pa.ipc.open_file(pa.memory_map(str(arrow_path), 'r')).read_all()
+
+    def load_dataframe(self, upload_id: str):
+        """The whole upload as a pandas DataFrame (needed for value ordering; same dtypes as CSVProcessor.read_chunks)"""
+        return self.open_table(upload_id).to_pandas()
+
+    def iter_keywords(self, upload_id: str, batch_size: int = INGEST_CHUNK_SIZE) -> Iterator[Dict]:
+        """Stream the keywords of an upload, one dictionary at a time (whole numbers as ints)"""
+        from csv_processor import whole_number
+
+        table = self.open_table(upload_id)
+        for batch in table.to_batches(max_chunksize=batch_size):
+            columns = batch.to_pydict()
+            for title, views, views_per_year in zip(columns['title'], columns['views'], columns['views_per_year']):
+                yield {
+                    'title': title or '',
+                    'views': whole_number(views),
+                    'views_per_year': whole_number(views_per_year)
+                }
+
+    def delete(self, upload_id: str):
+        """Remove an upload from the store"""
+        for path in self._paths(upload_id):
+            path.unlink(missing_ok=True)
@@ -0,0 +1,147 @@
+"""
+Classification Worker
+Runs queued jobs in separate processes (queue mode)
+
+Each worker process has its own Python interpreter (and its own GIL), so
+classification and pandas exports never slow down the API server.
+
+Usage:
+    python worker.py                 # one worker process
+    python worker.py --processes 4   # four worker processes
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import time
+
+from config import (
+    OLLAMA_BASE_URL,
+    OLLAMA_MODEL,
+    OUTPUT_FOLDER,
+    JOB_DB_PATH,
+    WORKER_POLL_INTERVAL,
+    WORKER_STALE_TIMEOUT,
+    HEALTH_RETRY_INTERVAL,
+    PROGRESS_PUBLISH_INTERVAL
+)
+from job_store import JobStore, JobLost
+
+
+def run_claimed_job(store: JobStore, worker_id: str, row: dict, ollama_client, health=None):
+    """
+    Run one job claimed from the store and publish its progress
+
+    Raises:
+        JobLost: the job was requeued or deleted while this worker ran it
+    """
+    from processing import ProcessingJob, process_keywords, load_keywords
+    from result_store import ResultRowsFile, rows_file_path
+
+    try:
+        keywords, input_totals = load_keywords(row['source'], row['settings'])
+    except Exception as e:
+        store.publish(row['job_id'], worker_id, 'failed', dict(row['progress'] or {}, status='failed'), error=str(e))
+        return
+
+    job = ProcessingJob(row['job_id'], row['topic'], keywords, row['settings'], input_totals)
+    job.upload_id = (row['source'] or {}).get('upload_id')
+    last_publish = [0.0]
+    # Result rows for /api/results/<job_id>/rows (the API processes cannot see this process's memory)
+    rows_file = ResultRowsFile(rows_file_path(job.job_id, OUTPUT_FOLDER))
+
+    def publish(job):
+        # Progress is written at most every PROGRESS_PUBLISH_INTERVAL seconds
+        # (plus once at the end) so the hot loop does not wait on SQLite
+        now = time.time()
+        finished = job.status in ('completed', 'failed')
+        if not finished and now - last_publish[0] < PROGRESS_PUBLISH_INTERVAL:
+            return
+        last_publish[0] = now
+
+        results = job.get_results() if job.status == 'completed' else None
+        # Raises JobLost inside the job, which fails it; the final publish raises it again
+        store.publish(job.job_id, worker_id, job.status, job.get_progress(), results=results, error=job.error)
+        # Only after publish: a worker that lost the job must not touch the new worker's file
+        if job.result_store is not None:
+            rows_file.append(job.result_store)
+
+    try:
+        process_keywords(job, ollama_client, OUTPUT_FOLDER, on_update=publish, health=health)
+    finally:
+        rows_file.close()
+
+
+def worker_loop(worker_id: str, db_path=JOB_DB_PATH):
+    """Claim and run jobs until the process is stopped"""
+    from ollama_client import OllamaClient
+    from health_monitor import OllamaHealthMonitor
+    from metrics import start_snapshot_writer
+    from log_setup import setup_logging
+
+    setup_logging()
+
+    store = JobStore(db_path)
+    # Metrics of this process are merged into /api/metrics by the API server
+    start_snapshot_writer(f"worker-{worker_id}")
+    ollama_client = OllamaClient(OLLAMA_BASE_URL, OLLAMA_MODEL)
+    health = OllamaHealthMonitor(ollama_client).start()
+    clients = {OLLAMA_MODEL: ollama_client}
+
+    print(f"👷 Worker {worker_id} waiting for jobs...")
+
+    while True:
+        store.requeue_stale(WORKER_STALE_TIMEOUT)
+
+        # Ollama down: leave the jobs queued instead of failing them one by one
+        if not health.available:
+            health.wait_until_available(HEALTH_RETRY_INTERVAL)
+            continue
+
+        row = store.claim(worker_id)
+
+        if row is None:
+            time.sleep(WORKER_POLL_INTERVAL)
+            continue
+
+        # Jobs can use a model tuned for their topic (see model_tuner.py)
+        model = (row['settings'] or {}).get('model') or OLLAMA_MODEL
+        if model not in clients:
+            clients[model] = OllamaClient(OLLAMA_BASE_URL, model)
+
+        print(f"▶️  Worker {worker_id} started job {row['job_id']} ({row['total']} keywords, {model})")
+        try:
+            run_claimed_job(store, worker_id, row, clients[model], health)
+        except JobLost:
+            print(f"↩️  Worker {worker_id} stopped job {row['job_id']}: it was requeued or deleted")
+            continue
+        print(f"✅ Worker {worker_id} finished job {row['job_id']}")
+
+
+def start_workers(processes: int) -> list:
+    """
+    Start worker processes in the background
+
+    Returns:
+        List of started multiprocessing.Process objects
+    """
+    workers = []
+    for i in range(processes):
+        worker_id = f"{socket.gethostname()}-{os.getpid()}-{i}"
+        proc = multiprocessing.Process(target=worker_loop, args=(worker_id,), daemon=True)
+        proc.start()
+        workers.append(proc)
+    return workers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run classification worker processes")
+    parser.add_argument('--processes', type=int, default=1, help="Number of worker processes")
+    args = parser.parse_args()
+
+    try:
+        for proc in start_workers(args.processes):
+            proc.join()
+    except KeyboardInterrupt:
+        print("\n👋 Workers shutting down...")
@@ -0,0 +1,15 @@
+"""
+WSGI Entry Point
+Used by production WSGI servers (gunicorn / waitress) in queue mode
+
+Example:
+    gunicorn --workers 4 --bind 0.0.0.0:5000 wsgi:app
+"""
+
+import os
+
+# Several API worker processes only agree on job state through the shared
+# job store, so the WSGI entry point always runs in queue mode
+os.environ.setdefault('KC_EXECUTION_MODE', 'queue')
+
+from app import app  # noqa: E402
@@ -28,6 +28,7 @@ args = [
     '--hidden-import=flask',
     '--hidden-import=flask_cors',
     '--hidden-import=pandas',
+    '--hidden-import=pyarrow',
     '--hidden-import=requests',
     '--hidden-import=dotenv',
     '--clean',
@@ -19,7 +19,15 @@ async function checkSystemStatus() {
         // Update Ollama status
         if (data.ollama_available) {
             const models = data.models.join(', ') || 'No models';
-            elements.ollamaStatusText.textContent = `✅ Online (${models})`;
+            // Loaded models and where they run (GPU, split GPU/CPU, CPU only)
+            const loaded = (data.loaded_models || []).map(model => {
+                const share = model.vram_share !== null && model.vram_share !== undefined
+                    ? ` (${Math.round(model.vram_share * 100)}% GPU)` : '';
+                return `${model.name}${share}`;
+            }).join(', ');
+            elements.ollamaStatusText.textContent = loaded
+                ? `✅ Online (${models}) - loaded: ${loaded}`
+                : `✅ Online (${models})`;
             elements.ollamaStatusCard.classList.add('online');
             elements.ollamaStatusCard.classList.remove('offline');
             elements.showOllamaGuideBtn.style.display = 'none';
@@ -146,7 +154,9 @@ async function pollProgressEnhanced() {
         elements.progressFill.style.width = `${percentage}%`;
 
         // Update time estimation
-        if (data.time_remaining) {
+        if (data.waiting_for_ollama) {
+            elements.timeEstimate.textContent = '⏸️ Waiting for Ollama...';
+        } else if (data.time_remaining) {
             elements.timeEstimate.textContent = formatTime(data.time_remaining);
         } else {
             elements.timeEstimate.textContent = 'Estimating time...';
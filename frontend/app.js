@@ -13,8 +13,10 @@
  * while the backend (Python) is the "brain" that does the AI work.
  */
 
-// Where our backend server is running (change if your backend is on a different port)
-const API_BASE_URL = 'http://localhost:5000/api';
+// Where our backend server is running. The launcher (and "python app.py") serve this
+// page from the backend itself, so the API is on the same origin; a page opened from a
+// separate static server (python -m http.server 8000) talks to the backend on port 5000
+const API_BASE_URL = window.location.port === '5000' ? `${window.location.origin}/api` : 'http://localhost:5000/api';
 
 // ============================================================================
 // STATE VARIABLES - These store the current state of the application
@@ -23,8 +25,8 @@ const API_BASE_URL = 'http://localhost:5000/api';
 // The ID of the current processing job (assigned by backend when you click "Start")
 let currentJobId = null;
 
-// Path to the uploaded CSV file (stored after successful upload)
-let uploadedFilePath = null;
+// Id of the uploaded CSV file (returned by /api/upload)
+let uploadedUploadId = null;
 
 // List of categories users can classify keywords into
 // Users can add/remove from this list in the UI
@@ -253,44 +255,37 @@ function handleFileSelect(e) {
     }
 }
 
+// Files above this size are sent in chunks that can be resumed after a network error
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024; // 8MB
+
 async function handleFile(file) {
-    // Validate file type
-    if (!file.name.endsWith('.csv')) {
-        alert('⚠️ Invalid file type\n\nPlease upload a CSV file (.csv extension)');
+    // Validate file type (.csv or gzip-compressed .csv.gz)
+    if (!file.name.endsWith('.csv') && !file.name.endsWith('.csv.gz')) {
+        alert('⚠️ Invalid file type\n\nPlease upload a CSV file (.csv or .csv.gz extension)');
         return;
     }
 
-    // Validate file size (50MB limit)
+    // Validate file size (50MB limit, same as MAX_FILE_SIZE_MB in the backend)
     const maxSize = 50 * 1024 * 1024; // 50MB in bytes
     if (file.size > maxSize) {
         alert(`⚠️ File too large\n\nMaximum file size: 50MB\nYour file: ${(file.size / 1024 / 1024).toFixed(2)}MB`);
         return;
     }
 
-    const formData = new FormData();
-    formData.append('file', file);
-
     try {
-        const response = await fetch(`${API_BASE_URL}/upload`, {
-            method: 'POST',
-            body: formData
-        });
-
-        if (!response.ok) {
-            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
-        }
-
-        const data = await response.json();
-
-        if (data.success) {
-            uploadedFilePath = data.filepath;
-            elements.fileName.textContent = file.name;
-            elements.fileCount.textContent = `${data.keyword_count} keywords`;
-            elements.uploadZone.style.display = 'none';
-            elements.fileInfo.style.display = 'flex';
-        } else {
-            throw new Error(data.error || 'Upload failed');
+        const data = file.size > CHUNKED_UPLOAD_THRESHOLD
+            ? await uploadInChunks(file)
+            : await uploadAtOnce(file);
+
+        uploadedUploadId = data.upload_id;
+        elements.fileName.textContent = file.name;
+        elements.fileCount.textContent = `${data.keyword_count} keywords`;
+        // Expected duration from earlier jobs (helps decide whether to cut the file down first)
+        if (data.estimate && data.estimate.available) {
+            elements.fileCount.textContent += ` · ~${formatDuration(data.estimate.duration_seconds)}`;
         }
+        elements.uploadZone.style.display = 'none';
+        elements.fileInfo.style.display = 'flex';
     } catch (error) {
         console.error('Upload error:', error);
 
@@ -313,8 +308,87 @@ async function handleFile(file) {
     }
 }
 
+/**
+ * Human-readable duration ("45 s", "12 min", "3.5 h")
+ */
+function formatDuration(seconds) {
+    if (seconds < 90) return `${Math.round(seconds)} s`;
+    if (seconds < 90 * 60) return `${Math.round(seconds / 60)} min`;
+    return `${(seconds / 3600).toFixed(1)} h`;
+}
+
+/**
+ * Read a JSON response and turn backend errors into exceptions
+ */
+async function readUploadResponse(response) {
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok) {
+        const error = new Error(data.error || `HTTP ${response.status}: ${response.statusText}`);
+        error.offset = data.offset; // Set on 409: where the next chunk has to start
+        throw error;
+    }
+    return data;
+}
+
+/**
+ * Small files: one request with the whole file
+ */
+async function uploadAtOnce(file) {
+    const formData = new FormData();
+    formData.append('file', file);
+
+    const response = await fetch(`${API_BASE_URL}/upload`, {
+        method: 'POST',
+        body: formData
+    });
+    return readUploadResponse(response);
+}
+
+/**
+ * Large files: chunked upload, every chunk is retried (and resumed) on errors
+ */
+async function uploadInChunks(file) {
+    const session = await readUploadResponse(await fetch(`${API_BASE_URL}/uploads`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size })
+    }));
+
+    const sessionUrl = `${API_BASE_URL}/uploads/${session.session_id}`;
+    let offset = session.offset;
+    let attempts = 0;
+
+    while (offset < file.size) {
+        const chunk = file.slice(offset, offset + session.chunk_size);
+        elements.fileCount.textContent = `Uploading... ${Math.round(offset / file.size * 100)}%`;
+
+        try {
+            const response = await fetch(`${sessionUrl}?offset=${offset}`, { method: 'PUT', body: chunk });
+            offset = (await readUploadResponse(response)).offset;
+            attempts = 0;
+        } catch (error) {
+            // 409: the server has a different offset - continue from there
+            if (error.offset !== undefined) {
+                offset = error.offset;
+                continue;
+            }
+            // Network error: ask the server how far we got and try again
+            if (++attempts > 5 || !error.message.includes('Failed to fetch')) {
+                throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * attempts));
+            const status = await fetch(sessionUrl).then(readUploadResponse).catch(() => null);
+            if (status) {
+                offset = status.offset;
+            }
+        }
+    }
+
+    return readUploadResponse(await fetch(`${sessionUrl}/complete`, { method: 'POST' }));
+}
+
 function removeFile() {
-    uploadedFilePath = null;
+    uploadedUploadId = null;
     elements.uploadZone.style.display = 'block';
     elements.fileInfo.style.display = 'none';
     elements.fileInput.value = '';
@@ -382,7 +456,7 @@ async function startProcessing() {
     }
 
     // Check input source
-    const hasFile = uploadedFilePath !== null;
+    const hasFile = uploadedUploadId !== null;
     const hasManualInput = elements.manualInput.value.trim() !== '';
 
     if (!hasFile && !hasManualInput) {
@@ -422,7 +496,7 @@ async function startProcessing() {
         };
 
         if (hasFile) {
-            requestData.filepath = uploadedFilePath;
+            requestData.upload_id = uploadedUploadId;
         } else {
             requestData.manual_input = elements.manualInput.value;
         }
@@ -529,7 +603,7 @@ async function startProcessing() {
         };
 
         if (hasFile) {
-            requestData.filepath = uploadedFilePath;
+            requestData.upload_id = uploadedUploadId;
         } else {
             requestData.manual_input = elements.manualInput.value;
         }
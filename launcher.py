@@ -1,15 +1,29 @@
 """
 Launcher - Fixed Version for PyInstaller Executable
-Properly handles bundled resources and starts servers
+Properly handles bundled resources and starts the server
+
+One process, one port: the Flask backend serves both the API (/api/...)
+and the web interface (/), so there is no separate frontend server.
+The browser is opened as soon as the server answers its readiness probe.
 """
 
+import time
+
+# Taken first, so "time to first page" includes the imports below
+LAUNCH_TIME = time.perf_counter()
+
 import os
 import sys
-import time
 import webbrowser
 import threading
+import urllib.request
 from pathlib import Path
 
+PORT = 5000
+URL = f'http://localhost:{PORT}'
+READY_TIMEOUT = 30  # Seconds to wait for the server before giving up
+
+
 def get_base_path():
     """Get the correct base path for bundled or unbundled execution"""
     if getattr(sys, 'frozen', False):
@@ -19,93 +33,97 @@ def get_base_path():
         # Running as script - use current directory
         return Path(__file__).parent
 
-def start_backend():
-    """Start the Flask backend server"""
-    try:
-        base_path = get_base_path()
-        backend_path = base_path / 'backend'
-        
-        print(f"🔍 Base path: {base_path}")
-        print(f"🔍 Backend path: {backend_path}")
-        print(f"🔍 Backend exists: {backend_path.exists()}")
-        
-        # Add backend to Python path
-        sys.path.insert(0, str(backend_path))
-        
-        # Change to backend directory
-        os.chdir(str(backend_path))
-        
-        print("🚀 Starting Flask backend...")
-        
-        # Import Flask app
-        import app
-        app.app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False, threaded=True)
-        
-    except Exception as e:
-        print(f"❌ Backend error: {e}")
-        import traceback
-        traceback.print_exc()
 
-def start_frontend():
-    """Start frontend HTTP server"""
-    try:
-        base_path = get_base_path()
-        frontend_path = base_path / 'frontend'
-        
-        print(f"🔍 Frontend path: {frontend_path}")
-        print(f"🔍 Frontend exists: {frontend_path.exists()}")
-        
-        if not frontend_path.exists():
-            print(f"❌ Frontend directory not found!")
-            return
-            
-        # Change to frontend directory
-        os.chdir(str(frontend_path))
-        
-        print("🌐 Starting frontend server on http://localhost:8000...")
-        
-        import http.server
-        import socketserver
-        
-        class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-            def end_headers(self):
-                # Add CORS headers
-                self.send_header('Access-Control-Allow-Origin', '*')
-                super().end_headers()
-        
-        with socketserver.TCPServer(("", 8000), MyHTTPRequestHandler) as httpd:
-            print("✅ Frontend server running!")
-            httpd.serve_forever()
-            
-    except Exception as e:
-        print(f"❌ Frontend error: {e}")
-        import traceback
-        traceback.print_exc()
+def elapsed() -> str:
+    return f"{time.perf_counter() - LAUNCH_TIME:.2f}s"
+
+
+def report_first_page(flask_app):
+    """Print the time until the browser got the web interface (once)"""
+    from flask import request
+
+    reported = threading.Event()
+
+    @flask_app.after_request
+    def first_page(response):
+        if request.path == '/' and not reported.is_set():
+            reported.set()
+            print(f"⏱️  Time to first page: {elapsed()}")
+        return response
+
+
+def wait_until_ready(timeout: float = READY_TIMEOUT) -> bool:
+    """Poll the readiness probe until the server answers (instead of a fixed sleep)"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(f'{URL}/api/ready', timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.05)
+    return False
+
 
 def open_browser():
-    """Open browser after servers have started"""
-    print("⏳ Waiting for servers to start...")
-    time.sleep(4)  # Wait for both servers
-    print("🌐 Opening browser...")
-    webbrowser.open('http://localhost:8000')
+    """Open the browser as soon as the server is ready"""
+    print("⏳ Waiting for the server...")
+    if not wait_until_ready():
+        print(f"❌ Server did not start within {READY_TIMEOUT} seconds")
+        return
+
+    print(f"✅ Server ready after {elapsed()}")
+    print(f"🌐 Opening browser at {URL}...")
+    webbrowser.open(URL)
+
+    # Load the job machinery (pandas, pyarrow) while the user looks at the page
+    import app
+    app.warm_up()
+
+
+def start_server():
+    """Start the Flask backend, which also serves the frontend (this blocks)"""
+    base_path = get_base_path()
+    backend_path = base_path / 'backend'
+    frontend_path = base_path / 'frontend'
+
+    print(f"🔍 Base path: {base_path}")
+    print(f"🔍 Backend exists: {backend_path.exists()}")
+    print(f"🔍 Frontend exists: {frontend_path.exists()}")
+
+    if not frontend_path.exists():
+        print("❌ Frontend directory not found!")
+        return
+
+    # Add backend to Python path
+    sys.path.insert(0, str(backend_path))
+
+    # Change to backend directory (data folders are relative to it)
+    os.chdir(str(backend_path))
+    os.environ.setdefault('KC_FRONTEND_FOLDER', str(frontend_path))
+
+    print(f"🚀 Starting server on {URL}...")
+
+    # Import Flask app (heavy modules are imported later, on first use)
+    import app
+    report_first_page(app.app)
+    app.app.run(host='0.0.0.0', port=PORT, debug=False, use_reloader=False, threaded=True)
+
 
 if __name__ == '__main__':
     print("=" * 60)
     print("🎯 AI Keyword Classifier - Standalone Version")
     print("=" * 60)
-    
+
     try:
-        # Start backend in daemon thread
-        backend_thread = threading.Thread(target=start_backend, daemon=True)
-        backend_thread.start()
-        
         # Start browser opener in daemon thread
         browser_thread = threading.Thread(target=open_browser, daemon=True)
         browser_thread.start()
-        
-        # Start frontend in main thread (this blocks)
-        start_frontend()
-        
+
+        # Start the server in the main thread (this blocks)
+        start_server()
+
     except KeyboardInterrupt:
         print("\n👋 Shutting down...")
         sys.exit(0)